@@ -1,9 +1,6 @@
 import os
-import zipfile
-from datetime import datetime
 import pandas as pd
-import concurrent.futures
-from RXLDBC import connect
+from RXLDBC import connect, ingest, relax
 
 DATA_FOLDER = "C:/Users/niek2/Documents/Data/Data_Empatica_E4"
 GROUP_MAPPING = {
@@ -19,78 +16,13 @@ ORIGIN_MAPPING = {
     'H': 'Huisartsenpraktijk'
 }
 
-MEASUREMENT_TYPES = ["ACC", "BVP", "EDA", "HR", "IBI", "TEMP"]
-
-
-def process_patient(patient_dir):
-    patient_path = os.path.join(DATA_FOLDER, patient_dir)
-    if not os.path.isdir(patient_path):
-        return
-
-    # Create a new database connection for this thread
-    conn = connect.Connection()
-
-    for week_folder in os.listdir(patient_path):
-        week_path = os.path.join(patient_path, week_folder)
-        if not os.path.isdir(week_path):
-            continue
-
-        # Determine the week enumeration based on the folder name
-        week_enum = 'Week_1' if '1' in week_folder else 'Week_2'
-
-        for filename in os.listdir(week_path):
-            if not filename.endswith(".zip"):
-                continue
-            zip_path = os.path.join(week_path, filename)
-            print(f"Processing {patient_dir} - {week_enum}/{filename}...")
-            with zipfile.ZipFile(zip_path, 'r') as zip_ref:
-                for contained_file in zip_ref.namelist():
-                    if not contained_file.endswith(".csv"):
-                        continue
-                    measurement_type = contained_file.split(".")[0]
-                    if measurement_type not in MEASUREMENT_TYPES:
-                        print(f"Skipping unsupported measurement type: {measurement_type}")
-                        continue
-                    with zip_ref.open(contained_file) as f:
-                        try:
-                            df = pd.read_csv(f, header=None)
-                        except Exception as e:
-                            print(f"Error reading CSV from {contained_file} in {zip_path}: {e}")
-                            continue
-
-                        start_timestamp = datetime.fromtimestamp(df.iloc[0, 0])
-                        sample_rate = df.iloc[1, 0]
-
-                        if measurement_type == "ACC":
-                            for index, axis in enumerate(["ACC_X", "ACC_Y", "ACC_Z"]):
-                                measurement_id = f"{patient_dir}_{week_enum}_{axis}"
-                                data = df.iloc[2:, index].values.tolist()
-                                if conn.check_if_measurement_exists(measurement_id, patient_dir, week_enum, axis):
-                                    print(f"Measurement {measurement_id} already exists.")
-                                    conn.insert_measure_session(measurement_id, start_timestamp, data)
-                                else:
-                                    conn.insert_measurement(measurement_id, patient_dir, week_enum, axis, sample_rate)
-                                    conn.insert_measure_session(measurement_id, start_timestamp, data)
-                        else:
-                            measurement_id = f"{patient_dir}_{week_enum}_{measurement_type}"
-                            data = df.iloc[2:, :].values.tolist()
-                            if conn.check_if_measurement_exists(measurement_id, patient_dir, week_enum,
-                                                                measurement_type):
-                                print(f"Measurement {measurement_id} already exists.")
-                                conn.insert_measure_session(measurement_id, start_timestamp, data)
-                            else:
-                                conn.insert_measurement(measurement_id, patient_dir, week_enum, measurement_type,
-                                                        sample_rate)
-                                conn.insert_measure_session(measurement_id, start_timestamp, data)
-
-    conn.close()
-
 
 def main():
     # Create a connection to the database
     conn = connect.Connection()
 
-    # Put all the patients in the database
+    # Put all the patients in the database, patients that are already loaded are skipped and relax sessions that
+    # are already loaded keep their answers, so the loader can be run again to retry failed archives
     print("Loading patients...")
     participants_df = pd.read_csv(f"{DATA_FOLDER}/Participants_study_18122024.csv", delimiter=';')
     # We assume the CSV has columns like: ID, Age, Sex, Group, UserKey, etc.
@@ -108,37 +40,27 @@ def main():
     print("Loading relaxation sessions...")
     relax_df = pd.read_csv(f"{DATA_FOLDER}/researchdata_VRelax_15112024.csv", delimiter=';')
 
-    # Define potential datetime formats encountered in the CSV.
-    datetime_formats = ["%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M:%S"]
-
-    def parse_datetime(dt_str):
-        for fmt in datetime_formats:
-            try:
-                return datetime.strptime(dt_str, fmt)
-            except Exception:
-                continue
-        return None
-
-    for _, row in relax_df.iterrows():
-        user_key = row["UserKey"]
-        patient_id = participants_lookup.get(user_key)
-        if not patient_id:
-            print(f"Warning: No patient found for UserKey {user_key}. Skipping row.")
-            continue
-
-        start_dt = parse_datetime(row["StartSessionDT"])
-        end_dt = parse_datetime(row["EndSessionDT"])
-        if not start_dt or not end_dt:
-            print(f"Warning: Failed to parse datetime for row with UserKey {user_key}.")
-            continue
-
-        conn.insert_relax_session(patient_id, start_dt, end_dt)
+    rejected = relax.load_relax_sessions(
+        conn, relax_df, participants_lookup,
+        columns={"user_key": "UserKey", "start_timestamp": "StartSessionDT", "end_timestamp": "EndSessionDT"},
+        # Potential datetime formats encountered in the CSV
+        formats=["%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M:%S"],
+    )
+    if not rejected.empty:
+        print(f"\033[93mWarning: Skipped {len(rejected)} relaxation sessions:\033[0m")
+        print(rejected.groupby("reason")["UserKey"].agg(["count", "unique"]).to_string())
     print("Relaxation sessions loaded.\n")
 
     print("Loading measure sessions...")
+    # Archives that were loaded before and did not change since are skipped, failed ones are retried
     patient_dirs = [d for d in os.listdir(DATA_FOLDER) if os.path.isdir(os.path.join(DATA_FOLDER, d))]
-    with concurrent.futures.ThreadPoolExecutor() as executor:
-        executor.map(process_patient, patient_dirs)
+    archives = ingest.pending_archives(conn, DATA_FOLDER, patient_dirs)
+    print(f"{len(archives)} archives to load.")
+    failed = ingest.ingest_archives(archives)
+    if failed:
+        print(f"\033[91m{len(failed)} archives failed to load, run the loader again to retry them.\033[0m")
+    else:
+        print("Measure sessions loaded.\n")
 
 
 if __name__ == "__main__":
@@ -12,18 +12,16 @@ def main():
     # Load the participants data
     participants_df = pd.read_csv("C:/Users/niek2/Documents/Data/Data_Empatica_E4/Participants_study_18122024.csv", delimiter=';')
 
-    for _, row in participants_df.iterrows():
-        age = row["Age"]
-        sex = SEX_MAPPING.get(row["Sex"])
-        patient_id = row["ID"]
-
-        print(f"{sex}")
-        # convert to literal
-
-        if sex is None:
-            continue
-
-        conn.add_age_sex_to_patient(patient_id, age, sex)
+    patients = pd.DataFrame({
+        "id": participants_df["ID"],
+        "age": participants_df["Age"],
+        "sex": participants_df["Sex"].map(SEX_MAPPING),
+    })
+    # Patients with an unknown sex are left as they are
+    patients = patients[patients["sex"].notna()]
+
+    updated = conn.bulk_update_patients(patients)
+    print(f"Decorated {updated} patients")
 
     conn.close()
 
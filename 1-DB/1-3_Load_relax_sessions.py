@@ -1,9 +1,5 @@
-import os
-import zipfile
-from datetime import datetime
 import pandas as pd
-import concurrent.futures
-from RXLDBC import connect
+from RXLDBC import connect, relax
 
 DATA_FOLDER = "C:/Users/niek2/Documents/Data/Data_Empatica_E4"
 GROUP_MAPPING = {
@@ -22,6 +18,13 @@ ORIGIN_MAPPING = {
 MEASUREMENT_TYPES = ["ACC", "BVP", "EDA", "HR", "IBI", "TEMP"]
 
 
+def report_rejected(rejected, key_column):
+    if rejected.empty:
+        return
+    print(f"\033[93mWarning: Skipped {len(rejected)} rows:\033[0m")
+    print(rejected.groupby("reason")[key_column].agg(["count", "unique"]).to_string())
+
+
 def main():
     # Create a connection to the database
     conn = connect.Connection()
@@ -35,111 +38,48 @@ def main():
     print("Loading relaxation sessions...")
     relax_df = pd.read_csv(f"{DATA_FOLDER}/researchdata_VRelax_15112024.csv", delimiter=';')
 
-    # Define potential datetime formats encountered in the CSV.
-    datetime_formats = ["%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M:%S"]
-
-    def parse_datetime(dt_str):
-        for fmt in datetime_formats:
-            try:
-                return datetime.strptime(dt_str, fmt)
-            except Exception:
-                continue
-        return None
-
-    for _, row in relax_df.iterrows():
-        user_key = row["UserKey"]
-        patient_id = participants_lookup.get(user_key)
-        if not patient_id:
-            print(f"Warning: No patient found for UserKey {user_key}. Skipping row.")
-            continue
-
-        start_dt = parse_datetime(row["StartSessionDT"])
-        end_dt = parse_datetime(row["EndSessionDT"])
-        if not start_dt or not end_dt:
-            print(f"Warning: Failed to parse datetime for row with UserKey {user_key}.")
-            continue
-
-        # Check if the end date is after the start date
-        if start_dt and end_dt and start_dt > end_dt:
-            print(
-                f"Warning: Start date {start_dt} is after end date {end_dt} for UserKey {user_key}. Skipping row.")
-            continue
-
-        # Check is the session is longer than 2 hours
-        if start_dt and end_dt and (end_dt - start_dt).total_seconds() > 7200:
-            print(f"Warning: Session duration exceeds 2 hours for UserKey {user_key}. Skipping row.")
-            continue
-
-        # Check if the start date is before 2022-07-04
-        if start_dt and start_dt < datetime(2022, 7, 4):
-            print(f"Warning: Start date {start_dt} is before 2022-07-04 for UserKey {user_key}. Skipping row.")
-            continue
-
-        if not start_dt or not end_dt:
-            print(f"Warning: Failed to parse datetime for row with UserKey {user_key}.")
-            continue
-
-        # Parse the questions
-        start_question_1 = row["StartQuestion1"]
-        end_question_1 = row["EndQuestion1"]
-        start_question_2 = row["StartQuestion2"]
-        end_question_2 = row["EndQuestion2"]
-        modifier = row["IsSleepSession"]
-
-        conn.insert_relax_session(patient_id, start_dt, end_dt, start_question_2, end_question_2, start_question_1, end_question_1, modifier)
+    # The questions of this export are numbered the other way around
+    rejected = relax.load_relax_sessions(
+        conn, relax_df, participants_lookup,
+        columns={
+            "user_key": "UserKey",
+            "start_timestamp": "StartSessionDT",
+            "end_timestamp": "EndSessionDT",
+            "start_question_1": "StartQuestion2",
+            "end_question_1": "EndQuestion2",
+            "start_question_2": "StartQuestion1",
+            "end_question_2": "EndQuestion1",
+            "modifier": "IsSleepSession",
+        },
+        # Potential datetime formats encountered in the CSV
+        formats=["%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M:%S"],
+        max_duration=relax.MAX_DURATION,
+        earliest_start=relax.STUDY_START,
+    )
+    report_rejected(rejected, "UserKey")
     print("Relaxation sessions loaded.\n")
 
-    # Define potential datetime formats encountered in the CSV.
-    datetime_formats = ["%Y-%m-%d %H:%M:%S"]
-
-    def parse_datetime(dt_str):
-        for fmt in datetime_formats:
-            try:
-                return datetime.strptime(dt_str, fmt)
-            except Exception:
-                continue
-        return None
-
-
     relax_ex_df = pd.read_csv(f"{DATA_FOLDER}/Relaxation_excercises_30102024.csv", delimiter=',')
-    for _, row in relax_ex_df.iterrows():
-        user_key = f"{row["oo_id"]}".strip().upper().replace(" ", "")
-        patient_id = participants_lookup.get(user_key)
-        if not patient_id:
-            print(f"Warning: No patient found for UserKey {user_key}. Skipping row.")
-            continue
-
-        start_dt = parse_datetime(row["oo_ss"])
-        end_dt = parse_datetime(row["oo_es"])
-
-        # Check if the end date is after the start date
-        if start_dt and end_dt and start_dt > end_dt:
-            print(f"Warning: Start date {start_dt} is after end date {end_dt} for UserKey {user_key}. Skipping row.")
-            continue
-
-        # Check is the session is longer than 2 hours
-        if start_dt and end_dt and (end_dt - start_dt).total_seconds() > 7200:
-            print(f"Warning: Session duration exceeds 2 hours for UserKey {user_key}. Skipping row.")
-            continue
-
-        # Check if the start date is before 2022-07-04
-        if start_dt and start_dt < datetime(2022, 7, 4):
-            print(f"Warning: Start date {start_dt} is before 2022-07-04 for UserKey {user_key}. Skipping row.")
-            continue
-
-        if not start_dt or not end_dt:
-            print(f"Warning: Failed to parse datetime for row with UserKey {user_key}.")
-            continue
-
-        # Parse the questions
-        start_question_1 = row["oo_sq1"]
-        end_question_1 = row["oo_eq1"]
-        start_question_2 = row["oo_sq2"]
-        end_question_2 = row["oo_eq2"]
-        modifier = row["ontspanningsoefening_complete"]
+    relax_ex_df["UserKey"] = relax_ex_df["oo_id"].astype(str).str.strip().str.upper().str.replace(" ", "")
+    rejected = relax.load_relax_sessions(
+        conn, relax_ex_df, participants_lookup,
+        columns={
+            "user_key": "UserKey",
+            "start_timestamp": "oo_ss",
+            "end_timestamp": "oo_es",
+            "start_question_1": "oo_sq1",
+            "end_question_1": "oo_eq1",
+            "start_question_2": "oo_sq2",
+            "end_question_2": "oo_eq2",
+            "modifier": "ontspanningsoefening_complete",
+        },
+        formats=["%Y-%m-%d %H:%M:%S"],
+        max_duration=relax.MAX_DURATION,
+        earliest_start=relax.STUDY_START,
+    )
+    report_rejected(rejected, "UserKey")
+    print("Relaxation sessions loaded.\n")
 
 
-        conn.insert_relax_session(patient_id, start_dt, end_dt, start_question_1, end_question_1, start_question_2, end_question_2, modifier)
-    print("Relaxation sessions loaded.\n")
 if __name__ == "__main__":
     main()
@@ -0,0 +1,30 @@
+import concurrent.futures
+import os
+
+from RXLDBC import connect
+from RXLDBC.signal_store import SignalStore
+
+SIGNAL_STORE_DIR = "C:/Users/niek2/Documents/Data/Signal_store"
+
+
+def export_patient(store, patient_id):
+    # Take a database connection for this thread from the pool
+    with connect.Connection.pooled() as conn:
+        for measurement_id in conn.get_all_measurement_ids_from_patient_id(patient_id):
+            index = store.export_measurement(conn, measurement_id)
+            print(f"Exported {len(index['sessions'])} sessions of {measurement_id}")
+
+
+def main():
+    conn = connect.Connection()
+    patient_ids = conn.get_all_patient_ids()
+    conn.close()
+
+    store = SignalStore(os.getenv("SIGNAL_STORE_DIR") or SIGNAL_STORE_DIR)
+    with concurrent.futures.ThreadPoolExecutor() as executor:
+        for future in [executor.submit(export_patient, store, patient_id) for patient_id in patient_ids]:
+            future.result()
+
+
+if __name__ == "__main__":
+    main()
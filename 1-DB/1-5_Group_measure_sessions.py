@@ -0,0 +1,13 @@
+from RXLDBC import connect, grouping
+
+
+def main():
+    conn = connect.Connection()
+    for patient_id in conn.get_all_patient_ids():
+        sessions = grouping.assign_groups(conn, patient_id)
+        print(f"Grouped {len(sessions)} sessions of {patient_id} into {sessions['group_id'].nunique()} groups")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
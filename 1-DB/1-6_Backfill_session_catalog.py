@@ -0,0 +1,16 @@
+from RXLDBC import connect
+
+
+def main():
+    # Databases loaded before the session catalog existed have measure sessions without catalog rows,
+    # run this once before the scripts that read the catalog, e.g. 1-5_Group_measure_sessions.py
+    conn = connect.Connection()
+    for patient_id in conn.get_all_patient_ids():
+        # One transaction per patient, so an interrupted backfill keeps the patients it finished
+        conn.refresh_session_catalog(patient_id)
+        print(f"Catalogued {len(conn.catalog(patient_id))} sessions of {patient_id}")
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,11 +1,12 @@
--- Create ENUM types for fixed literals
-CREATE TYPE measurement_type_enum AS ENUM ('ACC_X', 'ACC_Y', 'ACC_Z', 'BVP', 'EDA', 'HR', 'IBI', 'TEMP');
-CREATE TYPE week_enum AS ENUM ('Week_1', 'Week_2');
-CREATE TYPE patient_group_enum AS ENUM ('Exercise', 'VR');
-CREATE TYPE origin_enum AS ENUM ('UMCG', 'Forte GGZ', 'Lentis', 'Argo GGZ', 'Mediant GGZ', 'Huisartsenpraktijk');
+-- Create ENUM types for fixed literals. Every statement in this file can be applied to an existing database,
+-- CREATE TYPE has no IF NOT EXISTS so an existing type is skipped by catching its error.
+DO $$ BEGIN CREATE TYPE measurement_type_enum AS ENUM ('ACC_X', 'ACC_Y', 'ACC_Z', 'BVP', 'EDA', 'HR', 'IBI', 'TEMP'); EXCEPTION WHEN duplicate_object THEN NULL; END $$;
+DO $$ BEGIN CREATE TYPE week_enum AS ENUM ('Week_1', 'Week_2'); EXCEPTION WHEN duplicate_object THEN NULL; END $$;
+DO $$ BEGIN CREATE TYPE patient_group_enum AS ENUM ('Exercise', 'VR'); EXCEPTION WHEN duplicate_object THEN NULL; END $$;
+DO $$ BEGIN CREATE TYPE origin_enum AS ENUM ('UMCG', 'Forte GGZ', 'Lentis', 'Argo GGZ', 'Mediant GGZ', 'Huisartsenpraktijk'); EXCEPTION WHEN duplicate_object THEN NULL; END $$;
 
 -- Table for patients
-CREATE TABLE patient (
+CREATE TABLE IF NOT EXISTS patient (
                          id TEXT PRIMARY KEY,
                          origin origin_enum,
                          patient_group  patient_group_enum
@@ -13,7 +14,7 @@ CREATE TABLE patient (
 
 -- Table for measurements.
 -- Each row represents one measurement type for a specific week and patient.
-CREATE TABLE measurement (
+CREATE TABLE IF NOT EXISTS measurement (
                              id TEXT PRIMARY KEY,
                              patient_id TEXT REFERENCES patient(id),
                              week week_enum,
@@ -23,7 +24,7 @@ CREATE TABLE measurement (
 
 -- Table for measurement sessions.
 -- The 'data' field is stored as JSONB to capture the list of samples.
-CREATE TABLE measure_session (
+CREATE TABLE IF NOT EXISTS measure_session (
                                  id SERIAL PRIMARY KEY,
                                  measurement_id TEXT REFERENCES measurement(id),
                                  start_timestamp TIMESTAMP,
@@ -31,9 +32,115 @@ CREATE TABLE measure_session (
 );
 
 -- Table for relaxation sessions
-CREATE TABLE relax_session (
+CREATE TABLE IF NOT EXISTS relax_session (
                                id SERIAL PRIMARY KEY,
                                patient_id TEXT REFERENCES patient(id),
                                start_timestamp TIMESTAMP,
                                end_timestamp TIMESTAMP
 );
+-- Questionnaire answers of the relax app, only loaded by 1-3_Load_relax_sessions.py
+ALTER TABLE relax_session ADD COLUMN IF NOT EXISTS start_question_1 INTEGER;
+ALTER TABLE relax_session ADD COLUMN IF NOT EXISTS end_question_1 INTEGER;
+ALTER TABLE relax_session ADD COLUMN IF NOT EXISTS start_question_2 INTEGER;
+ALTER TABLE relax_session ADD COLUMN IF NOT EXISTS end_question_2 INTEGER;
+ALTER TABLE relax_session ADD COLUMN IF NOT EXISTS modifier TEXT;
+
+-- A relax session is identified by its patient, start and end, Connection.bulk_insert_relax_sessions() upserts on
+-- this key. Databases that loaded the same export twice first get the answers of their duplicates merged into the
+-- oldest copy, after which the other copies are removed.
+UPDATE relax_session r SET start_question_1 = COALESCE(r.start_question_1, d.start_question_1),
+                           end_question_1 = COALESCE(r.end_question_1, d.end_question_1),
+                           start_question_2 = COALESCE(r.start_question_2, d.start_question_2),
+                           end_question_2 = COALESCE(r.end_question_2, d.end_question_2),
+                           modifier = COALESCE(r.modifier, d.modifier)
+FROM (SELECT MIN(id) AS id,
+             (array_agg(start_question_1 ORDER BY id) FILTER (WHERE start_question_1 IS NOT NULL))[1] AS start_question_1,
+             (array_agg(end_question_1 ORDER BY id) FILTER (WHERE end_question_1 IS NOT NULL))[1] AS end_question_1,
+             (array_agg(start_question_2 ORDER BY id) FILTER (WHERE start_question_2 IS NOT NULL))[1] AS start_question_2,
+             (array_agg(end_question_2 ORDER BY id) FILTER (WHERE end_question_2 IS NOT NULL))[1] AS end_question_2,
+             (array_agg(modifier ORDER BY id) FILTER (WHERE modifier IS NOT NULL))[1] AS modifier
+      FROM relax_session GROUP BY patient_id, start_timestamp, end_timestamp HAVING COUNT(*) > 1) d
+WHERE r.id = d.id;
+DELETE FROM relax_session a USING relax_session b
+WHERE a.patient_id = b.patient_id AND a.start_timestamp = b.start_timestamp AND a.end_timestamp = b.end_timestamp
+  AND a.id > b.id;
+CREATE UNIQUE INDEX IF NOT EXISTS relax_session_key_idx ON relax_session (patient_id, start_timestamp, end_timestamp);
+
+-- Inclusive [start, end] row ranges of invalid data, [0, -1] marks the whole session as invalid
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS invalid_data_indices INTEGER[][];
+
+-- Metadata of every measurement session, maintained by the connector whenever sessions are inserted or
+-- their invalid data indices change, so sessions can be planned without reading their data.
+-- Existing databases are backfilled with 1-DB/1-6_Backfill_session_catalog.py, reads from the catalog raise
+-- while it is missing sessions.
+CREATE TABLE IF NOT EXISTS session_catalog (
+                                 session_id INTEGER PRIMARY KEY REFERENCES measure_session(id) ON DELETE CASCADE,
+                                 measurement_id TEXT REFERENCES measurement(id),
+                                 patient_id TEXT REFERENCES patient(id),
+                                 measurement_type measurement_type_enum,
+                                 week week_enum,
+                                 start_timestamp TIMESTAMP,
+                                 end_timestamp TIMESTAMP,
+                                 n_samples INTEGER NOT NULL,
+                                 sample_rate FLOAT,
+                                 invalid_fraction FLOAT NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS session_catalog_patient_idx ON session_catalog (patient_id, week, start_timestamp);
+
+-- Zip archives loaded by the ingest scheduler. An archive is skipped on the next run when it was loaded and
+-- its size and modification time did not change, failed and changed archives are loaded again.
+CREATE TABLE IF NOT EXISTS ingest_log (
+                            id SERIAL PRIMARY KEY,
+                            zip_path TEXT UNIQUE NOT NULL,
+                            patient_id TEXT REFERENCES patient(id),
+                            size BIGINT NOT NULL,
+                            mtime DOUBLE PRECISION NOT NULL,
+                            status TEXT NOT NULL CHECK (status IN ('loading', 'loaded', 'failed')),
+                            error TEXT,
+                            loaded_at TIMESTAMP
+);
+
+-- The archive a measure session was loaded from, so reloading an archive replaces its sessions
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS ingest_id INTEGER REFERENCES ingest_log(id) ON DELETE CASCADE;
+CREATE INDEX IF NOT EXISTS measure_session_ingest_idx ON measure_session (ingest_id);
+
+-- Optional chunked copy of long measure sessions, consecutive blocks of measure_session.chunk_rows rows.
+-- Slices of a chunked session only read the chunks they overlap instead of the whole array.
+-- Sessions are chunked with Connection.chunk_measure_sessions(), chunk_rows stays NULL for the others.
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS chunk_rows INTEGER;
+CREATE TABLE IF NOT EXISTS measure_chunk (
+                               session_id INTEGER REFERENCES measure_session(id) ON DELETE CASCADE,
+                               chunk_no INTEGER,
+                               data FLOAT[],
+                               PRIMARY KEY (session_id, chunk_no)
+);
+
+-- Compact storage of sampled measure sessions, filled by Connection.compact_measure_sessions(), which sets data
+-- to NULL. ACC samples are whole numbers and fit SMALLINT, the other sampled types have a few significant digits.
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS data_i2 SMALLINT[];
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS data_f4 REAL[];
+-- Chunks are stored in the same column as the data of their session
+ALTER TABLE measure_chunk ADD COLUMN IF NOT EXISTS data_i2 SMALLINT[];
+ALTER TABLE measure_chunk ADD COLUMN IF NOT EXISTS data_f4 REAL[];
+
+-- Recordings of a patient, the E4 sessions of all measurement types that were started together.
+-- Filled from the session catalog by grouping.assign_groups(), length is in seconds.
+CREATE TABLE IF NOT EXISTS measure_group (
+                                             id TEXT PRIMARY KEY,
+                                             patient_id TEXT REFERENCES patient(id),
+                                             week week_enum,
+                                             length INTEGER
+);
+ALTER TABLE measure_session ADD COLUMN IF NOT EXISTS measure_group_id TEXT REFERENCES measure_group(id);
+CREATE INDEX IF NOT EXISTS measure_session_group_idx ON measure_session (measure_group_id);
+
+-- Runs of the invalid-data marking, one per measure group. params holds only the parameters the marks of the
+-- group depend on, a group is marked again when one of them or its sessions change, see quality.pending_groups().
+CREATE TABLE IF NOT EXISTS quality_run (
+                                           group_id TEXT PRIMARY KEY REFERENCES measure_group(id) ON DELETE CASCADE,
+                                           params JSONB NOT NULL,
+                                           session_ids INTEGER[] NOT NULL,
+                                           total_samples BIGINT NOT NULL,
+                                           invalid_samples BIGINT NOT NULL,
+                                           finished_at TIMESTAMP NOT NULL
+);
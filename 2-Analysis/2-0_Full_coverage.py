@@ -5,8 +5,8 @@ from RXLDBC import connect, plot
 
 def make_plot_of_patient(patient_id):
     print(f"Patient ID: {patient_id}")
-    conn = connect.Connection()
-    (vitals, sessions) = conn.get_all_sessions_from_patient_id(patient_id)
+    conn = connect.Connection.pooled()
+    (vitals, sessions) = conn.get_all_sessions_from_patient_id(patient_id, use_catalog=True)
     conn.close()
     try:
         stats = plot.plot_weekly_gantt(vitals, sessions)
@@ -1,6 +1,6 @@
 from datetime import timedelta
 
-from RXLDBC import connect
+from RXLDBC import connect, overlap
 import matplotlib.pyplot as plt
 from multiprocessing import Process
 
@@ -21,7 +21,7 @@ def main():
 
     for patient_id in patient_ids:
         patient_id = patient_id[0]
-        e4_timestamps = conn.get_all_timestamps_from_patient_id(patient_id)
+        e4_timestamps = conn.get_all_timestamps_from_patient_id(patient_id, use_catalog=True)
         relax_timestamps = conn.get_all_relax_sessions_from_patient_id(patient_id)
 
         # # Filter E4 sessions that are 10 hours or longer
@@ -62,12 +62,13 @@ def filter_10hrs_of_e4_data_on_single_day(e4_timestamps):
     return filtered_sessions
 
 def filter_5min_of_e4_before_and_after_relax_sessions(e4_timestamps, relax_timestamps):
-    # Filter E4 sessions that are 5 minutes before and after relaxation sessions
+    # Filter E4 sessions that are 5 minutes before and after relaxation sessions, the session may start up to
+    # 5 minutes after the relaxation session did
     filtered_sessions = {}
-    for session_id, (start, end) in e4_timestamps.items():
-        for relax_id, (relax_start, relax_end) in relax_timestamps.items():
-            if start <= relax_start + timedelta(minutes=5) and end >= relax_end + timedelta(minutes=5):
-                filtered_sessions[session_id] = relax_id
+    matches = overlap.covering_sessions(e4_timestamps, relax_timestamps, before=-timedelta(minutes=5))
+    for relax_id, session_ids in matches.items():
+        for session_id in session_ids:
+            filtered_sessions[session_id] = relax_id
     return filtered_sessions
 
 def plot_filtered_relax_sessions(filtered_sessions):
@@ -84,7 +85,7 @@ def plot_filtered_relax_sessions(filtered_sessions):
         cursor.execute("SELECT start_timestamp, end_timestamp FROM relax_session WHERE id = %s", (relax_id.split("_")[-1],))
         start_relax, end_relax = cursor.fetchone()
 
-        cursor.execute("SELECT measurement_id, start_timestamp, data FROM measure_session WHERE id = %s", (session_id.split("_")[-1],))
+        cursor.execute(f"SELECT ms.measurement_id, ms.start_timestamp, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.id = %s", (session_id.split("_")[-1],))
         measurement_id, start_data, data = cursor.fetchone()
 
         # Get the sample rate
@@ -1,6 +1,7 @@
 from datetime import timedelta, datetime
 
-from RXLDBC import connect
+from RXLDBC import connect, overlap
+from RXLDBC.stats import describe_many
 from multiprocessing import Process, Queue
 
 import neurokit2 as nk
@@ -52,22 +53,36 @@ def main():
 
 
 def filter_5min_of_e4_before_and_after_relax_sessions(e4_timestamps, relax_timestamps):
-    # Filter E4 sessions that are 5 minutes before and after relaxation sessions
-    filtered_sessions = {}
-    for session_id, (start, end) in e4_timestamps.items():
-        for relax_id, (relax_start, relax_end) in relax_timestamps.items():
-            if start <= relax_start + timedelta(minutes=5) and end >= relax_end + timedelta(minutes=5):
-                if relax_id not in filtered_sessions:
-                    filtered_sessions[relax_id] = [{session_id: (start, end)}]
-                else:
-                    filtered_sessions[relax_id].append({session_id: (start, end)})
-    return filtered_sessions
+    # Filter E4 sessions that are 5 minutes before and after relaxation sessions, the session may start up to
+    # 5 minutes after the relaxation session did
+    matches = overlap.covering_sessions(e4_timestamps, relax_timestamps, before=-timedelta(minutes=5))
+    return {relax_id: [{session_id: e4_timestamps[session_id]} for session_id in session_ids]
+            for relax_id, session_ids in matches.items()}
+
+def describe_windows(windows):
+    """
+    Calculates the stats of all windows of a relax session at once.
+
+    Args:
+        windows (dict): The data of every window, keyed by (name, window), e.g. ("hr", "before").
+
+    Returns:
+        dict: The stats keyed as "{name}_{stat}_{window}", e.g. "hr_sd_before".
+    """
+    columns = describe_many(windows.values())
+    window_stats = {}
+    for index, (name, window) in enumerate(windows):
+        for stat, column in columns.items():
+            stat = "sd" if stat == "std" else stat
+            window_stats[f"{name}_{stat}_{window}"] = column[index]
+    return window_stats
+
 
 def calculate_stats_for_relax_session(relax_session):
     # test = ('F001_Exercise_25029', [{'F001_Week_1_ACC_X_1559': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 25, 22))}, {'F001_Week_1_ACC_Y_1562': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 25, 22))}, {'F001_Week_1_ACC_Z_1565': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 25, 22))}, {'F001_Week_1_EDA_1575': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 25, 26))}, {'F001_Week_1_BVP_1667': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 25, 19))}, {'F001_Week_1_TEMP_1684': (datetime.datetime(2022, 7, 10, 10, 51, 47), datetime.datetime(2022, 7, 11, 0, 24, 31))}, {'F001_Week_1_HR_1695': (datetime.datetime(2022, 7, 10, 10, 51, 57), datetime.datetime(2022, 7, 11, 0, 25, 20))}])
     print(f"Calculating stats for {relax_session[0]}...")
     # Get the start and end timestamps of the relaxation session
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
     cursor = conn.conn.cursor()
     relax_id = relax_session[0].split("_")[2]
     cursor.execute("SELECT patient_id, start_timestamp, end_timestamp, ontspanning_start, ontspanning_eind, kalm_start, kalm_eind FROM relax_session WHERE id = %s", (relax_id,))
@@ -107,6 +122,9 @@ def calculate_stats_for_relax_session(relax_session):
     hr = ""
     temp = ""
 
+    # The data of the before, during and after windows of every measurement, their stats are calculated at once
+    windows = {}
+
     for measurement_session in relax_session[1]:
         for measure_id, (start, end) in measurement_session.items():
             # Get the measurement type from the session ID
@@ -119,54 +137,24 @@ def calculate_stats_for_relax_session(relax_session):
                 # Subtract 5 minutes from the seconds difference
                 minus_5_mins = start_of_relax - 300
                 # Get the data points from the database with the slice of the seconds difference
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, measure_id.split("_")[-1]))
-                hr_data_before = cursor.fetchone()[0]
-
-                # Calculate stats
-                hr_sd_before = np.std(hr_data_before)
-                hr_mean_before = np.mean(hr_data_before)
-                hr_median_before = np.median(hr_data_before)
-                hr_min_before = np.min(hr_data_before)
-                hr_max_before = np.max(hr_data_before)
-                hr_range_before = hr_max_before - hr_min_before
-                hr_1q_before = np.percentile(hr_data_before, 25)
-                hr_3q_before = np.percentile(hr_data_before, 75)
-                hr_iqr_before = hr_3q_before - hr_1q_before
+                hr_data_before = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], minus_5_mins, start_of_relax)
+
+                windows[("hr", "before")] = hr_data_before
 
                 # Get the difference between the end of the relaxation session and the start of the measurement session
                 end_of_relax = int((end_timestamp - start).total_seconds())
 
                 # Get the data points from the database with the slice of the beginning and end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, measure_id.split("_")[-1]))
-                hr_data_during = cursor.fetchone()[0]
-
-                # Calculate stats
-                hr_sd_during = np.std(hr_data_during)
-                hr_mean_during = np.mean(hr_data_during)
-                hr_median_during = np.median(hr_data_during)
-                hr_min_during = np.min(hr_data_during)
-                hr_max_during = np.max(hr_data_during)
-                hr_range_during = hr_max_during - hr_min_during
-                hr_1q_during = np.percentile(hr_data_during, 25)
-                hr_3q_during = np.percentile(hr_data_during, 75)
-                hr_iqr_during = hr_3q_during - hr_1q_during
+                hr_data_during = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], start_of_relax, end_of_relax)
+
+                windows[("hr", "during")] = hr_data_during
 
                 # Add 5 minutes to the end of the relaxation session
                 plus_5_mins = end_of_relax + 300
                 # Get the data points from the database with the slice of the end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, measure_id.split("_")[-1]))
-                hr_data_after = cursor.fetchone()[0]
+                hr_data_after = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], end_of_relax, plus_5_mins)
 
-                # Calculate stats
-                hr_sd_after = np.std(hr_data_after)
-                hr_mean_after = np.mean(hr_data_after)
-                hr_median_after = np.median(hr_data_after)
-                hr_min_after = np.min(hr_data_after)
-                hr_max_after = np.max(hr_data_after)
-                hr_range_after = hr_max_after - hr_min_after
-                hr_1q_after = np.percentile(hr_data_after, 25)
-                hr_3q_after = np.percentile(hr_data_after, 75)
-                hr_iqr_after = hr_3q_after - hr_1q_after
+                windows[("hr", "after")] = hr_data_after
 
 
             elif measurement_type == "EDA":
@@ -176,140 +164,62 @@ def calculate_stats_for_relax_session(relax_session):
                 # Subtract 5 minutes from the seconds difference
                 minus_5_mins = start_of_relax - (300 * 4)
                 # Get the data points from the database with the slice of the seconds difference
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, measure_id.split("_")[-1]))
-                eda_data_before = cursor.fetchone()[0]
-
-                # Calculate stats
-                eda_sd_before = np.std(eda_data_before)
-                eda_mean_before = np.mean(eda_data_before)
-                eda_median_before = np.median(eda_data_before)
-                eda_min_before = np.min(eda_data_before)
-                eda_max_before = np.max(eda_data_before)
-                eda_range_before = eda_max_before - eda_min_before
-                eda_1q_before = np.percentile(eda_data_before, 25)
-                eda_3q_before = np.percentile(eda_data_before, 75)
-                eda_iqr_before = eda_3q_before - eda_1q_before
+                eda_data_before = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], minus_5_mins, start_of_relax)
+
+                windows[("eda", "before")] = eda_data_before
 
                 nk_data_before = np.array(eda_data_before).ravel()
 
                 signals, info = nk.eda_process(nk_data_before, sampling_rate=4)
 
                 scl = signals["EDA_Tonic"]
-                eda_scl_sd_before = np.std(scl)
-                eda_scl_mean_before = np.mean(scl)
-                eda_scl_median_before = np.median(scl)
-                eda_scl_min_before = np.min(scl)
-                eda_scl_max_before = np.max(scl)
-                eda_scl_range_before = eda_scl_max_before - eda_scl_min_before
-                eda_scl_1q_before = np.percentile(scl, 25)
-                eda_scl_3q_before = np.percentile(scl, 75)
-                eda_scl_iqr_before = eda_scl_3q_before - eda_scl_1q_before
+                windows[("eda_scl", "before")] = scl
 
                 eda_scr_peaks_before = len(np.where(signals["SCR_Peaks"])[0])
 
                 amplitudes = info["SCR_Amplitude"]
-                eda_scr_amplitude_sd_before = np.std(amplitudes)
-                eda_scr_amplitude_mean_before = np.mean(amplitudes)
-                eda_scr_amplitude_median_before = np.median(amplitudes)
-                eda_scr_amplitude_min_before = np.min(amplitudes)
-                eda_scr_amplitude_max_before = np.max(amplitudes)
-                eda_scr_amplitude_range_before = eda_scr_amplitude_max_before - eda_scr_amplitude_min_before
-                eda_scr_amplitude_1q_before = np.percentile(amplitudes, 25)
-                eda_scr_amplitude_3q_before = np.percentile(amplitudes, 75)
-                eda_scr_amplitude_iqr_before = eda_scr_amplitude_3q_before - eda_scr_amplitude_1q_before
+                windows[("eda_scr_amplitude", "before")] = amplitudes
 
 
                 # Get the difference between the end of the relaxation session and the start of the measurement session
                 end_of_relax = int((end_timestamp - start).total_seconds()) * 4
                 # Get the data points from the database with the slice of the beginning and end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, measure_id.split("_")[-1]))
-                eda_data_during = cursor.fetchone()[0]
-
-                # Calculate stats
-                eda_sd_during = np.std(eda_data_during)
-                eda_mean_during = np.mean(eda_data_during)
-                eda_median_during = np.median(eda_data_during)
-                eda_min_during = np.min(eda_data_during)
-                eda_max_during = np.max(eda_data_during)
-                eda_range_during = eda_max_during - eda_min_during
-                eda_1q_during = np.percentile(eda_data_during, 25)
-                eda_3q_during = np.percentile(eda_data_during, 75)
-                eda_iqr_during = eda_3q_during - eda_1q_during
+                eda_data_during = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], start_of_relax, end_of_relax)
+
+                windows[("eda", "during")] = eda_data_during
 
                 nk_data_during = np.array(eda_data_during).ravel()
 
                 signals, info = nk.eda_process(nk_data_during, sampling_rate=4)
 
                 scl = signals["EDA_Tonic"]
-                eda_scl_sd_during = np.std(scl)
-                eda_scl_mean_during = np.mean(scl)
-                eda_scl_median_during = np.median(scl)
-                eda_scl_min_during = np.min(scl)
-                eda_scl_max_during = np.max(scl)
-                eda_scl_range_during = eda_scl_max_during - eda_scl_min_during
-                eda_scl_1q_during = np.percentile(scl, 25)
-                eda_scl_3q_during = np.percentile(scl, 75)
-                eda_scl_iqr_during = eda_scl_3q_during - eda_scl_1q_during
+                windows[("eda_scl", "during")] = scl
 
                 eda_scr_peaks_during = len(np.where(signals["SCR_Peaks"])[0])
 
                 amplitudes = info["SCR_Amplitude"]
-                eda_scr_amplitude_sd_during = np.std(amplitudes)
-                eda_scr_amplitude_mean_during = np.mean(amplitudes)
-                eda_scr_amplitude_median_during = np.median(amplitudes)
-                eda_scr_amplitude_min_during = np.min(amplitudes)
-                eda_scr_amplitude_max_during = np.max(amplitudes)
-                eda_scr_amplitude_range_during = eda_scr_amplitude_max_during - eda_scr_amplitude_min_during
-                eda_scr_amplitude_1q_during = np.percentile(amplitudes, 25)
-                eda_scr_amplitude_3q_during = np.percentile(amplitudes, 75)
-                eda_scr_amplitude_iqr_during = eda_scr_amplitude_3q_during - eda_scr_amplitude_1q_during
+                windows[("eda_scr_amplitude", "during")] = amplitudes
 
 
                 # Add 5 minutes to the end of the relaxation session
                 plus_5_mins = end_of_relax + (300 * 4)
 
                 # Get the data points from the database with the slice of the end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, measure_id.split("_")[-1]))
-                eda_data_after = cursor.fetchone()[0]
-
-                # Calculate stats
-                eda_sd_after = np.std(eda_data_after)
-                eda_mean_after = np.mean(eda_data_after)
-                eda_median_after = np.median(eda_data_after)
-                eda_min_after = np.min(eda_data_after)
-                eda_max_after = np.max(eda_data_after)
-                eda_range_after = eda_max_after - eda_min_after
-                eda_1q_after = np.percentile(eda_data_after, 25)
-                eda_3q_after = np.percentile(eda_data_after, 75)
-                eda_iqr_after = eda_3q_after - eda_1q_after
+                eda_data_after = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], end_of_relax, plus_5_mins)
+
+                windows[("eda", "after")] = eda_data_after
 
                 nk_data_after = np.array(eda_data_after).ravel()
 
                 signals, info = nk.eda_process(nk_data_after, sampling_rate=4)
 
                 scl = signals["EDA_Tonic"]
-                eda_scl_sd_after = np.std(scl)
-                eda_scl_mean_after = np.mean(scl)
-                eda_scl_median_after = np.median(scl)
-                eda_scl_min_after = np.min(scl)
-                eda_scl_max_after = np.max(scl)
-                eda_scl_range_after = eda_scl_max_after - eda_scl_min_after
-                eda_scl_1q_after = np.percentile(scl, 25)
-                eda_scl_3q_after = np.percentile(scl, 75)
-                eda_scl_iqr_after = eda_scl_3q_after - eda_scl_1q_after
+                windows[("eda_scl", "after")] = scl
 
                 eda_scr_peaks_after = len(np.where(signals["SCR_Peaks"])[0])
 
                 amplitudes = info["SCR_Amplitude"]
-                eda_scr_amplitude_sd_after = np.std(amplitudes)
-                eda_scr_amplitude_mean_after = np.mean(amplitudes)
-                eda_scr_amplitude_median_after = np.median(amplitudes)
-                eda_scr_amplitude_min_after = np.min(amplitudes)
-                eda_scr_amplitude_max_after = np.max(amplitudes)
-                eda_scr_amplitude_range_after = eda_scr_amplitude_max_after - eda_scr_amplitude_min_after
-                eda_scr_amplitude_1q_after = np.percentile(amplitudes, 25)
-                eda_scr_amplitude_3q_after = np.percentile(amplitudes, 75)
-                eda_scr_amplitude_iqr_after = eda_scr_amplitude_3q_after - eda_scr_amplitude_1q_after
+                windows[("eda_scr_amplitude", "after")] = amplitudes
 
             elif measurement_type == "BVP":
                 bvp = measure_id.split("_")[-1]
@@ -318,53 +228,23 @@ def calculate_stats_for_relax_session(relax_session):
                 # Subtract 5 minutes from the seconds difference
                 minus_5_mins = start_of_relax - (300 * 64)
                 # Get the data points from the database with the slice of the seconds difference
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, measure_id.split("_")[-1]))
-                bvp_data_before = cursor.fetchone()[0]
-
-                # Calculate stats
-                bvp_sd_before = np.std(bvp_data_before)
-                bvp_mean_before = np.mean(bvp_data_before)
-                bvp_median_before = np.median(bvp_data_before)
-                bvp_min_before = np.min(bvp_data_before)
-                bvp_max_before = np.max(bvp_data_before)
-                bvp_range_before = bvp_max_before - bvp_min_before
-                bvp_1q_before = np.percentile(bvp_data_before, 25)
-                bvp_3q_before = np.percentile(bvp_data_before, 75)
-                bvp_iqr_before = bvp_3q_before - bvp_1q_before
+                bvp_data_before = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], minus_5_mins, start_of_relax)
+
+                windows[("bvp", "before")] = bvp_data_before
 
                 # Get the difference between the end of the relaxation session and the start of the measurement session
                 end_of_relax = int((end_timestamp - start).total_seconds()) * 64
                 # Get the data points from the database with the slice of the beginning and end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, measure_id.split("_")[-1]))
-                bvp_data_during = cursor.fetchone()[0]
-
-                # Calculate stats
-                bvp_sd_during = np.std(bvp_data_during)
-                bvp_mean_during = np.mean(bvp_data_during)
-                bvp_median_during = np.median(bvp_data_during)
-                bvp_min_during = np.min(bvp_data_during)
-                bvp_max_during = np.max(bvp_data_during)
-                bvp_range_during = bvp_max_during - bvp_min_during
-                bvp_1q_during = np.percentile(bvp_data_during, 25)
-                bvp_3q_during = np.percentile(bvp_data_during, 75)
-                bvp_iqr_during = bvp_3q_during - bvp_1q_during
+                bvp_data_during = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], start_of_relax, end_of_relax)
+
+                windows[("bvp", "during")] = bvp_data_during
 
                 # Add 5 minutes to the end of the relaxation session
                 plus_5_mins = end_of_relax + (300 * 64)
                 # Get the data points from the database with the slice of the end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, measure_id.split("_")[-1]))
-                bvp_data_after = cursor.fetchone()[0]
-
-                # Calculate stats
-                bvp_sd_after = np.std(bvp_data_after)
-                bvp_mean_after = np.mean(bvp_data_after)
-                bvp_median_after = np.median(bvp_data_after)
-                bvp_min_after = np.min(bvp_data_after)
-                bvp_max_after = np.max(bvp_data_after)
-                bvp_range_after = bvp_max_after - bvp_min_after
-                bvp_1q_after = np.percentile(bvp_data_after, 25)
-                bvp_3q_after = np.percentile(bvp_data_after, 75)
-                bvp_iqr_after = bvp_3q_after - bvp_1q_after
+                bvp_data_after = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], end_of_relax, plus_5_mins)
+
+                windows[("bvp", "after")] = bvp_data_after
 
             elif measurement_type == "TEMP":
                 temp = measure_id.split("_")[-1]
@@ -373,54 +253,24 @@ def calculate_stats_for_relax_session(relax_session):
                 # Subtract 5 minutes from the seconds difference
                 minus_5_mins = start_of_relax - (300 * 4)
                 # Get the data points from the database with the slice of the seconds difference
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, measure_id.split("_")[-1]))
-                temp_data_before = cursor.fetchone()[0]
-
-                # Calculate stats
-                temp_sd_before = np.std(temp_data_before)
-                temp_mean_before = np.mean(temp_data_before)
-                temp_median_before = np.median(temp_data_before)
-                temp_min_before = np.min(temp_data_before)
-                temp_max_before = np.max(temp_data_before)
-                temp_range_before = temp_max_before - temp_min_before
-                temp_1q_before = np.percentile(temp_data_before, 25)
-                temp_3q_before = np.percentile(temp_data_before, 75)
-                temp_iqr_before = temp_3q_before - temp_1q_before
+                temp_data_before = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], minus_5_mins, start_of_relax)
+
+                windows[("temp", "before")] = temp_data_before
 
                 # Get the difference between the end of the relaxation session and the start of the measurement session
                 end_of_relax = int((end_timestamp - start).total_seconds()) * 4
                 # Get the data points from the database with the slice of the beginning and end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, measure_id.split("_")[-1]))
-                temp_data_during = cursor.fetchone()[0]
-
-                # Calculate stats
-                temp_sd_during = np.std(temp_data_during)
-                temp_mean_during = np.mean(temp_data_during)
-                temp_median_during = np.median(temp_data_during)
-                temp_min_during = np.min(temp_data_during)
-                temp_max_during = np.max(temp_data_during)
-                temp_range_during = temp_max_during - temp_min_during
-                temp_1q_during = np.percentile(temp_data_during, 25)
-                temp_3q_during = np.percentile(temp_data_during, 75)
-                temp_iqr_during = temp_3q_during - temp_1q_during
+                temp_data_during = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], start_of_relax, end_of_relax)
+
+                windows[("temp", "during")] = temp_data_during
 
                 # Add 5 minutes to the end of the relaxation session
                 plus_5_mins = end_of_relax + (300 * 4)
 
                 # Get the data points from the database with the slice of the end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, measure_id.split("_")[-1]))
-                temp_data_after = cursor.fetchone()[0]
-
-                # Calculate stats
-                temp_sd_after = np.std(temp_data_after)
-                temp_mean_after = np.mean(temp_data_after)
-                temp_median_after = np.median(temp_data_after)
-                temp_min_after = np.min(temp_data_after)
-                temp_max_after = np.max(temp_data_after)
-                temp_range_after = temp_max_after - temp_min_after
-                temp_1q_after = np.percentile(temp_data_after, 25)
-                temp_3q_after = np.percentile(temp_data_after, 75)
-                temp_iqr_after = temp_3q_after - temp_1q_after
+                temp_data_after = conn.get_data_from_measure_session_with_index(measure_id.split("_")[-1], end_of_relax, plus_5_mins)
+
+                windows[("temp", "after")] = temp_data_after
 
             elif measurement_type == "X":
                 acc_x = measure_id.split("_")[-1]
@@ -434,12 +284,9 @@ def calculate_stats_for_relax_session(relax_session):
                 # Subtract 5 minutes from the seconds difference
                 minus_5_mins = start_of_relax - (300 * 32)
                 # Get the data points from the database with the slice of the seconds difference
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, acc_x))
-                acc_x_data_before = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, acc_y))
-                acc_y_data_before = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (minus_5_mins, start_of_relax, acc_z))
-                acc_z_data_before = cursor.fetchone()[0]
+                acc_x_data_before = conn.get_data_from_measure_session_with_index(acc_x, minus_5_mins, start_of_relax)
+                acc_y_data_before = conn.get_data_from_measure_session_with_index(acc_y, minus_5_mins, start_of_relax)
+                acc_z_data_before = conn.get_data_from_measure_session_with_index(acc_z, minus_5_mins, start_of_relax)
                 
                 # Calculate vectors of magnitude
                 acc_x_data_before = np.array(acc_x_data_before)
@@ -447,26 +294,14 @@ def calculate_stats_for_relax_session(relax_session):
                 acc_z_data_before = np.array(acc_z_data_before)
                 acc_magnitude_before = np.sqrt(acc_x_data_before**2 + acc_y_data_before**2 + acc_z_data_before**2)
                 
-                # Calculate stats
-                acc_magnitude_sd_before = np.std(acc_magnitude_before)
-                acc_magnitude_mean_before = np.mean(acc_magnitude_before)   
-                acc_magnitude_median_before = np.median(acc_magnitude_before)
-                acc_magnitude_min_before = np.min(acc_magnitude_before)
-                acc_magnitude_max_before = np.max(acc_magnitude_before)
-                acc_magnitude_range_before = acc_magnitude_max_before - acc_magnitude_min_before
-                acc_magnitude_1q_before = np.percentile(acc_magnitude_before, 25)
-                acc_magnitude_3q_before = np.percentile(acc_magnitude_before, 75)
-                acc_magnitude_iqr_before = acc_magnitude_3q_before - acc_magnitude_1q_before
+                windows[("acc_magnitude", "before")] = acc_magnitude_before
                 
                 # Get the difference between the end of the relaxation session and the start of the measurement session
                 end_of_relax = int((end_timestamp - start).total_seconds()) * 32
                 # Get the data points from the database with the slice of the beginning and end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, acc_x))
-                acc_x_data_during = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, acc_y))
-                acc_y_data_during = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (start_of_relax, end_of_relax, acc_z))
-                acc_z_data_during = cursor.fetchone()[0]
+                acc_x_data_during = conn.get_data_from_measure_session_with_index(acc_x, start_of_relax, end_of_relax)
+                acc_y_data_during = conn.get_data_from_measure_session_with_index(acc_y, start_of_relax, end_of_relax)
+                acc_z_data_during = conn.get_data_from_measure_session_with_index(acc_z, start_of_relax, end_of_relax)
                 
                 # Calculate vectors of magnitude
                 acc_x_data_during = np.array(acc_x_data_during)
@@ -474,26 +309,14 @@ def calculate_stats_for_relax_session(relax_session):
                 acc_z_data_during = np.array(acc_z_data_during)
                 acc_magnitude_during = np.sqrt(acc_x_data_during**2 + acc_y_data_during**2 + acc_z_data_during**2)
                 
-                # Calculate stats
-                acc_magnitude_sd_during = np.std(acc_magnitude_during)
-                acc_magnitude_mean_during = np.mean(acc_magnitude_during)
-                acc_magnitude_median_during = np.median(acc_magnitude_during)
-                acc_magnitude_min_during = np.min(acc_magnitude_during)
-                acc_magnitude_max_during = np.max(acc_magnitude_during)
-                acc_magnitude_range_during = acc_magnitude_max_during - acc_magnitude_min_during
-                acc_magnitude_1q_during = np.percentile(acc_magnitude_during, 25)
-                acc_magnitude_3q_during = np.percentile(acc_magnitude_during, 75)
-                acc_magnitude_iqr_during = acc_magnitude_3q_during - acc_magnitude_1q_during
+                windows[("acc_magnitude", "during")] = acc_magnitude_during
                 
                 # Add 5 minutes to the end of the relaxation session
                 plus_5_mins = end_of_relax + (300 * 32)
                 # Get the data points from the database with the slice of the end of the relaxation session
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, acc_x))
-                acc_x_data_after = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, acc_y))
-                acc_y_data_after = cursor.fetchone()[0]
-                cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s", (end_of_relax, plus_5_mins, acc_z))
-                acc_z_data_after = cursor.fetchone()[0]
+                acc_x_data_after = conn.get_data_from_measure_session_with_index(acc_x, end_of_relax, plus_5_mins)
+                acc_y_data_after = conn.get_data_from_measure_session_with_index(acc_y, end_of_relax, plus_5_mins)
+                acc_z_data_after = conn.get_data_from_measure_session_with_index(acc_z, end_of_relax, plus_5_mins)
                 
                 # Calculate vectors of magnitude
                 acc_x_data_after = np.array(acc_x_data_after)
@@ -501,19 +324,12 @@ def calculate_stats_for_relax_session(relax_session):
                 acc_z_data_after = np.array(acc_z_data_after)
                 acc_magnitude_after = np.sqrt(acc_x_data_after**2 + acc_y_data_after**2 + acc_z_data_after**2)
                 
-                # Calculate stats
-                acc_magnitude_sd_after = np.std(acc_magnitude_after)
-                acc_magnitude_mean_after = np.mean(acc_magnitude_after)
-                acc_magnitude_median_after = np.median(acc_magnitude_after)
-                acc_magnitude_min_after = np.min(acc_magnitude_after)
-                acc_magnitude_max_after = np.max(acc_magnitude_after)
-                acc_magnitude_range_after = acc_magnitude_max_after - acc_magnitude_min_after
-                acc_magnitude_1q_after = np.percentile(acc_magnitude_after, 25)
-                acc_magnitude_3q_after = np.percentile(acc_magnitude_after, 75)
-                acc_magnitude_iqr_after = acc_magnitude_3q_after - acc_magnitude_1q_after
+                windows[("acc_magnitude", "after")] = acc_magnitude_after
 
     print(f"Stats for {relax_session[0]} calculated.")
     if acc_x and acc_y and acc_z and bvp and eda and hr and temp:
+        window_stats = describe_windows(windows)
+
         # Create a DataFrame with the stats
         stats = {
             "patient_id": patient_id,
@@ -535,206 +351,206 @@ def calculate_stats_for_relax_session(relax_session):
             "Q_kalm_eind": kalm_eind,
             
             "HR_id": hr,
-            "HR_sd_before": hr_sd_before,
-            "HR_sd_during": hr_sd_during,
-            "HR_sd_after": hr_sd_after,
-            "HR_mean_before": hr_mean_before,
-            "HR_mean_during": hr_mean_during,
-            "HR_mean_after": hr_mean_after,
-            "HR_median_before": hr_median_before,
-            "HR_median_during": hr_median_during,
-            "HR_median_after": hr_median_after,
-            "HR_min_before": hr_min_before,
-            "HR_min_during": hr_min_during,
-            "HR_min_after": hr_min_after,
-            "HR_max_before": hr_max_before,
-            "HR_max_during": hr_max_during,
-            "HR_max_after": hr_max_after,
-            "HR_range_before": hr_range_before,
-            "HR_range_during": hr_range_during,
-            "HR_range_after": hr_range_after,
-            "HR_1q_before": hr_1q_before,
-            "HR_1q_during": hr_1q_during,
-            "HR_1q_after": hr_1q_after,
-            "HR_3q_before": hr_3q_before,
-            "HR_3q_during": hr_3q_during,
-            "HR_3q_after": hr_3q_after,
-            "HR_iqr_before": hr_iqr_before,
-            "HR_iqr_during": hr_iqr_during,
-            "HR_iqr_after": hr_iqr_after,
+            "HR_sd_before": window_stats["hr_sd_before"],
+            "HR_sd_during": window_stats["hr_sd_during"],
+            "HR_sd_after": window_stats["hr_sd_after"],
+            "HR_mean_before": window_stats["hr_mean_before"],
+            "HR_mean_during": window_stats["hr_mean_during"],
+            "HR_mean_after": window_stats["hr_mean_after"],
+            "HR_median_before": window_stats["hr_median_before"],
+            "HR_median_during": window_stats["hr_median_during"],
+            "HR_median_after": window_stats["hr_median_after"],
+            "HR_min_before": window_stats["hr_min_before"],
+            "HR_min_during": window_stats["hr_min_during"],
+            "HR_min_after": window_stats["hr_min_after"],
+            "HR_max_before": window_stats["hr_max_before"],
+            "HR_max_during": window_stats["hr_max_during"],
+            "HR_max_after": window_stats["hr_max_after"],
+            "HR_range_before": window_stats["hr_range_before"],
+            "HR_range_during": window_stats["hr_range_during"],
+            "HR_range_after": window_stats["hr_range_after"],
+            "HR_1q_before": window_stats["hr_1q_before"],
+            "HR_1q_during": window_stats["hr_1q_during"],
+            "HR_1q_after": window_stats["hr_1q_after"],
+            "HR_3q_before": window_stats["hr_3q_before"],
+            "HR_3q_during": window_stats["hr_3q_during"],
+            "HR_3q_after": window_stats["hr_3q_after"],
+            "HR_iqr_before": window_stats["hr_iqr_before"],
+            "HR_iqr_during": window_stats["hr_iqr_during"],
+            "HR_iqr_after": window_stats["hr_iqr_after"],
             
             "BVP_id": bvp,
-            "BVP_sd_before": bvp_sd_before,
-            "BVP_sd_during": bvp_sd_during,
-            "BVP_sd_after": bvp_sd_after,
-            "BVP_mean_before": bvp_mean_before,
-            "BVP_mean_during": bvp_mean_during,
-            "BVP_mean_after": bvp_mean_after,
-            "BVP_median_before": bvp_median_before,
-            "BVP_median_during": bvp_median_during,
-            "BVP_median_after": bvp_median_after,
-            "BVP_min_before": bvp_min_before,
-            "BVP_min_during": bvp_min_during,
-            "BVP_min_after": bvp_min_after,
-            "BVP_max_before": bvp_max_before,
-            "BVP_max_during": bvp_max_during,
-            "BVP_max_after": bvp_max_after,
-            "BVP_range_before": bvp_range_before,
-            "BVP_range_during": bvp_range_during,
-            "BVP_range_after": bvp_range_after,
-            "BVP_1q_before": bvp_1q_before,
-            "BVP_1q_during": bvp_1q_during,
-            "BVP_1q_after": bvp_1q_after,
-            "BVP_3q_before": bvp_3q_before,
-            "BVP_3q_during": bvp_3q_during,
-            "BVP_3q_after": bvp_3q_after,
-            "BVP_iqr_before": bvp_iqr_before,
-            "BVP_iqr_during": bvp_iqr_during,
-            "BVP_iqr_after": bvp_iqr_after,
+            "BVP_sd_before": window_stats["bvp_sd_before"],
+            "BVP_sd_during": window_stats["bvp_sd_during"],
+            "BVP_sd_after": window_stats["bvp_sd_after"],
+            "BVP_mean_before": window_stats["bvp_mean_before"],
+            "BVP_mean_during": window_stats["bvp_mean_during"],
+            "BVP_mean_after": window_stats["bvp_mean_after"],
+            "BVP_median_before": window_stats["bvp_median_before"],
+            "BVP_median_during": window_stats["bvp_median_during"],
+            "BVP_median_after": window_stats["bvp_median_after"],
+            "BVP_min_before": window_stats["bvp_min_before"],
+            "BVP_min_during": window_stats["bvp_min_during"],
+            "BVP_min_after": window_stats["bvp_min_after"],
+            "BVP_max_before": window_stats["bvp_max_before"],
+            "BVP_max_during": window_stats["bvp_max_during"],
+            "BVP_max_after": window_stats["bvp_max_after"],
+            "BVP_range_before": window_stats["bvp_range_before"],
+            "BVP_range_during": window_stats["bvp_range_during"],
+            "BVP_range_after": window_stats["bvp_range_after"],
+            "BVP_1q_before": window_stats["bvp_1q_before"],
+            "BVP_1q_during": window_stats["bvp_1q_during"],
+            "BVP_1q_after": window_stats["bvp_1q_after"],
+            "BVP_3q_before": window_stats["bvp_3q_before"],
+            "BVP_3q_during": window_stats["bvp_3q_during"],
+            "BVP_3q_after": window_stats["bvp_3q_after"],
+            "BVP_iqr_before": window_stats["bvp_iqr_before"],
+            "BVP_iqr_during": window_stats["bvp_iqr_during"],
+            "BVP_iqr_after": window_stats["bvp_iqr_after"],
 
             "TEMP_id": temp,
-            "TEMP_sd_before": temp_sd_before,
-            "TEMP_sd_during": temp_sd_during,
-            "TEMP_sd_after": temp_sd_after,
-            "TEMP_mean_before": temp_mean_before,
-            "TEMP_mean_during": temp_mean_during,
-            "TEMP_mean_after": temp_mean_after,
-            "TEMP_median_before": temp_median_before,
-            "TEMP_median_during": temp_median_during,
-            "TEMP_median_after": temp_median_after,
-            "TEMP_min_before": temp_min_before,
-            "TEMP_min_during": temp_min_during,
-            "TEMP_min_after": temp_min_after,
-            "TEMP_max_before": temp_max_before,
-            "TEMP_max_during": temp_max_during,
-            "TEMP_max_after": temp_max_after,
-            "TEMP_range_before": temp_range_before,
-            "TEMP_range_during": temp_range_during,
-            "TEMP_range_after": temp_range_after,
-            "TEMP_1q_before": temp_1q_before,
-            "TEMP_1q_during": temp_1q_during,
-            "TEMP_1q_after": temp_1q_after,
-            "TEMP_3q_before": temp_3q_before,
-            "TEMP_3q_during": temp_3q_during,
-            "TEMP_3q_after": temp_3q_after,
-            "TEMP_iqr_before": temp_iqr_before,
-            "TEMP_iqr_during": temp_iqr_during,
-            "TEMP_iqr_after": temp_iqr_after,
+            "TEMP_sd_before": window_stats["temp_sd_before"],
+            "TEMP_sd_during": window_stats["temp_sd_during"],
+            "TEMP_sd_after": window_stats["temp_sd_after"],
+            "TEMP_mean_before": window_stats["temp_mean_before"],
+            "TEMP_mean_during": window_stats["temp_mean_during"],
+            "TEMP_mean_after": window_stats["temp_mean_after"],
+            "TEMP_median_before": window_stats["temp_median_before"],
+            "TEMP_median_during": window_stats["temp_median_during"],
+            "TEMP_median_after": window_stats["temp_median_after"],
+            "TEMP_min_before": window_stats["temp_min_before"],
+            "TEMP_min_during": window_stats["temp_min_during"],
+            "TEMP_min_after": window_stats["temp_min_after"],
+            "TEMP_max_before": window_stats["temp_max_before"],
+            "TEMP_max_during": window_stats["temp_max_during"],
+            "TEMP_max_after": window_stats["temp_max_after"],
+            "TEMP_range_before": window_stats["temp_range_before"],
+            "TEMP_range_during": window_stats["temp_range_during"],
+            "TEMP_range_after": window_stats["temp_range_after"],
+            "TEMP_1q_before": window_stats["temp_1q_before"],
+            "TEMP_1q_during": window_stats["temp_1q_during"],
+            "TEMP_1q_after": window_stats["temp_1q_after"],
+            "TEMP_3q_before": window_stats["temp_3q_before"],
+            "TEMP_3q_during": window_stats["temp_3q_during"],
+            "TEMP_3q_after": window_stats["temp_3q_after"],
+            "TEMP_iqr_before": window_stats["temp_iqr_before"],
+            "TEMP_iqr_during": window_stats["temp_iqr_during"],
+            "TEMP_iqr_after": window_stats["temp_iqr_after"],
 
             "VM_id": f"{acc_x}_{acc_y}_{acc_z}",
-            "VM_sd_before": acc_magnitude_sd_before,
-            "VM_sd_during": acc_magnitude_sd_during,
-            "VM_sd_after": acc_magnitude_sd_after,
-            "VM_mean_before": acc_magnitude_mean_before,
-            "VM_mean_during": acc_magnitude_mean_during,
-            "VM_mean_after": acc_magnitude_mean_after,
-            "VM_median_before": acc_magnitude_median_before,
-            "VM_median_during": acc_magnitude_median_during,
-            "VM_median_after": acc_magnitude_median_after,
-            "VM_min_before": acc_magnitude_min_before,
-            "VM_min_during": acc_magnitude_min_during,
-            "VM_min_after": acc_magnitude_min_after,
-            "VM_max_before": acc_magnitude_max_before,
-            "VM_max_during": acc_magnitude_max_during,
-            "VM_max_after": acc_magnitude_max_after,
-            "VM_range_before": acc_magnitude_range_before,
-            "VM_range_during": acc_magnitude_range_during,
-            "VM_range_after": acc_magnitude_range_after,
-            "VM_1q_before": acc_magnitude_1q_before,
-            "VM_1q_during": acc_magnitude_1q_during,
-            "VM_1q_after": acc_magnitude_1q_after,
-            "VM_3q_before": acc_magnitude_3q_before,
-            "VM_3q_during": acc_magnitude_3q_during,
-            "VM_3q_after": acc_magnitude_3q_after,
-            "VM_iqr_before": acc_magnitude_iqr_before,
-            "VM_iqr_during": acc_magnitude_iqr_during,
-            "VM_iqr_after": acc_magnitude_iqr_after,
+            "VM_sd_before": window_stats["acc_magnitude_sd_before"],
+            "VM_sd_during": window_stats["acc_magnitude_sd_during"],
+            "VM_sd_after": window_stats["acc_magnitude_sd_after"],
+            "VM_mean_before": window_stats["acc_magnitude_mean_before"],
+            "VM_mean_during": window_stats["acc_magnitude_mean_during"],
+            "VM_mean_after": window_stats["acc_magnitude_mean_after"],
+            "VM_median_before": window_stats["acc_magnitude_median_before"],
+            "VM_median_during": window_stats["acc_magnitude_median_during"],
+            "VM_median_after": window_stats["acc_magnitude_median_after"],
+            "VM_min_before": window_stats["acc_magnitude_min_before"],
+            "VM_min_during": window_stats["acc_magnitude_min_during"],
+            "VM_min_after": window_stats["acc_magnitude_min_after"],
+            "VM_max_before": window_stats["acc_magnitude_max_before"],
+            "VM_max_during": window_stats["acc_magnitude_max_during"],
+            "VM_max_after": window_stats["acc_magnitude_max_after"],
+            "VM_range_before": window_stats["acc_magnitude_range_before"],
+            "VM_range_during": window_stats["acc_magnitude_range_during"],
+            "VM_range_after": window_stats["acc_magnitude_range_after"],
+            "VM_1q_before": window_stats["acc_magnitude_1q_before"],
+            "VM_1q_during": window_stats["acc_magnitude_1q_during"],
+            "VM_1q_after": window_stats["acc_magnitude_1q_after"],
+            "VM_3q_before": window_stats["acc_magnitude_3q_before"],
+            "VM_3q_during": window_stats["acc_magnitude_3q_during"],
+            "VM_3q_after": window_stats["acc_magnitude_3q_after"],
+            "VM_iqr_before": window_stats["acc_magnitude_iqr_before"],
+            "VM_iqr_during": window_stats["acc_magnitude_iqr_during"],
+            "VM_iqr_after": window_stats["acc_magnitude_iqr_after"],
             
             "EDA_id": eda,
-            "EDA_sd_before": eda_sd_before,
-            "EDA_sd_during": eda_sd_during,
-            "EDA_sd_after": eda_sd_after,
-            "EDA_mean_before": eda_mean_before,
-            "EDA_mean_during": eda_mean_during,
-            "EDA_mean_after": eda_mean_after,
-            "EDA_median_before": eda_median_before,
-            "EDA_median_during": eda_median_during,
-            "EDA_median_after": eda_median_after,
-            "EDA_min_before": eda_min_before,
-            "EDA_min_during": eda_min_during,
-            "EDA_min_after": eda_min_after,
-            "EDA_max_before": eda_max_before,
-            "EDA_max_during": eda_max_during,
-            "EDA_max_after": eda_max_after,
-            "EDA_range_before": eda_range_before,
-            "EDA_range_during": eda_range_during,
-            "EDA_range_after": eda_range_after,
-            "EDA_1q_before": eda_1q_before,
-            "EDA_1q_during": eda_1q_during,
-            "EDA_1q_after": eda_1q_after,
-            "EDA_3q_before": eda_3q_before,
-            "EDA_3q_during": eda_3q_during,
-            "EDA_3q_after": eda_3q_after,
-            "EDA_iqr_before": eda_iqr_before,
-            "EDA_iqr_during": eda_iqr_during,
-            "EDA_iqr_after": eda_iqr_after,
-            "EDA_SCL_sd_before": eda_scl_sd_before,
-            "EDA_SCL_sd_during": eda_scl_sd_during,
-            "EDA_SCL_sd_after": eda_scl_sd_after,
-            "EDA_SCL_mean_before": eda_scl_mean_before,
-            "EDA_SCL_mean_during": eda_scl_mean_during,
-            "EDA_SCL_mean_after": eda_scl_mean_after,
-            "EDA_SCL_median_before": eda_scl_median_before,
-            "EDA_SCL_median_during": eda_scl_median_during,
-            "EDA_SCL_median_after": eda_scl_median_after,
-            "EDA_SCL_min_before": eda_scl_min_before,
-            "EDA_SCL_min_during": eda_scl_min_during,
-            "EDA_SCL_min_after": eda_scl_min_after,
-            "EDA_SCL_max_before": eda_scl_max_before,
-            "EDA_SCL_max_during": eda_scl_max_during,
-            "EDA_SCL_max_after": eda_scl_max_after,
-            "EDA_SCL_range_before": eda_scl_range_before,
-            "EDA_SCL_range_during": eda_scl_range_during,
-            "EDA_SCL_range_after": eda_scl_range_after,
-            "EDA_SCL_1q_before": eda_scl_1q_before,
-            "EDA_SCL_1q_during": eda_scl_1q_during,
-            "EDA_SCL_1q_after": eda_scl_1q_after,
-            "EDA_SCL_3q_before": eda_scl_3q_before,
-            "EDA_SCL_3q_during": eda_scl_3q_during,
-            "EDA_SCL_3q_after": eda_scl_3q_after,
-            "EDA_SCL_iqr_before": eda_scl_iqr_before,
-            "EDA_SCL_iqr_during": eda_scl_iqr_during,
-            "EDA_SCL_iqr_after": eda_scl_iqr_after,
+            "EDA_sd_before": window_stats["eda_sd_before"],
+            "EDA_sd_during": window_stats["eda_sd_during"],
+            "EDA_sd_after": window_stats["eda_sd_after"],
+            "EDA_mean_before": window_stats["eda_mean_before"],
+            "EDA_mean_during": window_stats["eda_mean_during"],
+            "EDA_mean_after": window_stats["eda_mean_after"],
+            "EDA_median_before": window_stats["eda_median_before"],
+            "EDA_median_during": window_stats["eda_median_during"],
+            "EDA_median_after": window_stats["eda_median_after"],
+            "EDA_min_before": window_stats["eda_min_before"],
+            "EDA_min_during": window_stats["eda_min_during"],
+            "EDA_min_after": window_stats["eda_min_after"],
+            "EDA_max_before": window_stats["eda_max_before"],
+            "EDA_max_during": window_stats["eda_max_during"],
+            "EDA_max_after": window_stats["eda_max_after"],
+            "EDA_range_before": window_stats["eda_range_before"],
+            "EDA_range_during": window_stats["eda_range_during"],
+            "EDA_range_after": window_stats["eda_range_after"],
+            "EDA_1q_before": window_stats["eda_1q_before"],
+            "EDA_1q_during": window_stats["eda_1q_during"],
+            "EDA_1q_after": window_stats["eda_1q_after"],
+            "EDA_3q_before": window_stats["eda_3q_before"],
+            "EDA_3q_during": window_stats["eda_3q_during"],
+            "EDA_3q_after": window_stats["eda_3q_after"],
+            "EDA_iqr_before": window_stats["eda_iqr_before"],
+            "EDA_iqr_during": window_stats["eda_iqr_during"],
+            "EDA_iqr_after": window_stats["eda_iqr_after"],
+            "EDA_SCL_sd_before": window_stats["eda_scl_sd_before"],
+            "EDA_SCL_sd_during": window_stats["eda_scl_sd_during"],
+            "EDA_SCL_sd_after": window_stats["eda_scl_sd_after"],
+            "EDA_SCL_mean_before": window_stats["eda_scl_mean_before"],
+            "EDA_SCL_mean_during": window_stats["eda_scl_mean_during"],
+            "EDA_SCL_mean_after": window_stats["eda_scl_mean_after"],
+            "EDA_SCL_median_before": window_stats["eda_scl_median_before"],
+            "EDA_SCL_median_during": window_stats["eda_scl_median_during"],
+            "EDA_SCL_median_after": window_stats["eda_scl_median_after"],
+            "EDA_SCL_min_before": window_stats["eda_scl_min_before"],
+            "EDA_SCL_min_during": window_stats["eda_scl_min_during"],
+            "EDA_SCL_min_after": window_stats["eda_scl_min_after"],
+            "EDA_SCL_max_before": window_stats["eda_scl_max_before"],
+            "EDA_SCL_max_during": window_stats["eda_scl_max_during"],
+            "EDA_SCL_max_after": window_stats["eda_scl_max_after"],
+            "EDA_SCL_range_before": window_stats["eda_scl_range_before"],
+            "EDA_SCL_range_during": window_stats["eda_scl_range_during"],
+            "EDA_SCL_range_after": window_stats["eda_scl_range_after"],
+            "EDA_SCL_1q_before": window_stats["eda_scl_1q_before"],
+            "EDA_SCL_1q_during": window_stats["eda_scl_1q_during"],
+            "EDA_SCL_1q_after": window_stats["eda_scl_1q_after"],
+            "EDA_SCL_3q_before": window_stats["eda_scl_3q_before"],
+            "EDA_SCL_3q_during": window_stats["eda_scl_3q_during"],
+            "EDA_SCL_3q_after": window_stats["eda_scl_3q_after"],
+            "EDA_SCL_iqr_before": window_stats["eda_scl_iqr_before"],
+            "EDA_SCL_iqr_during": window_stats["eda_scl_iqr_during"],
+            "EDA_SCL_iqr_after": window_stats["eda_scl_iqr_after"],
             "EDA_SCR_peaks_before": eda_scr_peaks_before,
             "EDA_SCR_peaks_during": eda_scr_peaks_during,
             "EDA_SCR_peaks_after": eda_scr_peaks_after,
-            "EDA_SCR_amplitude_sd_before": eda_scr_amplitude_sd_before,
-            "EDA_SCR_amplitude_sd_during": eda_scr_amplitude_sd_during,
-            "EDA_SCR_amplitude_sd_after": eda_scr_amplitude_sd_after,
-            "EDA_SCR_amplitude_mean_before": eda_scr_amplitude_mean_before,
-            "EDA_SCR_amplitude_mean_during": eda_scr_amplitude_mean_during,
-            "EDA_SCR_amplitude_mean_after": eda_scr_amplitude_mean_after,
-            "EDA_SCR_amplitude_median_before": eda_scr_amplitude_median_before,
-            "EDA_SCR_amplitude_median_during": eda_scr_amplitude_median_during,
-            "EDA_SCR_amplitude_median_after": eda_scr_amplitude_median_after,
-            "EDA_SCR_amplitude_min_before": eda_scr_amplitude_min_before,
-            "EDA_SCR_amplitude_min_during": eda_scr_amplitude_min_during,
-            "EDA_SCR_amplitude_min_after": eda_scr_amplitude_min_after,
-            "EDA_SCR_amplitude_max_before": eda_scr_amplitude_max_before,
-            "EDA_SCR_amplitude_max_during": eda_scr_amplitude_max_during,
-            "EDA_SCR_amplitude_max_after": eda_scr_amplitude_max_after,
-            "EDA_SCR_amplitude_range_before": eda_scr_amplitude_range_before,
-            "EDA_SCR_amplitude_range_during": eda_scr_amplitude_range_during,
-            "EDA_SCR_amplitude_range_after": eda_scr_amplitude_range_after,
-            "EDA_SCR_amplitude_1q_before": eda_scr_amplitude_1q_before,
-            "EDA_SCR_amplitude_1q_during": eda_scr_amplitude_1q_during,
-            "EDA_SCR_amplitude_1q_after": eda_scr_amplitude_1q_after,
-            "EDA_SCR_amplitude_3q_before": eda_scr_amplitude_3q_before,
-            "EDA_SCR_amplitude_3q_during": eda_scr_amplitude_3q_during,
-            "EDA_SCR_amplitude_3q_after": eda_scr_amplitude_3q_after,
-            "EDA_SCR_amplitude_iqr_before": eda_scr_amplitude_iqr_before,
-            "EDA_SCR_amplitude_iqr_during": eda_scr_amplitude_iqr_during,
-            "EDA_SCR_amplitude_iqr_after": eda_scr_amplitude_iqr_after
+            "EDA_SCR_amplitude_sd_before": window_stats["eda_scr_amplitude_sd_before"],
+            "EDA_SCR_amplitude_sd_during": window_stats["eda_scr_amplitude_sd_during"],
+            "EDA_SCR_amplitude_sd_after": window_stats["eda_scr_amplitude_sd_after"],
+            "EDA_SCR_amplitude_mean_before": window_stats["eda_scr_amplitude_mean_before"],
+            "EDA_SCR_amplitude_mean_during": window_stats["eda_scr_amplitude_mean_during"],
+            "EDA_SCR_amplitude_mean_after": window_stats["eda_scr_amplitude_mean_after"],
+            "EDA_SCR_amplitude_median_before": window_stats["eda_scr_amplitude_median_before"],
+            "EDA_SCR_amplitude_median_during": window_stats["eda_scr_amplitude_median_during"],
+            "EDA_SCR_amplitude_median_after": window_stats["eda_scr_amplitude_median_after"],
+            "EDA_SCR_amplitude_min_before": window_stats["eda_scr_amplitude_min_before"],
+            "EDA_SCR_amplitude_min_during": window_stats["eda_scr_amplitude_min_during"],
+            "EDA_SCR_amplitude_min_after": window_stats["eda_scr_amplitude_min_after"],
+            "EDA_SCR_amplitude_max_before": window_stats["eda_scr_amplitude_max_before"],
+            "EDA_SCR_amplitude_max_during": window_stats["eda_scr_amplitude_max_during"],
+            "EDA_SCR_amplitude_max_after": window_stats["eda_scr_amplitude_max_after"],
+            "EDA_SCR_amplitude_range_before": window_stats["eda_scr_amplitude_range_before"],
+            "EDA_SCR_amplitude_range_during": window_stats["eda_scr_amplitude_range_during"],
+            "EDA_SCR_amplitude_range_after": window_stats["eda_scr_amplitude_range_after"],
+            "EDA_SCR_amplitude_1q_before": window_stats["eda_scr_amplitude_1q_before"],
+            "EDA_SCR_amplitude_1q_during": window_stats["eda_scr_amplitude_1q_during"],
+            "EDA_SCR_amplitude_1q_after": window_stats["eda_scr_amplitude_1q_after"],
+            "EDA_SCR_amplitude_3q_before": window_stats["eda_scr_amplitude_3q_before"],
+            "EDA_SCR_amplitude_3q_during": window_stats["eda_scr_amplitude_3q_during"],
+            "EDA_SCR_amplitude_3q_after": window_stats["eda_scr_amplitude_3q_after"],
+            "EDA_SCR_amplitude_iqr_before": window_stats["eda_scr_amplitude_iqr_before"],
+            "EDA_SCR_amplitude_iqr_during": window_stats["eda_scr_amplitude_iqr_during"],
+            "EDA_SCR_amplitude_iqr_after": window_stats["eda_scr_amplitude_iqr_after"]
         }
         
 
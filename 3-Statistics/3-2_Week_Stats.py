@@ -14,7 +14,7 @@ def filter_week_data_by_patient(patient):
     Returns:
         Two dictionaries containing the timestamps of E4 sessions for Week 1 and Week 2.
     """
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
     cursor = conn.conn.cursor()
 
     week1_timestamp_dict = {}
@@ -62,7 +62,7 @@ def calculate_weekly_stats(week_measurement_list):
     Returns:
         A dictionary with calculated statistics.
     """
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
     cursor = conn.conn.cursor()
     
     # Initialize statistics
@@ -77,7 +77,7 @@ def calculate_weekly_stats(week_measurement_list):
         measurement_type = measurement_id.split("_")[-1]
         if measurement_type == 'HR':
             # Get all sessions for this measurement
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             all_hr_data = []
             for session in sessions:
@@ -99,7 +99,7 @@ def calculate_weekly_stats(week_measurement_list):
 
         elif measurement_type == 'EDA':
             # Get all sessions for this measurement
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             all_eda_data = []
             for session in sessions:
@@ -149,7 +149,7 @@ def calculate_weekly_stats(week_measurement_list):
 
         elif measurement_type == 'BVP':
             # Get all sessions for this measurement
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             all_bvp_data = []
             for session in sessions:
@@ -171,7 +171,7 @@ def calculate_weekly_stats(week_measurement_list):
 
         elif measurement_type == 'TEMP':
             # Get all sessions for this measurement
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             all_temp_data = []
             for session in sessions:
@@ -192,7 +192,7 @@ def calculate_weekly_stats(week_measurement_list):
             week_stats.temp_iqr = week_stats.temp_3q - week_stats.temp_1q
 
         elif measurement_type == "X":
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             for session in sessions:
                 session_id, data = session
@@ -201,7 +201,7 @@ def calculate_weekly_stats(week_measurement_list):
                     data = [sublist[1] for sublist in data]
                 sessions_x.extend(data)
         elif measurement_type == "Y":
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             for session in sessions:
                 session_id, data = session
@@ -210,7 +210,7 @@ def calculate_weekly_stats(week_measurement_list):
                     data = [sublist[1] for sublist in data]
                 sessions_y.extend(data)
         elif measurement_type == "Z":
-            cursor.execute("SELECT id, data FROM measure_session WHERE measurement_id = %s order by start_timestamp", (measurement_id,))
+            cursor.execute(f"SELECT ms.id, {connect.SESSION_DATA} FROM measure_session ms WHERE ms.measurement_id = %s order by ms.start_timestamp", (measurement_id,))
             sessions = cursor.fetchall()
             for session in sessions:
                 session_id, data = session
@@ -1,7 +1,7 @@
 from dataclasses import dataclass
 from typing import List, Literal, Tuple, Type, Dict
 from datetime import datetime, timedelta
-from RXLDBC import connect
+from RXLDBC import connect, ibi, overlap, runner, stats
 
 import pandas as pd
 import numpy as np
@@ -9,6 +9,9 @@ import neurokit2 as nk
 
 MEASUREMENT_TYPES = Literal["IBI", "EDA", "EDA_scl", "EDA_scr", "BVP", "VM", "TEMP", "HR"]
 
+# Seconds a single relax session may take before its worker is killed
+SESSION_TIMEOUT = 600
+
 @dataclass
 class MinuteData:
     """
@@ -18,13 +21,13 @@ class MinuteData:
     end_timestamp: datetime = None
     minute: int = None
     period : int = None
-    hr_data: List[float] = None
-    bvp_data: List[float] = None
-    temp_data: List[float] = None
-    acc_x_data: List[float] = None
-    acc_y_data: List[float] = None
-    acc_z_data: List[float] = None
-    eda_data: List[float] = None
+    hr_data: np.ndarray = None
+    bvp_data: np.ndarray = None
+    temp_data: np.ndarray = None
+    acc_x_data: np.ndarray = None
+    acc_y_data: np.ndarray = None
+    acc_z_data: np.ndarray = None
+    eda_data: np.ndarray = None
     ibi_data: List[float] = None
     ibi_time_data: List[float] = None
 
@@ -88,6 +91,12 @@ class SessionData:
     ibi: DataTimestamp = None
 
 
+def has_data(data) -> bool:
+    """
+    Check whether a list or array of data points is present and not empty.
+    """
+    return data is not None and len(data) > 0
+
 def calculate_regular_stats(data: List,
                             measurement_type: MEASUREMENT_TYPES) -> pd.DataFrame:
     """
@@ -99,24 +108,12 @@ def calculate_regular_stats(data: List,
         DataFrame containing the calculated statistics.
     """
 
-    stats = {
-        f"{measurement_type}_std": np.std(data),
-        f"{measurement_type}_mean": np.mean(data),
-        f"{measurement_type}_median": np.median(data),
-        f"{measurement_type}_min": np.min(data),
-        f"{measurement_type}_max": np.max(data),
-        f"{measurement_type}_range": np.max(data) - np.min(data),
-        f"{measurement_type}_var": np.var(data),
-        f"{measurement_type}_1q": np.percentile(data, 25),
-        f"{measurement_type}_3q": np.percentile(data, 75),
-        f"{measurement_type}_iqr": np.percentile(data, 75) - np.percentile(data, 25)}
-
-    return pd.DataFrame([stats])
+    return pd.DataFrame(stats.describe_many([data], measurement_type))
 
-def calculate_eda_stats(data: List[float]) -> pd.DataFrame:
+def calculate_eda_stats(data: np.ndarray) -> pd.DataFrame:
     """
     Calculate EDA statistics for a given period.
-    :param data: List of EDA data points.
+    :param data: Array of EDA data points.
     :return: pd.DataFrame
         DataFrame containing the calculated EDA statistics.
     """
@@ -125,7 +122,7 @@ def calculate_eda_stats(data: List[float]) -> pd.DataFrame:
     eda_stats = calculate_regular_stats(data, "EDA")
 
     # Ensure data is a 1D array
-    data = np.array(data).ravel()
+    data = np.ravel(data)
 
     # If the array only contains zeros, return empty statistics
     if np.all(data == 0):
@@ -164,7 +161,8 @@ def calculate_ibi_stats(ibi_data: List[float],
 
 def calculate_minute_stats(minute_data: MinuteData) -> MinuteStats:
     """
-    Calculate statistics for a minute of measurement data.
+    Calculate the EDA and IBI statistics for a minute of measurement data, the regular statistics of all minutes
+    are calculated at once in process_minute_data.
     :param minute_data: MinuteStats
         Object containing lists of measurement data for the minute.
     :return: MinuteStats
@@ -173,18 +171,7 @@ def calculate_minute_stats(minute_data: MinuteData) -> MinuteStats:
 
     minute_stats = MinuteStats()
 
-    if minute_data.hr_data:
-        minute_stats.hr_stats = calculate_regular_stats(minute_data.hr_data, "HR")
-    if minute_data.bvp_data:
-        minute_stats.bvp_stats = calculate_regular_stats(minute_data.bvp_data, "BVP")
-    if minute_data.temp_data:
-        minute_stats.temp_stats = calculate_regular_stats(minute_data.temp_data, "TEMP")
-    if minute_data.acc_x_data and minute_data.acc_y_data and minute_data.acc_z_data:
-        vm_data = np.sqrt(np.array(minute_data.acc_x_data) ** 2 +
-                          np.array(minute_data.acc_y_data) ** 2 +
-                          np.array(minute_data.acc_z_data) ** 2)
-        minute_stats.vm_stats = calculate_regular_stats(vm_data, "VM")
-    if minute_data.eda_data:
+    if has_data(minute_data.eda_data):
         minute_stats.eda_stats = calculate_eda_stats(minute_data.eda_data)
     if minute_data.ibi_data and minute_data.ibi_time_data:
         minute_stats.ibi_stats = calculate_ibi_stats(minute_data.ibi_data, minute_data.ibi_time_data)
@@ -203,30 +190,41 @@ def process_minute_data(minute_data: Dict[str, MinuteData]) -> pd.DataFrame:
     :return: pd.DataFrame
         DataFrame containing the calculated statistics for each minute.
     """
-    minute_stats = []
-    dataframes = []
-    for key, data in minute_data.items():
-        stats = calculate_minute_stats(data)
-        stats.start_timestamp = data.start_timestamp
-        stats.end_timestamp = data.end_timestamp
-        stats.minute = data.minute
-        stats.period = data.period
-        minute_stats.append(stats)
-
-    for stats in minute_stats:
-        stat = {
-            "start_timestamp": stats.start_timestamp,
-            "end_timestamp": stats.end_timestamp,
-            "minute": stats.minute,
-            "period": stats.period
-        }
-        df = pd.DataFrame([stat])
-        for attr in ["hr_stats", "bvp_stats", "temp_stats", "vm_stats", "eda_stats", "ibi_stats"]:
-            if getattr(stats, attr) is not None:
-                df = pd.concat([df, getattr(stats, attr)], axis=1)
-        dataframes.append(df)
-
-    combined = pd.concat(dataframes)
+    minutes = list(minute_data.values())
+    dataframes = [pd.DataFrame({
+        "start_timestamp": [data.start_timestamp for data in minutes],
+        "end_timestamp": [data.end_timestamp for data in minutes],
+        "minute": [data.minute for data in minutes],
+        "period": [data.period for data in minutes],
+    })]
+
+    vm_data = []
+    for data in minutes:
+        if has_data(data.acc_x_data) and has_data(data.acc_y_data) and has_data(data.acc_z_data):
+            vm_data.append(np.sqrt(np.array(data.acc_x_data) ** 2 +
+                                   np.array(data.acc_y_data) ** 2 +
+                                   np.array(data.acc_z_data) ** 2))
+        else:
+            vm_data.append(None)
+
+    # The regular statistics of all minutes are calculated at once per measurement type, minutes without data get NaN
+    for measurement_type, windows in (("HR", [data.hr_data for data in minutes]),
+                                      ("BVP", [data.bvp_data for data in minutes]),
+                                      ("TEMP", [data.temp_data for data in minutes]),
+                                      ("VM", vm_data)):
+        if any(has_data(window) for window in windows):
+            windows = [window if has_data(window) else [] for window in windows]
+            dataframes.append(pd.DataFrame(stats.describe_many(windows, measurement_type)))
+
+    minute_stats = [calculate_minute_stats(data) for data in minutes]
+    for attr in ["eda_stats", "ibi_stats"]:
+        if any(getattr(stat, attr) is not None for stat in minute_stats):
+            dataframes.append(pd.concat([
+                getattr(stat, attr) if getattr(stat, attr) is not None else pd.DataFrame(index=[0])
+                for stat in minute_stats
+            ], ignore_index=True))
+
+    combined = pd.concat(dataframes, axis=1)
 
     return combined
 
@@ -237,7 +235,7 @@ def calculate_relax_session_data(relax_session: Tuple[str, List[dict[str: tuple[
     :return: SessionStats object
     """
     session_stats = SessionData()
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
     cursor = conn.conn.cursor()
 
     relax_session_id, session_data = relax_session
@@ -272,26 +270,19 @@ def calculate_relax_session_data(relax_session: Tuple[str, List[dict[str: tuple[
 
     session_stats.relax_moment = relaxation_time
 
-    # Get the patient info from the database
-    cursor.execute("SELECT origin, patient_group, age, sex FROM patient WHERE id = %s", (patient_id,))
-    origin, patient_group, age, sex = cursor.fetchone()
+    # Get the patient info, the relax summary is cached with it for the other relax sessions of the patient
+    patient = conn.patient_metadata(patient_id)
 
-    session_stats.patient_origin = origin
-    session_stats.patient_group = patient_group
-    session_stats.patient_age = age
-    session_stats.patient_sex = sex
+    session_stats.patient_origin = patient.origin
+    session_stats.patient_group = patient.patient_group
+    session_stats.patient_age = patient.age
+    session_stats.patient_sex = patient.sex
 
     # Get the amount of relaxation sessions for this patient
-    cursor.execute("SELECT COUNT(*) FROM relax_session WHERE patient_id = %s", (patient_id,))
-    relax_count = cursor.fetchone()[0]
-
-    session_stats.patient_relax_count = relax_count
+    session_stats.patient_relax_count = patient.relax_count
 
     # Get the average duration of relaxation sessions for this patient in seconds
-    cursor.execute("SELECT start_timestamp, end_timestamp FROM relax_session WHERE patient_id = %s", (patient_id,))
-    relax_sessions = cursor.fetchall()
-    relax_durations = [(end - start).total_seconds() for start, end in relax_sessions]
-    avg_relax_duration = sum(relax_durations) / len(relax_durations) if relax_durations else 0
+    avg_relax_duration = patient.mean_relax_duration
 
     session_stats.patient_mean_relax_duration = avg_relax_duration
 
@@ -408,25 +399,20 @@ def find_closest_index_ibi(hr_slices: Tuple[List[int], List[int], List[int]],
     :return: Tuple
         A tuple containing three lists: slices_before, slices_during, and slices_after for IBI data.
     """
-    conn = connect.Connection()
-    cursor = conn.conn.cursor()
-
-    cursor.execute("SELECT data FROM measure_session WHERE id = %s", (ibi_id,))
-    ibi_data = cursor.fetchone()[0]
-
-    time_sequence = [entry[0] for entry in ibi_data]
+    with connect.Connection.pooled() as conn:
+        ibi_offsets = ibi.offsets(conn, ibi_id)
+    if not len(ibi_offsets):
+        return None
 
-    # Find the closest value in time_sequence for each slice in hr_slices
+    # Find the closest value in the offsets for each slice in hr_slices
     def process_slices(slices):
-        result = []
-        for slic in slices:
-            closest_index = min(range(len(time_sequence)), key=lambda i: abs(time_sequence[i] - slic))
-            if abs(time_sequence[closest_index] - slic) > 50:
-                print(
-                    f"\033[91mError: Closest IBI index for slice {slic} is more than 50 seconds away: {time_sequence[closest_index]}\033[0m")
-                return None
-            result.append(closest_index)
-        return result
+        indices, distances = ibi_offsets.nearest(slices)
+        if np.any(distances > 50):
+            far = int(np.argmax(distances > 50))
+            print(
+                f"\033[91mError: Closest IBI index for slice {slices[far]} is more than 50 seconds away: {ibi_offsets.offsets[indices[far]]}\033[0m")
+            return None
+        return indices.tolist()
 
     slices_before = process_slices(hr_slices[0])
     if slices_before is None:
@@ -446,7 +432,6 @@ def find_closest_index_ibi(hr_slices: Tuple[List[int], List[int], List[int]],
         print("\033[91Error: Duplicate indices found in IBI slices.\033[0m")
         return None
 
-    conn.close()
     return slices_before, slices_during, slices_after
 
 def get_minute_data(session_data: SessionData) -> Dict[str, MinuteData]:
@@ -458,7 +443,7 @@ def get_minute_data(session_data: SessionData) -> Dict[str, MinuteData]:
         Dictionary with minute indices as keys and MinuteData objects as values.
     """
 
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
 
     minutes = {}
 
@@ -504,6 +489,34 @@ def get_minute_data(session_data: SessionData) -> Dict[str, MinuteData]:
         else:
             ibi_slices = find_closest_index_ibi(hr_slices,
                                                 session_data.ibi.session_id)
+
+    # Fetch the whole span of every channel in one query and slice the minutes from it locally
+    channel_slices = {
+        "hr": hr_slices if session_data.hr else None,
+        "bvp": bvp_slices if session_data.bvp else None,
+        "temp": temp_slices if session_data.temp else None,
+        "acc_x": acc_x_slices if session_data.acc_x else None,
+        "acc_y": acc_y_slices if session_data.acc_y else None,
+        "acc_z": acc_z_slices if session_data.acc_z else None,
+        "eda": eda_slices if session_data.eda else None,
+        "ibi": ibi_slices if session_data.ibi and session_data.ibi.session_id and ibi_slices else None,
+    }
+    channel_slices = {channel: slices for channel, slices in channel_slices.items() if slices is not None}
+    span_starts = {channel: min(index for period in slices for index in period)
+                   for channel, slices in channel_slices.items()}
+    spans = dict(zip(channel_slices, conn.fetch_windows(
+        [(getattr(session_data, channel).session_id,
+          span_starts[channel],
+          max(index for period in slices for index in period))
+         for channel, slices in channel_slices.items()],
+        return_numpy=True)))
+
+    def minute_slice(channel, period, index):
+        if channel not in spans or spans[channel] is None:
+            return None
+        slices = channel_slices[channel]
+        return connect.slice_rows(spans[channel], slices[period][index], slices[period][index + 1], span_starts[channel])
+
     for hr_slice_index, hr_slice in enumerate(hr_slices):
         for index, slic in enumerate(hr_slices[hr_slice_index][:-1]):
             minute_data = MinuteData(
@@ -511,99 +524,36 @@ def get_minute_data(session_data: SessionData) -> Dict[str, MinuteData]:
                 end_timestamp=session_data.hr.start_timestamp + pd.Timedelta(seconds=hr_slices[hr_slice_index][index+1]),
                 minute=index,
                 period=hr_slice_index,
-                hr_data=conn.get_data_from_measure_session_with_index(session_data.hr.session_id,
-                                                                      slic,
-                                                                      hr_slices[hr_slice_index][index + 1]) if session_data.hr else None,
-                bvp_data=conn.get_data_from_measure_session_with_index(session_data.bvp.session_id,
-                                                                       bvp_slices[hr_slice_index][index],
-                                                                       bvp_slices[hr_slice_index][index + 1]) if session_data.bvp else None,
-                temp_data=conn.get_data_from_measure_session_with_index(session_data.temp.session_id,
-                                                                        temp_slices[hr_slice_index][index],
-                                                                        temp_slices[hr_slice_index][index + 1]) if session_data.temp else None,
-                acc_x_data=conn.get_data_from_measure_session_with_index(session_data.acc_x.session_id,
-                                                                         acc_x_slices[hr_slice_index][index],
-                                                                         acc_x_slices[hr_slice_index][index + 1]) if session_data.acc_x else None,
-                acc_y_data=conn.get_data_from_measure_session_with_index(session_data.acc_y.session_id,
-                                                                         acc_y_slices[hr_slice_index][index],
-                                                                         acc_y_slices[hr_slice_index][index + 1]) if session_data.acc_y else None,
-                acc_z_data=conn.get_data_from_measure_session_with_index(session_data.acc_z.session_id,
-                                                                         acc_z_slices[hr_slice_index][index],
-                                                                         acc_z_slices[hr_slice_index][index + 1]) if session_data.acc_z else None,
-                eda_data=conn.get_data_from_measure_session_with_index(session_data.eda.session_id,
-                                                                       eda_slices[hr_slice_index][index],
-                                                                       eda_slices[hr_slice_index][index + 1]) if session_data.eda else None
+                hr_data=minute_slice("hr", hr_slice_index, index),
+                bvp_data=minute_slice("bvp", hr_slice_index, index),
+                temp_data=minute_slice("temp", hr_slice_index, index),
+                acc_x_data=minute_slice("acc_x", hr_slice_index, index),
+                acc_y_data=minute_slice("acc_y", hr_slice_index, index),
+                acc_z_data=minute_slice("acc_z", hr_slice_index, index),
+                eda_data=minute_slice("eda", hr_slice_index, index)
             )
-            if session_data.ibi and ibi_slices:
-                ibi = conn.get_data_from_measure_session_with_index(session_data.ibi.session_id, ibi_slices[0][index],
-                                                                    ibi_slices[0][index + 1])
-                if ibi:
-                    minute_data.ibi_data = [round(entry[1] * 1000) for entry in ibi]
-                    minute_data.ibi_time_data = [entry[0] for entry in ibi]
+            ibi_minute = minute_slice("ibi", hr_slice_index, index)
+            if has_data(ibi_minute):
+                minute_data.ibi_data = [round(entry[1] * 1000) for entry in ibi_minute.tolist()]
+                minute_data.ibi_time_data = [entry[0] for entry in ibi_minute.tolist()]
             minutes[f"{session_data.relax_id}_{hr_slice_index}_{index}"] = minute_data
 
     conn.close()
     return minutes
 
-def filter_5min_of_e4_before_and_after_relax_sessions(e4_timestamps, relax_timestamps) -> Dict[str, List[Dict[str, Tuple[datetime, datetime]]]]:
-    conn = connect.Connection()
+def filter_5min_of_e4_before_and_after_relax_sessions(patient_id, e4_timestamps, relax_timestamps) -> Dict[str, List[Dict[str, Tuple[datetime, datetime]]]]:
+    conn = connect.Connection.pooled()
+    windows = overlap.session_windows(conn, patient_id, e4_timestamps, relax_timestamps)
+    conn.close()
+
     filtered_sessions = {}
-    for session_id, (start, end) in e4_timestamps.items():
-        for relax_id, (relax_start, relax_end) in relax_timestamps.items():
-            print(f"\033[93mChecking session {session_id} for relax session {relax_id}\033[0m")
-            if start <= relax_start - timedelta(minutes=5) and end >= relax_end + timedelta(minutes=5):
-                sample_rate = conn.get_sample_rate_from_measurement_session_id(session_id.split("_")[-1])
-                start_index = int((relax_start - start).total_seconds() * sample_rate)
-                end_index = int((relax_end - start).total_seconds() * sample_rate)
-                minus_5_mins = start_index - 5 * (60 * sample_rate)
-                plus_5_mins = end_index + 5 * (60 * sample_rate)
-                invalid_indices = conn.get_invalid_data_indices_from_measure_session(session_id.split("_")[-1])
-                if invalid_indices:
-                    total_data_points = plus_5_mins - minus_5_mins
-                    invalid_data_points = 0
-                    # Print all invalid indices
-                    print(f"Invalid indices for {session_id}: {invalid_indices}")
-                    print(f"minutes before and after the relaxation session: {minus_5_mins} to {plus_5_mins}")
-                    for invalid_index in invalid_indices:
-                        if invalid_index[0] <= minus_5_mins and invalid_index[1] <= minus_5_mins:
-                            continue
-                        elif invalid_index[0] <= minus_5_mins and invalid_index[1] >= plus_5_mins:
-                            invalid_data_points += plus_5_mins - minus_5_mins
-                        elif invalid_index[0] >= plus_5_mins and invalid_index[1] >= plus_5_mins:
-                            continue
-                        elif invalid_index[0] >= minus_5_mins and invalid_index[1] >= minus_5_mins:
-                            invalid_data_points += plus_5_mins - invalid_index[0]
-                        elif invalid_index[0] <= minus_5_mins and invalid_index[1] <= plus_5_mins:
-                            invalid_data_points += invalid_index[1] - minus_5_mins
-                        elif invalid_index[0] >= minus_5_mins and invalid_index[1] <= plus_5_mins:
-                            invalid_data_points += invalid_index[1] - invalid_index[0]
-                    print(
-                        f"Invalid data points for {session_id}: {invalid_data_points} out of {total_data_points} total data points.")
-                    print(
-                        f"Invalid data points percentage for {session_id}: {invalid_data_points / total_data_points * 100:.2f}%")
-                    if invalid_data_points / total_data_points > 0.2:
-                        # Print in blue that more than 20% of the data within 5 min before and after the relaxation session is invalid
-                        print(
-                            f"\033[94mMore than 20% of the data within 5 min before and after the relaxation session is invalid for {session_id}. Skipping...\033[0m")
-                        print(relax_id)
-                        continue
-                    else:
-                        if relax_id not in filtered_sessions:
-                            print(f"\033[92mSession {session_id} has valid data within 5 min before and after the relaxation session {relax_id}.\033[0m")
-                            filtered_sessions[relax_id] = [{session_id: (start, end)}]
-                        else:
-                            print(f"\033[92mSession {session_id} has valid data within 5 min before and after the relaxation session {relax_id}.\033[0m")
-                            filtered_sessions[relax_id].append({session_id: (start, end)})
-                else:
-                    if relax_id not in filtered_sessions:
-                        print(f"\033[92mSession {session_id} has valid data within 5 min before and after the relaxation session {relax_id}.\033[0m")
-                        filtered_sessions[relax_id] = [{session_id: (start, end)}]
-                    else:
-                        print(f"\033[92mSession {session_id} has valid data within 5 min before and after the relaxation session {relax_id}.\033[0m")
-                        filtered_sessions[relax_id].append({session_id: (start, end)})
-            else:
-                print(f"\033[91mSession {session_id} does not have 5 minutes before and after the relaxation session {relax_id}. Skipping...\033[0m")
-                if relax_id.split('_')[-1] == '25659' and session_id.split('_')[-1] == '3080':
-                    print(f"\033[91mRelax session {relax_id} has no valid data. Skipping...\033[0m")
+    for relax_id, session_windows in windows.items():
+        for window in session_windows:
+            if window.invalid_fraction > 0.2:
+                # Print in blue that more than 20% of the data within 5 min before and after the relaxation session is invalid
+                print(f"\033[94mMore than 20% of the data within 5 min before and after the relaxation session {relax_id} is invalid for {window.session_key}. Skipping...\033[0m")
+                continue
+            filtered_sessions.setdefault(relax_id, []).append({window.session_key: (window.start_timestamp, window.end_timestamp)})
 
     # Remove relax sessions that have fewer than 7 valid measurement sessions
     filtered_sessions = {relax_id: sessions for relax_id, sessions in filtered_sessions.items() if len(sessions) >= 7}
@@ -649,14 +599,20 @@ def main():
     cursor.execute("SELECT id FROM patient ORDER BY id")
     patient_ids = cursor.fetchall()
 
-    for patient_id in patient_ids:
-        patient_id = patient_id[0]
-        e4_timestamps = conn.get_all_timestamps_from_patient_id(patient_id)
-        relax_timestamps = conn.get_all_relax_sessions_from_patient_id(patient_id)
+    def relax_sessions():
+        for patient_id in patient_ids:
+            patient_id = patient_id[0]
+            e4_timestamps = conn.get_all_timestamps_from_patient_id(patient_id)
+            relax_timestamps = conn.get_all_relax_sessions_from_patient_id(patient_id)
+
+            filtered_relax_sessions = filter_5min_of_e4_before_and_after_relax_sessions(patient_id, e4_timestamps, relax_timestamps)
+            for relax_id, session_data in filtered_relax_sessions.items():
+                yield patient_id, relax_id, session_data
 
-        filtered_relax_sessions = filter_5min_of_e4_before_and_after_relax_sessions(e4_timestamps, relax_timestamps)
-        for relax_id, session_data in filtered_relax_sessions.items():
-            run(patient_id, relax_id, session_data)
+    # Every relax session writes its own CSV files, a session that hangs is killed after the timeout
+    for result in runner.run_tasks(run, relax_sessions(), timeout=SESSION_TIMEOUT):
+        if result.error is not None:
+            print(f"\033[91mFailed to process relax session {result.task[1]}: {result.error!r}\033[0m")
 
 if __name__ == '__main__':
     main()
@@ -1,8 +1,15 @@
+import os
+
 import numpy as np
 import pandas as pd
 import neurokit2 as nk
 
 from RXLDBC import connect
+from RXLDBC.signal_store import SignalStore
+from RXLDBC.stats import StreamingStats, describe_many
+
+# Data points per batch of valid data, an hour of BVP
+BATCH_SIZE = 64 * 3600
 
 
 def filter_week_data_by_patient(patient):
@@ -15,31 +22,33 @@ def filter_week_data_by_patient(patient):
     Returns:
         Two dictionaries containing the timestamps of E4 sessions for Week 1 and Week 2.
     """
-    conn = connect.Connection()
-    cursor = conn.conn.cursor()
+    conn = connect.Connection.pooled()
+    catalog = conn.catalog(patient)
+
+    # The recorded hours per week are an upper bound for the valid hours, so patients that cannot reach the
+    # threshold are rejected from the catalog without reading any session data
+    recorded_hours = (catalog["end_timestamp"] - catalog["start_timestamp"]).dt.total_seconds() / 3600
+    if not (recorded_hours[catalog["week"] == "Week_1"].sum() > 80
+            and recorded_hours[catalog["week"] == "Week_2"].sum() > 80):
+        print(f"Patient {patient} does not have enough data for both weeks.")
+        return None, None, None, None
 
-    week1_timestamp_dict = {}
-    # Get all E4 measurements for the patient in the first week
-    cursor.execute("SELECT id FROM measurement WHERE patient_id = %s AND week = 'Week_1' order by id", (patient,))
-    week1_e4_measurements = cursor.fetchall()
-    # Get all E4 sessions for the patient in the first week
-    for measurement_id in week1_e4_measurements:
-        for session_id in conn.get_all_measurement_session_ids_from_measurement_id(measurement_id):
+    week_measurements = {}
+    week_timestamp_dicts = {}
+    for week in ["Week_1", "Week_2"]:
+        week_catalog = catalog[catalog["week"] == week]
+        week_measurements[week] = [(measurement_id,) for measurement_id in sorted(week_catalog["measurement_id"].unique())]
+        timestamp_dict = {}
+        for session in week_catalog.itertuples():
+            session_id = int(session.session_id)
             timestamps = conn.get_start_and_end_timestamps_from_measure_session_valid_data(session_id)
             for start_timestamp, end_timestamp in timestamps[session_id]:
                 # Store the start and end timestamps in the dictionary
-                week1_timestamp_dict[f"{measurement_id}_{session_id}"] = (start_timestamp, end_timestamp)
-
-    week2_timestamp_dict = {}
-    # Get all E4 sessions for the patient in the last week
-    cursor.execute("SELECT id FROM measurement WHERE patient_id = %s AND week = 'Week_2' order by id", (patient,))
-    week2_e4_measurements = cursor.fetchall()
-    for measurement_id in week2_e4_measurements:
-        for session_id in conn.get_all_measurement_session_ids_from_measurement_id(measurement_id):
-            timestamps = conn.get_start_and_end_timestamps_from_measure_session_valid_data(session_id)
-            for start_timestamp, end_timestamp in timestamps[session_id]:
-                # Store the start and end timestamps in the dictionary
-                week2_timestamp_dict[f"{measurement_id}_{session_id}"] = (start_timestamp, end_timestamp)
+                timestamp_dict[f"{session.measurement_id}_{session_id}"] = (start_timestamp, end_timestamp)
+        week_timestamp_dicts[week] = timestamp_dict
+
+    week1_e4_measurements, week2_e4_measurements = week_measurements["Week_1"], week_measurements["Week_2"]
+    week1_timestamp_dict, week2_timestamp_dict = week_timestamp_dicts["Week_1"], week_timestamp_dicts["Week_2"]
 
     # Get the length of the data in hours for the first week
     week1_length = sum((end - start).total_seconds() / 3600 for start, end in week1_timestamp_dict.values())
@@ -54,50 +63,72 @@ def filter_week_data_by_patient(patient):
         return None, None, None, None
 
 
-def calculate_weekly_stats(week_measurement_list):
+def valid_week_batches(conn, measurement_id, store=None):
+    """
+    Yields the valid data of all sessions of a measurement in batches, so a week is never held in memory at once.
+
+    Args:
+        conn (Connection): The database connection to fall back to.
+        measurement_id (str): The ID of the measurement.
+        store (SignalStore): Signal store to read the data from instead of the database, if it holds the measurement.
+
+    Yields:
+        np.ndarray: At most BATCH_SIZE valid data points, in the order they were recorded.
+    """
+    if store is not None and store.has(measurement_id):
+        segments = store.valid_segments(measurement_id)
+    else:
+        cursor = conn.conn.cursor()
+        cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
+                       (measurement_id,))
+        segments = (segment for (session_id,) in cursor.fetchall()
+                    for segment in conn.get_valid_data_from_measure_session(session_id, return_numpy=True).values())
+
+    for segment in segments:
+        for first in range(0, len(segment), BATCH_SIZE):
+            yield segment[first:first + BATCH_SIZE]
+
+
+def set_stats(week_stats, prefix, stats):
+    """
+    Copies statistics, as returned by StreamingStats.describe, to the fields of WeekStats that start with `prefix`.
+    """
+    for name, value in stats.items():
+        # WeekStats names the standard deviation sd
+        name = "sd" if name == "std" else name
+        if hasattr(week_stats, f"{prefix}_{name}"):
+            setattr(week_stats, f"{prefix}_{name}", value)
+
+
+def calculate_weekly_stats(week_measurement_list, store=None):
     """
     Calculates weekly statistics from the given timestamp dictionary.
 
     Args:
         week_measurement_list (list) : A list of measurement session IDs for the week.
+        store (SignalStore): Optional signal store to read HR, BVP, TEMP and ACC data from.
 
     Returns:
         A dictionary with calculated statistics.
     """
-    conn = connect.Connection()
+    conn = connect.Connection.pooled()
     cursor = conn.conn.cursor()
 
     # Initialize statistics
     week_stats = WeekStats()
     hrv_stats = {}
 
-    sessions_x = []
-    sessions_y = []
-    sessions_z = []
+    x_measurement_id = None
+    y_measurement_id = None
 
     for measurement_id in week_measurement_list:
         measurement_id = measurement_id[0]
         measurement_type = measurement_id.split("_")[-1]
         if measurement_type == 'HR':
-            # Get all sessions for this measurement
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            all_hr_data = []
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    all_hr_data.extend(value)
-
-            # Calculate the average heart rate
-            week_stats.hr_sd = np.std(all_hr_data)
-            week_stats.hr_mean = np.mean(all_hr_data)
-            week_stats.hr_min = np.min(all_hr_data)
-            week_stats.hr_max = np.max(all_hr_data)
-            week_stats.hr_range = week_stats.hr_max - week_stats.hr_min
-            week_stats.hr_1q = np.percentile(all_hr_data, 25)
-            week_stats.hr_3q = np.percentile(all_hr_data, 75)
-            week_stats.hr_iqr = week_stats.hr_3q - week_stats.hr_1q
+            hr_stats = StreamingStats()
+            for batch in valid_week_batches(conn, measurement_id, store):
+                hr_stats.update(batch)
+            set_stats(week_stats, "hr", hr_stats.describe())
 
         elif measurement_type == 'EDA':
             # Get all sessions for this measurement
@@ -149,37 +180,13 @@ def calculate_weekly_stats(week_measurement_list):
             all_scl = signals["EDA_Tonic"]
             all_amplitudes = info["SCR_Amplitude"]
 
-            # Calculate the average EDA
-            week_stats.eda_sd = np.std(all_eda_data)
-            week_stats.eda_mean = np.mean(all_eda_data)
-            week_stats.eda_min = np.min(all_eda_data)
-            week_stats.eda_max = np.max(all_eda_data)
-            week_stats.eda_range = week_stats.eda_max - week_stats.eda_min
-            week_stats.eda_1q = np.percentile(all_eda_data, 25)
-            week_stats.eda_3q = np.percentile(all_eda_data, 75)
-            week_stats.eda_iqr = week_stats.eda_3q - week_stats.eda_1q
-
-            week_stats.eda_scl_sd = np.std(all_scl)
-            week_stats.eda_scl_mean = np.mean(all_scl)
-            week_stats.eda_scl_median = np.median(all_scl)
-            week_stats.eda_scl_min = np.min(all_scl)
-            week_stats.eda_scl_max = np.max(all_scl)
-            week_stats.eda_scl_range = week_stats.eda_scl_max - week_stats.eda_scl_min
-            week_stats.eda_scl_1q = np.percentile(all_scl, 25)
-            week_stats.eda_scl_3q = np.percentile(all_scl, 75)
-            week_stats.eda_scl_iqr = week_stats.eda_scl_3q - week_stats.eda_scl_1q
+            # Calculate the EDA, SCL and SCR amplitude statistics at once
+            eda_columns = describe_many([all_eda_data, all_scl, all_amplitudes])
+            for index, prefix in enumerate(("eda", "eda_scl", "eda_scr_amplitude")):
+                set_stats(week_stats, prefix, {name: column[index] for name, column in eda_columns.items()})
 
             week_stats.eda_scr_peaks = len(np.where(signals["SCR_Peaks"])[0])
 
-            week_stats.eda_scr_amplitude_sd = np.std(all_amplitudes)
-            week_stats.eda_scr_amplitude_mean = np.mean(all_amplitudes)
-            week_stats.eda_scr_amplitude_median = np.median(all_amplitudes)
-            week_stats.eda_scr_amplitude_min = np.min(all_amplitudes)
-            week_stats.eda_scr_amplitude_max = np.max(all_amplitudes)
-            week_stats.eda_scr_amplitude_range = week_stats.eda_scr_amplitude_max - week_stats.eda_scr_amplitude_min
-            week_stats.eda_scr_amplitude_1q = np.percentile(all_amplitudes, 25)
-            week_stats.eda_scr_amplitude_3q = np.percentile(all_amplitudes, 75)
-            week_stats.eda_scr_amplitude_iqr = week_stats.eda_scr_amplitude_3q - week_stats.eda_scr_amplitude_1q
             # Calculate the percentage of valid EDA data
             if eda_data_count > 0 and eda_invalid_count > 0:
                 week_stats.eda_valid_percentage = (eda_data_count / (eda_data_count + eda_invalid_count)) * 100
@@ -187,86 +194,35 @@ def calculate_weekly_stats(week_measurement_list):
                 week_stats.eda_valid_percentage = 100
 
         elif measurement_type == 'BVP':
-            # Get all sessions for this measurement
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            all_bvp_data = []
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    all_bvp_data.extend(value)
-
-            # Calculate the average BVP
-            week_stats.bvp_sd = np.std(all_bvp_data)
-            week_stats.bvp_mean = np.mean(all_bvp_data)
-            week_stats.bvp_min = np.min(all_bvp_data)
-            week_stats.bvp_max = np.max(all_bvp_data)
-            week_stats.bvp_range = week_stats.bvp_max - week_stats.bvp_min
-            week_stats.bvp_1q = np.percentile(all_bvp_data, 25)
-            week_stats.bvp_3q = np.percentile(all_bvp_data, 75)
-            week_stats.bvp_iqr = week_stats.bvp_3q - week_stats.bvp_1q
+            bvp_stats = StreamingStats()
+            for batch in valid_week_batches(conn, measurement_id, store):
+                bvp_stats.update(batch)
+            set_stats(week_stats, "bvp", bvp_stats.describe())
 
         elif measurement_type == 'TEMP':
-            # Get all sessions for this measurement
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            all_temp_data = []
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    all_temp_data.extend(value)
-
-            # Calculate the average temperature
-            week_stats.temp_sd = np.std(all_temp_data)
-            week_stats.temp_mean = np.mean(all_temp_data)
-            week_stats.temp_min = np.min(all_temp_data)
-            week_stats.temp_max = np.max(all_temp_data)
-            week_stats.temp_range = week_stats.temp_max - week_stats.temp_min
-            week_stats.temp_1q = np.percentile(all_temp_data, 25)
-            week_stats.temp_3q = np.percentile(all_temp_data, 75)
-            week_stats.temp_iqr = week_stats.temp_3q - week_stats.temp_1q
+            temp_stats = StreamingStats()
+            for batch in valid_week_batches(conn, measurement_id, store):
+                temp_stats.update(batch)
+            set_stats(week_stats, "temp", temp_stats.describe())
 
         elif measurement_type == "X":
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    sessions_x.extend(value)
+            x_measurement_id = measurement_id
         elif measurement_type == "Y":
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    sessions_y.extend(value)
+            y_measurement_id = measurement_id
         elif measurement_type == "Z":
-            cursor.execute("SELECT id FROM measure_session WHERE measurement_id = %s order by start_timestamp",
-                           (measurement_id,))
-            sessions = cursor.fetchall()
-            for session_id in sessions:
-                data = conn.get_valid_data_from_measure_session(session_id)
-                for value in data.values():
-                    sessions_z.extend(value)
-
-            # Calculate vectors of magnitude
-            acc_x = np.array(sessions_x)
-            acc_y = np.array(sessions_y)
-            acc_z = np.array(sessions_z)
-            acc_magnitude = np.sqrt(acc_x ** 2 + acc_y ** 2 + acc_z ** 2)
-
-            week_stats.acc_magnitude_sd = np.std(acc_magnitude)
-            week_stats.acc_magnitude_mean = np.mean(acc_magnitude)
-            week_stats.acc_magnitude_min = np.min(acc_magnitude)
-            week_stats.acc_magnitude_max = np.max(acc_magnitude)
-            week_stats.acc_magnitude_range = week_stats.acc_magnitude_max - week_stats.acc_magnitude_min
-            week_stats.acc_magnitude_1q = np.percentile(acc_magnitude, 25)
-            week_stats.acc_magnitude_3q = np.percentile(acc_magnitude, 75)
-            week_stats.acc_magnitude_iqr = week_stats.acc_magnitude_3q - week_stats.acc_magnitude_1q
+            # The axes share their invalid data indices, so their batches line up. Axes that do not are an
+            # error rather than silently truncated to the shortest one
+            acc_magnitude_stats = StreamingStats()
+            for acc_x, acc_y, acc_z in zip(valid_week_batches(conn, x_measurement_id, store),
+                                           valid_week_batches(conn, y_measurement_id, store),
+                                           valid_week_batches(conn, measurement_id, store), strict=True):
+                # Calculate vectors of magnitude
+                acc_x, acc_y, acc_z = (np.asarray(axis, dtype=np.float64).ravel() for axis in (acc_x, acc_y, acc_z))
+                if not len(acc_x) == len(acc_y) == len(acc_z):
+                    raise ValueError(f"The ACC axes of {measurement_id} have batches of {len(acc_x)}, {len(acc_y)} "
+                                     f"and {len(acc_z)} valid samples.")
+                acc_magnitude_stats.update(np.sqrt(acc_x ** 2 + acc_y ** 2 + acc_z ** 2))
+            set_stats(week_stats, "acc_magnitude", acc_magnitude_stats.describe())
         # elif measurement_type == "IBI":
         #     ibi_stats = []
         #     # Get all sessions for this measurement
@@ -368,6 +324,9 @@ def main():
     cursor.execute("SELECT id FROM patient ORDER BY id")
     patient_ids = cursor.fetchall()
 
+    # Read the large signals from an exported signal store when one is configured, see 1-4_Export_signal_store.py
+    store = SignalStore(os.getenv("SIGNAL_STORE_DIR")) if os.getenv("SIGNAL_STORE_DIR") else None
+
     dataframes = []
     #
     # patient_ids = [("H001",)]
@@ -448,8 +407,8 @@ def main():
                 excluded_percentage = 100
 
             print(f"Processing data for patient {patient_id}")
-            week1_stats = calculate_weekly_stats(week1)
-            week2_stats = calculate_weekly_stats(week2)
+            week1_stats = calculate_weekly_stats(week1, store)
+            week2_stats = calculate_weekly_stats(week2, store)
 
             # # Rename columns of week1_hrv_stats and week2_hrv_stats to include week number
             # week1_hrv_stats = {f"{key}_week1": value for key, value in week1_hrv_stats.items()}
@@ -0,0 +1,163 @@
+import struct
+from datetime import datetime
+
+import numpy as np
+
+# Signature, flags field and header extension length of the binary COPY format
+HEADER = b"PGCOPY\n\xff\r\n\x00" + struct.pack("!ii", 0, 0)
+TRAILER = struct.pack("!h", -1)
+
+FLOAT8_OID = 701
+FLOAT4_OID = 700
+INT2_OID = 21
+
+# OID and big-endian element type of the arrays measure session data is stored in: FLOAT[], REAL[] and SMALLINT[]
+ARRAY_ELEMENT_TYPES = {
+    np.dtype(np.float64): (FLOAT8_OID, ">f8"),
+    np.dtype(np.float32): (FLOAT4_OID, ">f4"),
+    np.dtype(np.int16): (INT2_OID, ">i2"),
+}
+POSTGRES_EPOCH = datetime(2000, 1, 1)
+
+
+class CopyStream:
+    """
+    File-like object that feeds an iterable of byte chunks to `cursor.copy_expert`.
+
+    Chunks are only pulled from the iterable when psycopg2 asks for more data, so rows can be produced lazily
+    while the COPY is running.
+    """
+    def __init__(self, chunks):
+        self._chunks = iter(chunks)
+        self._buffer = bytearray()
+
+    def read(self, size: int = -1):
+        while size < 0 or len(self._buffer) < size:
+            chunk = next(self._chunks, None)
+            if chunk is None:
+                break
+            self._buffer += chunk
+
+        if size < 0 or size > len(self._buffer):
+            size = len(self._buffer)
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+
+def encode_text(value: str):
+    raw = value.encode()
+    return struct.pack("!i", len(raw)) + raw
+
+
+def encode_timestamp(value: datetime):
+    """
+    Encodes a naive datetime as a TIMESTAMP field, microseconds since 2000-01-01.
+    """
+    delta = value - POSTGRES_EPOCH
+    microseconds = (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+    return struct.pack("!iq", 8, microseconds)
+
+
+def array_header(shape: tuple, dtype=np.float64):
+    """
+    Encodes the field length and array header of an array field with the given shape and element type, one of
+    the dtypes in ARRAY_ELEMENT_TYPES.
+
+    The elements themselves are encoded separately with `encode_elements`, which allows the array to be written
+    in chunks.
+    """
+    oid, element_type = ARRAY_ELEMENT_TYPES[np.dtype(dtype)]
+    if not shape or 0 in shape:
+        # PostgreSQL represents every empty array as a zero-dimensional one
+        return struct.pack("!iiii", 12, 0, 0, oid)
+
+    n_elements = int(np.prod(shape))
+    field_length = 12 + 8 * len(shape) + (4 + np.dtype(element_type).itemsize) * n_elements
+    header = struct.pack("!iiii", field_length, len(shape), 0, oid)
+    for size in shape:
+        # Every dimension starts at PostgreSQL's default lower bound of 1
+        header += struct.pack("!ii", size, 1)
+    return header
+
+
+def float8_array_header(shape: tuple):
+    return array_header(shape, np.float64)
+
+
+def encode_elements(values: np.ndarray, dtype=np.float64):
+    """
+    Encodes the elements of an array in row-major order as `dtype`, each prefixed with its length.
+    """
+    _, element_type = ARRAY_ELEMENT_TYPES[np.dtype(dtype)]
+    flat = np.ascontiguousarray(values, dtype=dtype).ravel()
+    elements = np.empty(flat.size, dtype=[("length", ">i4"), ("value", element_type)])
+    elements["length"] = np.dtype(element_type).itemsize
+    elements["value"] = flat
+    return elements.tobytes()
+
+
+def encode_float8_elements(values: np.ndarray):
+    """
+    Encodes the elements of a float array in row-major order, each prefixed with its length.
+    """
+    return encode_elements(values, np.float64)
+
+
+def encode_float8_array(values):
+    """
+    Encodes a list or NumPy array of floats of any dimension as a complete FLOAT[] field.
+    """
+    array = np.asarray(values, dtype=np.float64)
+    return float8_array_header(array.shape) + encode_float8_elements(array)
+
+
+def encode_measure_sessions(sessions):
+    """
+    Encodes (measurement_id, start_timestamp, data) rows for a
+    `COPY measure_session (measurement_id, start_timestamp, data)` in binary format.
+
+    Args:
+        sessions (iterable): Rows to encode, consumed lazily.
+
+    Yields:
+        bytes: Chunks of the COPY stream, including the header and trailer.
+    """
+    yield HEADER
+    for measurement_id, start_timestamp, data in sessions:
+        data = np.asarray(data, dtype=np.float64)
+        yield encode_measure_session_header(measurement_id, start_timestamp, data.shape)
+        yield encode_float8_elements(data)
+    yield TRAILER
+
+
+def encode_measure_session_header(measurement_id: str, start_timestamp: datetime, shape: tuple, ingest_id: int = None):
+    """
+    Encodes a measure session row up to the elements of its data, which follow in row-major order.
+
+    With an `ingest_id` the row starts with that column, for a
+    `COPY measure_session (ingest_id, measurement_id, start_timestamp, data)`.
+    """
+    if ingest_id is None:
+        fields = struct.pack("!h", 3)
+    else:
+        fields = struct.pack("!hii", 4, 4, ingest_id)
+    return fields + encode_text(measurement_id) + encode_timestamp(start_timestamp) + float8_array_header(shape)
+
+
+def encode_measure_chunks(session_id: int, data, chunk_rows: int, dtype=np.float64):
+    """
+    Encodes the rows of a measure session as (session_id, chunk_no, data) rows of `chunk_rows` rows each, for a
+    `COPY measure_chunk (session_id, chunk_no, <column>)` in binary format. The elements are encoded as `dtype`,
+    the type of the column, see ARRAY_ELEMENT_TYPES.
+
+    Yields:
+        bytes: Chunks of the COPY stream, including the header and trailer.
+    """
+    data = np.asarray(data, dtype=dtype)
+    yield HEADER
+    for chunk_no, start in enumerate(range(0, len(data), chunk_rows)):
+        chunk = data[start:start + chunk_rows]
+        yield struct.pack("!hiiii", 3, 4, session_id, 4, chunk_no) + array_header(chunk.shape, dtype)
+        yield encode_elements(chunk, dtype)
+    yield TRAILER
@@ -0,0 +1,75 @@
+import glob
+import os
+import tempfile
+
+import numpy as np
+
+
+class SessionCache:
+    """
+    On-disk cache of measure session data, one .npy file per session.
+
+    Files are keyed by the session id and the `xmin` of its row, the ID of the transaction that last wrote it.
+    Any UPDATE of the row, including a change of `invalid_data_indices`, gives it a new `xmin`, so a stale file
+    is never served and is replaced on the next read.
+
+    Args:
+        directory (str): Directory to keep the cache files in, created when it does not exist.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, session_id, version):
+        return os.path.join(self.directory, f"{session_id}_{version}.npy")
+
+    def load(self, session_id, version):
+        """
+        Returns the cached data of a session as a read-only memory-mapped array, or None on a cache miss.
+        """
+        try:
+            return np.load(self._path(session_id, version), mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def store(self, session_id, version, data, dtype=np.float64):
+        """
+        Writes the data of a session to the cache as `dtype` and removes the files of older versions of it.
+
+        The file is written under a temporary name and renamed, so concurrent readers never see a partial file.
+        """
+        array = np.asarray(data, dtype=dtype)
+        handle, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        try:
+            with os.fdopen(handle, "wb") as file:
+                np.save(file, array)
+            os.replace(temporary_path, self._path(session_id, version))
+        except BaseException:
+            os.remove(temporary_path)
+            raise
+
+        for path in glob.glob(os.path.join(self.directory, f"{session_id}_*.npy")):
+            if path != self._path(session_id, version):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+        return array
+
+    def invalidate(self, session_id):
+        """
+        Removes every cached version of a session.
+        """
+        for path in glob.glob(os.path.join(self.directory, f"{session_id}_*.npy")):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        for path in glob.glob(os.path.join(self.directory, "*.npy")):
+            # Another process may clear or invalidate the cache at the same time
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
@@ -1,10 +1,22 @@
+import io
 import os
+import threading
+import time
+import weakref
+from functools import cache
 
 from dotenv import load_dotenv, find_dotenv
 from typing import Literal
 from datetime import datetime, timedelta
+import numpy as np
 import psycopg2
-from pandas.core.indexers import validate_indices
+from psycopg2 import extensions, extras
+from psycopg2.pool import PoolError
+import pandas as pd
+
+from RXLDBC import binary_copy, grouping, metadata
+from RXLDBC.cache import SessionCache
+from RXLDBC.validity import ValidityMask
 
 TABLES = Literal["measure_session", "measurement", "patient", "relax_session"]
 MEASUREMENT_TYPES = Literal["ACC", "BVP", "EDA", "HR", "IBI", "TEMP"]
@@ -13,17 +25,389 @@ GROUP = Literal["Exercise", "VR"]
 ORIGIN = Literal["UMCG", "Forte GGZ", "Lentis", "Argo GGZ", "Mediant GGZ", "Huisartsenpraktijk"]
 SEX = Literal["Male", "Female"]
 
+# Matches the default worker count of concurrent.futures.ThreadPoolExecutor, so a loader that gives every
+# worker its own pooled connection never waits on the pool.
+DEFAULT_POOL_SIZE = min(32, (os.cpu_count() or 1) + 4)
+
+# Bytes handed to libpq per read while streaming a COPY
+COPY_BUFFER_SIZE = 1 << 20
+
+# Compactly stored sessions keep their samples in data_i2 (ACC) or data_f4 (the other sampled types) and have
+# data set to NULL, see Connection.compact_measure_sessions. IBI sessions always stay in data.
+SESSION_DATA_COLUMNS = "ms.data, ms.data_f4, ms.data_i2"
+# NumPy type of each column in SESSION_DATA_COLUMNS, the values of a column are exact in its type
+SESSION_DATA_DTYPES = {"data": np.float64, "data_f4": np.float32, "data_i2": np.int16}
+SESSION_DATA = "COALESCE(ms.data, ms.data_f4::FLOAT[], ms.data_i2::FLOAT[])"
+SESSION_LENGTH = "COALESCE(array_length(ms.data, 1), array_length(ms.data_f4, 1), array_length(ms.data_i2, 1))"
+SESSION_CARDINALITY = "COALESCE(cardinality(ms.data), cardinality(ms.data_f4), cardinality(ms.data_i2))"
+
+# Start and end timestamps of measure sessions, computed without unnesting their data. The end of an IBI
+# session is the offset of its last beat, for the other types it follows from the number of samples and the
+# sample rate. Rounding a double precision value rounds half to even, like Python's round().
+SESSION_END_TIMESTAMP = (
+    "ms.start_timestamp + make_interval(secs => CASE WHEN m.measurement_type = 'IBI' "
+    "THEN round(COALESCE(ms.data[array_length(ms.data, 1)][1], ms.data[array_length(ms.data, 1)])) "
+    f"ELSE round({SESSION_CARDINALITY} / m.sample_rate) END)"
+)
+SESSION_BOUNDS_QUERY = (
+    f"SELECT ms.id, ms.measurement_id, ms.start_timestamp, {SESSION_END_TIMESTAMP} "
+    "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+)
+
+# Duration of a chunk of a chunked measure session, five minutes of BVP are 19200 rows
+CHUNK_SECONDS = 300
+
+# Patient columns that `bulk_update_patients` may set
+PATIENT_UPDATE_COLUMNS = ["origin", "patient_group", "age", "sex", "group_1", "group_2", "group_3"]
+
+# Relax session columns in the order of `relax.relax_session_rows`, the first three identify a session
+RELAX_SESSION_COLUMNS = ["patient_id", "start_timestamp", "end_timestamp", "start_question_1", "end_question_1",
+                         "start_question_2", "end_question_2", "modifier"]
+
+CATALOG_COLUMNS = ["session_id", "measurement_id", "patient_id", "measurement_type", "week", "start_timestamp",
+                   "end_timestamp", "n_samples", "sample_rate", "invalid_fraction"]
+
+
+def _invalid_fraction(n_samples: str):
+    """
+    SQL expression for the fraction of samples of `ms` covered by its invalid [start, end] index ranges, where
+    [0, -1] marks the whole session as invalid.
+    """
+    return (
+        "COALESCE(LEAST(1.0, (SELECT SUM(CASE WHEN ms.invalid_data_indices[i][2] = -1 "
+        f"THEN {n_samples} - ms.invalid_data_indices[i][1] "
+        "ELSE ms.invalid_data_indices[i][2] - ms.invalid_data_indices[i][1] + 1 END) "
+        "FROM generate_subscripts(ms.invalid_data_indices, 1) AS i)::FLOAT "
+        f"/ NULLIF({n_samples}, 0)), 0)"
+    )
+
+
+# Inserts or recomputes the catalog rows of the sessions matching {condition}
+SESSION_CATALOG_UPSERT = (
+    f"INSERT INTO session_catalog ({', '.join(CATALOG_COLUMNS)}) "
+    "SELECT ms.id, ms.measurement_id, m.patient_id, m.measurement_type, m.week, ms.start_timestamp, "
+    f"{SESSION_END_TIMESTAMP}, COALESCE({SESSION_LENGTH}, 0), m.sample_rate, "
+    f"{_invalid_fraction(SESSION_LENGTH)} "
+    "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+    "WHERE {condition} "
+    "ON CONFLICT (session_id) DO UPDATE SET "
+    + ", ".join(f"{column} = EXCLUDED.{column}" for column in CATALOG_COLUMNS[1:])
+)
+
+# Whether any measure session matching {condition} has no catalog row, e.g. in a database that was never backfilled
+UNCATALOGUED_SESSIONS_QUERY = (
+    "SELECT EXISTS (SELECT 1 FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+    "WHERE {condition} AND NOT EXISTS (SELECT 1 FROM session_catalog sc WHERE sc.session_id = ms.id))"
+)
+
+# Slices the windows of a CTE r(n, session_id, start_index, stop_index, ...) with PostgreSQL's 1-based inclusive
+# indices. Chunked sessions only read the chunks that overlap the slice, chunk k holds the indices
+# k * chunk_rows + 1 up to (k + 1) * chunk_rows and slices are clamped to the bounds of a chunk. Chunks have the
+# data columns of their session, so a compact session has compact chunks.
+_CHUNK_SLICE = "[r.start_index - c.chunk_no * ms.chunk_rows:r.stop_index - c.chunk_no * ms.chunk_rows]"
+WINDOW_SLICES_QUERY = (
+    "SELECT r.*, 0 AS chunk_no, ms.data[r.start_index:r.stop_index], ms.data_f4[r.start_index:r.stop_index], "
+    "ms.data_i2[r.start_index:r.stop_index] "
+    "FROM r LEFT JOIN measure_session ms ON ms.id = r.session_id WHERE ms.chunk_rows IS NULL "
+    "UNION ALL "
+    f"SELECT r.*, c.chunk_no, c.data{_CHUNK_SLICE}, c.data_f4{_CHUNK_SLICE}, c.data_i2{_CHUNK_SLICE} "
+    "FROM r JOIN measure_session ms ON ms.id = r.session_id "
+    "JOIN measure_chunk c ON c.session_id = ms.id "
+    "AND c.chunk_no BETWEEN (GREATEST(r.start_index, 1) - 1) / ms.chunk_rows AND (r.stop_index - 1) / ms.chunk_rows "
+    "ORDER BY n, chunk_no"
+)
+
+# Windows of the rows recorded from %(t0)s up to %(t1)s in the catalogued sessions matching {condition}. IBI
+# sessions are read whole, their beats are selected by offset after fetching them.
+TIME_WINDOWS_QUERY = (
+    "SELECT row_number() OVER (ORDER BY sc.start_timestamp, sc.session_id) AS n, sc.session_id, "
+    "CASE WHEN sc.measurement_type = 'IBI' THEN 1 "
+    "ELSE ceil(EXTRACT(EPOCH FROM %(t0)s - sc.start_timestamp) * sc.sample_rate)::INT + 1 END AS start_index, "
+    "CASE WHEN sc.measurement_type = 'IBI' THEN sc.n_samples "
+    "ELSE ceil(EXTRACT(EPOCH FROM %(t1)s - sc.start_timestamp) * sc.sample_rate)::INT END AS stop_index, "
+    "sc.start_timestamp, sc.sample_rate, sc.measurement_type = 'IBI' AS is_ibi "
+    "FROM session_catalog sc WHERE {condition}"
+)
+
+
+# Patient metadata with its relax summary and the headers of all its measure sessions, for the patient that
+# {target} selects as a single `id` column
+PATIENT_METADATA_QUERY = (
+    "WITH target AS ({target}), "
+    "relax AS (SELECT COUNT(*) AS relax_count, AVG(EXTRACT(EPOCH FROM end_timestamp - start_timestamp)) AS duration "
+    "FROM relax_session WHERE patient_id = (SELECT id FROM target)) "
+    "SELECT p.id, p.origin, p.patient_group, p.age, p.sex, relax.relax_count, relax.duration, "
+    "ms.id, ms.measurement_id, m.measurement_type, m.week, m.sample_rate, ms.start_timestamp, "
+    "ms.invalid_data_indices "
+    "FROM target JOIN patient p ON p.id = target.id CROSS JOIN relax "
+    "LEFT JOIN measurement m ON m.patient_id = p.id "
+    "LEFT JOIN measure_session ms ON ms.measurement_id = m.id"
+)
+
+
+def stored_data(values):
+    """
+    Returns the first of the data columns selected with SESSION_DATA_COLUMNS that is set, None for a missing session.
+    """
+    return next((value for value in values if value is not None), None)
+
+
+def slice_rows(data, start: int, stop: int, first_index: int = 1):
+    """
+    Applies a PostgreSQL slice `data[start:stop]` to rows that were already fetched.
+
+    The slice is 1-based, includes `stop` and is clamped to the bounds of the array, like in PostgreSQL.
+
+    Args:
+        data: The rows, a list or NumPy array.
+        start (int): First PostgreSQL index of the slice.
+        stop (int): Last PostgreSQL index of the slice.
+        first_index (int): The PostgreSQL index of the first row of `data`, for rows that are a slice themselves.
+    """
+    first_index = max(first_index, 1)
+    return data[max(start - first_index, 0):max(stop - first_index + 1, 0)]
+
+
+def cached_rows(data, return_numpy: bool):
+    """
+    Converts data read from the SessionCache to what the database returns: a float64 ndarray, or a list with
+    ints for SMALLINT[] sessions and floats otherwise.
+    """
+    return np.array(data, dtype=np.float64) if return_numpy else data.tolist()
+
+
+# Strips the braces of a FLOAT[] literal, leaving the comma separated elements
+_ARRAY_BRACES = str.maketrans("", "", "{}")
+
+
+def _cast_float8_array(value, cursor):
+    """
+    Parses the text representation of a FLOAT[] straight into a float64 NumPy array of the same shape.
+    """
+    if value is None:
+        return None
+    if "NULL" in value:
+        # Rare, but not something np.fromstring can parse
+        return np.array(extensions.FLOATARRAY(value, cursor), dtype=np.float64)
+
+    values = np.fromstring(value.translate(_ARRAY_BRACES), dtype=np.float64, sep=",")
+    if value.startswith("{{") and values.size:
+        # Every row of a 2-D array has the length of the first one
+        first_row = value[2:value.index("}")]
+        values = values.reshape(-1, first_row.count(",") + 1)
+    return values
+
+
+# FLOAT[], REAL[] and SMALLINT[] share the text representation, compact arrays are widened to float64 as well
+NUMPY_FLOAT8_ARRAY = extensions.new_type((1022, 1021, 1005), "NUMPY_FLOAT8_ARRAY", _cast_float8_array)
+
+
+@cache
+def _load_environment():
+    # Searching for the .env file walks the directory tree, only do it once per process
+    load_dotenv(find_dotenv())
+
+
+def _open_connection():
+    _load_environment()
+    return psycopg2.connect(
+        host=os.getenv("HOST"),
+        database=os.getenv("DATABASE"),
+        user=os.getenv("USER"),
+        password=os.getenv("PASSWORD"),
+        port=os.getenv("PORT"),
+    )
+
+
+class ConnectionPool:
+    """
+    Thread-safe pool of psycopg2 connections.
+
+    Connections are opened lazily up to `maxconn` and handed back with `putconn`. Idle connections are
+    checked with a `SELECT 1` before reuse when they have not been used for `health_check_interval` seconds,
+    broken connections are replaced transparently.
+
+    Args:
+        minconn (int): The number of connections opened up front.
+        maxconn (int): The maximum number of connections open at the same time.
+        timeout (float): Seconds to wait for a free connection before raising a PoolError, None waits forever.
+        health_check_interval (float): Seconds a connection may sit idle before it is checked on checkout.
+    """
+    def __init__(self, minconn: int = 1, maxconn: int = DEFAULT_POOL_SIZE, timeout: float = 30.0,
+                 health_check_interval: float = 60.0):
+        if minconn < 0 or maxconn < 1 or minconn > maxconn:
+            raise ValueError(f"Invalid pool size: minconn={minconn}, maxconn={maxconn}.")
+        self.minconn = minconn
+        self.maxconn = maxconn
+        self.timeout = timeout
+        self.health_check_interval = health_check_interval
+        self.pid = os.getpid()
+        self.closed = False
+        self._condition = threading.Condition()
+        self._idle = []
+        self._size = 0
+
+        for _ in range(minconn):
+            self._idle.append((_open_connection(), time.monotonic()))
+            self._size += 1
+
+    def getconn(self):
+        """
+        Checks a connection out of the pool, opening a new one if the pool is not at its maximum size.
+
+        Returns:
+            psycopg2.extensions.connection: A healthy connection with no transaction in progress.
+        """
+        deadline = None if self.timeout is None else time.monotonic() + self.timeout
+        with self._condition:
+            while True:
+                if self.closed:
+                    raise PoolError("Connection pool is closed.")
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                    break
+                if self._size < self.maxconn:
+                    # Reserve the slot, the connection itself is opened outside the lock
+                    self._size += 1
+                    conn, last_used = None, None
+                    break
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    raise PoolError(f"Timed out after {self.timeout} seconds waiting for a database connection.")
+                self._condition.wait(remaining)
+
+        if conn is not None and self._is_healthy(conn, last_used):
+            return conn
+        if conn is not None:
+            self._close_quietly(conn)
+        try:
+            return _open_connection()
+        except Exception:
+            self._release_slot()
+            raise
+
+    def putconn(self, conn):
+        """
+        Returns a connection to the pool, rolling back any transaction that was left open.
+
+        Args:
+            conn (psycopg2.extensions.connection): A connection obtained from `getconn`.
+        """
+        if not conn.closed and conn.get_transaction_status() != extensions.TRANSACTION_STATUS_IDLE:
+            try:
+                conn.rollback()
+            except psycopg2.Error:
+                self._close_quietly(conn)
+
+        if conn.closed or self.closed:
+            self._close_quietly(conn)
+            self._release_slot()
+            return
+
+        with self._condition:
+            self._idle.append((conn, time.monotonic()))
+            self._condition.notify()
+
+    def closeall(self):
+        """
+        Closes all idle connections, connections that are still checked out are closed when they are returned.
+        """
+        with self._condition:
+            self.closed = True
+            idle, self._idle = self._idle, []
+            self._size -= len(idle)
+            self._condition.notify_all()
+        for conn, _ in idle:
+            self._close_quietly(conn)
+
+    def _is_healthy(self, conn, last_used: float):
+        if conn.closed:
+            return False
+        if time.monotonic() - last_used < self.health_check_interval:
+            return True
+        try:
+            with conn.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            conn.rollback()
+            return True
+        except psycopg2.Error:
+            return False
+
+    def _release_slot(self):
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+
+    @staticmethod
+    def _close_quietly(conn):
+        try:
+            conn.close()
+        except psycopg2.Error:
+            pass
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def get_pool(minconn: int = 1, maxconn: int = DEFAULT_POOL_SIZE, timeout: float = 30.0):
+    """
+    Returns the process-wide connection pool, creating it on first use.
+
+    The arguments only take effect when the pool is created. A pool inherited from a parent process through
+    fork is never reused, the child process gets a pool of its own.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None or _pool.closed or _pool.pid != os.getpid():
+            _pool = ConnectionPool(minconn=minconn, maxconn=maxconn, timeout=timeout)
+        return _pool
+
+
 class Connection:
-    def __init__(self):
-        load_dotenv(find_dotenv())
-        self.conn = psycopg2.connect(
-            host=os.getenv("HOST"),
-            database=os.getenv("DATABASE"),
-            user=os.getenv("USER"),
-            password=os.getenv("PASSWORD"),
-            port=os.getenv("PORT"),
-        )
+    def __init__(self, pool: ConnectionPool = None, cache_dir: str = None):
+        if pool is None:
+            self.conn = _open_connection()
+            self._finalizer = weakref.finalize(self, self.conn.close)
+        else:
+            self.conn = pool.getconn()
+            # Hand the connection back to the pool even if the caller forgets to close it
+            self._finalizer = weakref.finalize(self, pool.putconn, self.conn)
         self.cursor = self.conn.cursor()
+        # Session data is cached on disk when a directory is given here or with CACHE_DIR in the .env file
+        cache_dir = cache_dir or os.getenv("CACHE_DIR")
+        self.cache = SessionCache(cache_dir) if cache_dir else None
+        self._numpy_cursor = None
+        # Patient and session metadata is shared by all connections of the process
+        self.metadata = metadata.shared_cache()
+
+    @classmethod
+    def pooled(cls, minconn: int = 1, maxconn: int = DEFAULT_POOL_SIZE, timeout: float = 30.0,
+               cache_dir: str = None):
+        """
+        Creates a Connection backed by the process-wide connection pool.
+
+        Closing the returned Connection hands the underlying socket back to the pool instead of closing it,
+        so helpers and workers can create one per task without paying for a new handshake.
+
+        Args:
+            minconn (int): The number of connections the pool opens up front.
+            maxconn (int): The maximum number of connections the pool keeps open.
+            timeout (float): Seconds to wait for a free connection before raising a PoolError.
+            cache_dir (str): Directory of the session data cache, defaults to CACHE_DIR from the .env file.
+
+        Returns:
+            Connection: A connection that is returned to the pool on `close()` or when leaving a with block.
+        """
+        return cls(pool=get_pool(minconn=minconn, maxconn=maxconn, timeout=timeout), cache_dir=cache_dir)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is not None and not self.conn.closed:
+            self.conn.rollback()
+        self.close()
 
     def fetch_all_from_table(self, table: TABLES):
         self.cursor.execute(f"SELECT * FROM {table}")
@@ -32,7 +416,7 @@ class Connection:
 
     def insert_patient(self, patient_id: str, origin: ORIGIN, patient_group: GROUP):
         self.cursor.execute(
-            "INSERT INTO patient (id, origin, patient_group) VALUES (%s, %s, %s)",
+            "INSERT INTO patient (id, origin, patient_group) VALUES (%s, %s, %s) ON CONFLICT (id) DO NOTHING",
             (patient_id, origin, patient_group),
         )
         self.conn.commit()
@@ -46,10 +430,56 @@ class Connection:
 
     def insert_measure_session(self, measurement_id: str, start_timestamp: datetime, data: list):
         self.cursor.execute(
-            "INSERT INTO measure_session (measurement_id, start_timestamp, data) VALUES (%s, %s, %s)",
+            "INSERT INTO measure_session (measurement_id, start_timestamp, data) VALUES (%s, %s, %s) RETURNING id",
             (measurement_id, start_timestamp, data),
         )
+        session_id = self.cursor.fetchone()[0]
+        self.cursor.execute(SESSION_CATALOG_UPSERT.format(condition="ms.id = %s"), (session_id,))
         self.conn.commit()
+        self.metadata.clear()
+
+    def bulk_insert_measure_sessions(self, sessions):
+        """
+        Inserts many measurement sessions in one transaction by streaming them through a binary COPY.
+
+        The rows are consumed lazily while the COPY is running, so a generator that reads one CSV at a time keeps
+        only a single session in memory. Other statements can not be executed on this connection until the
+        iterable is exhausted, the measurements the sessions refer to must therefore exist beforehand.
+
+        Args:
+            sessions (iterable): (measurement_id, start_timestamp, data) tuples, where data is a list or
+                NumPy array of floats with one row per sample.
+        """
+        self.copy_measure_sessions(binary_copy.encode_measure_sessions(sessions))
+
+    def copy_measure_sessions(self, chunks, with_ingest_id: bool = False, commit: bool = True):
+        """
+        Inserts measurement sessions from an already encoded binary COPY stream in one transaction.
+
+        Args:
+            chunks (iterable): Byte chunks of a `COPY measure_session (measurement_id, start_timestamp, data)`
+                in binary format, including the header and trailer, see `binary_copy`.
+            with_ingest_id (bool): The rows start with an `ingest_id` column.
+            commit (bool): Commit the transaction, leave it open for callers that do more work in it.
+        """
+        columns = "ingest_id, measurement_id, start_timestamp, data" if with_ingest_id else "measurement_id, start_timestamp, data"
+        try:
+            self.cursor.copy_expert(
+                f"COPY measure_session ({columns}) FROM STDIN WITH (FORMAT binary)",
+                binary_copy.CopyStream(chunks),
+                size=COPY_BUFFER_SIZE,
+            )
+            # Catalog the new sessions in the same transaction
+            self.cursor.execute(SESSION_CATALOG_UPSERT.format(
+                condition="NOT EXISTS (SELECT 1 FROM session_catalog sc WHERE sc.session_id = ms.id)"
+            ))
+        except Exception:
+            self.conn.rollback()
+            raise
+        if commit:
+            self.conn.commit()
+        # The cached patients are missing the new sessions
+        self.metadata.clear()
 
     def insert_relax_session(self, patient_id: str, start_timestamp: datetime, end_timestamp: datetime, start_question_1: int = None, end_question_1: int = None, start_question_2: int = None, end_question_2: int = None, modifier: str = None):
         self.cursor.execute(
@@ -57,6 +487,47 @@ class Connection:
             (patient_id, start_timestamp, end_timestamp, start_question_1, end_question_1, start_question_2, end_question_2, modifier),
         )
         self.conn.commit()
+        self.metadata.invalidate(patient_id)
+
+    def bulk_insert_relax_sessions(self, sessions):
+        """
+        Inserts many relax sessions in one transaction with a multi-row INSERT.
+
+        A session is identified by its patient, start and end timestamp. Loading a session that is already in the
+        table fills in the answers and modifier it was missing and keeps the ones it has, so exports without
+        questions, like the one of 1-0, and exports with them can be loaded in any order and more than once.
+
+        Args:
+            sessions (list): (patient_id, start_timestamp, end_timestamp, start_question_1, end_question_1,
+                start_question_2, end_question_2, modifier) tuples, see `relax.relax_session_rows`.
+
+        Returns:
+            int: The number of sessions inserted or updated.
+        """
+        # A row may only be updated once per statement, so duplicates within the export are merged first
+        merged = {}
+        for session in sessions:
+            key = tuple(session[:3])
+            if key in merged:
+                session = key + tuple(new if old is None else old for old, new in zip(merged[key][3:], session[3:]))
+            merged[key] = tuple(session)
+
+        try:
+            extras.execute_values(
+                self.cursor,
+                f"INSERT INTO relax_session ({', '.join(RELAX_SESSION_COLUMNS)}) VALUES %s "
+                "ON CONFLICT (patient_id, start_timestamp, end_timestamp) DO UPDATE SET "
+                + ", ".join(f"{column} = COALESCE(EXCLUDED.{column}, relax_session.{column})"
+                            for column in RELAX_SESSION_COLUMNS[3:]),
+                list(merged.values()),
+                page_size=1000,
+            )
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        self.metadata.clear()
+        return len(merged)
 
     def check_if_measurement_exists(self, measurement_id: str, patient_id: str, week: WEEK, measurement_type: MEASUREMENT_TYPES):
         self.cursor.execute(
@@ -71,6 +542,7 @@ class Connection:
             (age, sex, patient_id),
         )
         self.conn.commit()
+        self.metadata.invalidate(patient_id)
 
     def add_research_group_to_patient(self, patient_id: str, group_1: bool, group_2: bool, group_3: bool):
         self.cursor.execute(
@@ -78,70 +550,66 @@ class Connection:
             (group_1, group_2, group_3, patient_id),
         )
         self.conn.commit()
+        self.metadata.invalidate(patient_id)
 
-    def drop_all_rows(self, table: TABLES):
-        self.cursor.execute(f"DELETE FROM {table}")
-        self.conn.commit()
-
-    def get_beginning_and_end_timestamp_from_measure_session(self, session_id: int):
-        # Get the measurement ID from the session ID
-        self.cursor.execute(
-            "SELECT measurement_id FROM measure_session WHERE id = %s",
-            (session_id,),
-        )
-        measurement_id = self.cursor.fetchone()[0]
-
-        # Get the sample rate, skip this if the measurement type is IBI
-        if measurement_id.split("_")[-1] == "IBI":
-            # Select all the data from the measure session
-            self.cursor.execute(
-                "SELECT data FROM measure_session WHERE id = %s",
-                (session_id,),
-            )
-            data = self.cursor.fetchone()[0]
+    def bulk_update_patients(self, patients: pd.DataFrame):
+        """
+        Updates the columns of many patients in one transaction.
 
-            if isinstance(data[0], list):
-                data = [sublist[0] for sublist in data]
+        The rows are staged in a temporary table with a CSV COPY and applied with a single UPDATE, so decorating all
+        patients after a new participants CSV takes one round trip. Missing values are written as NULL and patients
+        that do not exist are ignored.
 
-            # Add all the data points together to get the total amount of milliseconds, convert to seconds and round to a whole number
-            total_seconds = round(data[-1])
+        Args:
+            patients (pd.DataFrame): An "id" column and any of the columns in PATIENT_UPDATE_COLUMNS.
 
-            # Get the start timestamp
+        Returns:
+            int: The number of patients that were updated.
+        """
+        columns = [column for column in patients.columns if column != "id"]
+        unknown = set(columns) - set(PATIENT_UPDATE_COLUMNS)
+        if "id" not in patients.columns or unknown:
+            raise ValueError(f"Expected an id column and columns from {PATIENT_UPDATE_COLUMNS}, got {list(patients.columns)}.")
+
+        buffer = io.StringIO()
+        # Integral float columns, e.g. ages read next to missing values, have to be written as integers
+        patients[["id", *columns]].convert_dtypes().to_csv(buffer, index=False, header=False)
+        buffer.seek(0)
+
+        column_list = ", ".join(["id", *columns])
+        try:
+            # The staging table takes the column types of patient but none of its constraints
             self.cursor.execute(
-                "SELECT start_timestamp FROM measure_session WHERE id = %s",
-                (session_id,),
+                f"CREATE TEMP TABLE patient_staging ON COMMIT DROP AS SELECT {column_list} FROM patient WITH NO DATA"
             )
-            start_timestamp = self.cursor.fetchone()[0]
-
-            # Calculate the end timestamp by adding the total seconds to the start timestamp
-            end_timestamp = start_timestamp + timedelta(seconds=total_seconds)
-
-
-        else:
-            # Get the start timestamp and the count of the data points
+            self.cursor.copy_expert(f"COPY patient_staging ({column_list}) FROM STDIN WITH (FORMAT csv)", buffer)
             self.cursor.execute(
-                "SELECT ms.start_timestamp, COUNT(u.data_element) "
-                "FROM measure_session ms, LATERAL unnest(ms.data) "
-                "AS u(data_element) "
-                "WHERE ms.id = %s "
-                "GROUP BY ms.start_timestamp;",
-                (session_id,),
+                f"UPDATE patient p SET {', '.join(f'{column} = s.{column}' for column in columns)} "
+                "FROM patient_staging s WHERE p.id = s.id"
             )
-            start_timestamp, count = self.cursor.fetchone()
-            if start_timestamp is None or count is None:
-                print(f"Warning: No data found for session ID {session_id}.")
-                return
+            updated = self.cursor.rowcount
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        self.metadata.clear()
+        return updated
 
-            # Get the sample rate
-            self.cursor.execute(
-                "SELECT sample_rate FROM measurement WHERE id = %s",
-                (measurement_id,),
-            )
-            sample_rate = self.cursor.fetchone()[0]
+    def drop_all_rows(self, table: TABLES):
+        self.cursor.execute(f"DELETE FROM {table}")
+        self.conn.commit()
 
-            # Determine the end timestamp by adding the count of data points divided by the sample rate to the start timestamp
-            end_timestamp = start_timestamp + timedelta(seconds=round(count / sample_rate))
+    def get_beginning_and_end_timestamp_from_measure_session(self, session_id: int):
+        self.cursor.execute(
+            SESSION_BOUNDS_QUERY + "WHERE ms.id = %s",
+            (session_id,),
+        )
+        result = self.cursor.fetchone()
+        if result is None or result[3] is None:
+            print(f"Warning: No data found for session ID {session_id}.")
+            return
 
+        _, _, start_timestamp, end_timestamp = result
         return start_timestamp, end_timestamp
 
     def get_all_measurement_session_ids_from_measurement_id(self, measurement_id: str):
@@ -158,12 +626,29 @@ class Connection:
         )
         return [row[0] for row in self.cursor.fetchall()]
 
-    def get_all_timestamps_from_patient_id(self, patient_id: str):
+    def get_all_timestamps_from_patient_id(self, patient_id: str, use_catalog: bool = False):
+        if use_catalog:
+            # The catalog already holds the bounds, so the session data is not read at all
+            self.cursor.execute(
+                "SELECT session_id, measurement_id, start_timestamp, end_timestamp FROM session_catalog "
+                "WHERE patient_id = %s ORDER BY measurement_id, start_timestamp",
+                (patient_id,),
+            )
+            rows = self.cursor.fetchall()
+            if not rows:
+                self._require_catalog("m.patient_id = %(patient_id)s", {"patient_id": patient_id})
+        else:
+            self.cursor.execute(
+                SESSION_BOUNDS_QUERY + "WHERE m.patient_id = %s ORDER BY ms.measurement_id, ms.start_timestamp",
+                (patient_id,),
+            )
+            rows = self.cursor.fetchall()
         timestamp_dict = {}
-        for measurement_id in self.get_all_measurement_ids_from_patient_id(patient_id):
-            for session_id in self.get_all_measurement_session_ids_from_measurement_id(measurement_id):
-                start_timestamp, end_timestamp = self.get_beginning_and_end_timestamp_from_measure_session(session_id)
-                timestamp_dict[f"{measurement_id}_{session_id}"] = (start_timestamp, end_timestamp)
+        for session_id, measurement_id, start_timestamp, end_timestamp in rows:
+            if end_timestamp is None:
+                print(f"Warning: No data found for session ID {session_id}.")
+                continue
+            timestamp_dict[f"{measurement_id}_{session_id}"] = (start_timestamp, end_timestamp)
         return timestamp_dict
 
     def get_all_ibi_from_patient_id(self, patient_id: str):
@@ -205,8 +690,8 @@ class Connection:
             relax_sessions_dict[f"{patient_id}_{patient_group}_{relax_id}"] = (start_timestamp, end_timestamp)
         return relax_sessions_dict
 
-    def get_all_sessions_from_patient_id(self, patient_id: str):
-        vitals = self.get_all_timestamps_from_patient_id(patient_id)
+    def get_all_sessions_from_patient_id(self, patient_id: str, use_catalog: bool = False):
+        vitals = self.get_all_timestamps_from_patient_id(patient_id, use_catalog)
         relax_sessions = self.get_all_relax_sessions_from_patient_id(patient_id)
         return vitals, relax_sessions
 
@@ -216,51 +701,46 @@ class Connection:
         )
         return [row[0] for row in self.cursor.fetchall()]
 
-    def get_all_measurement_sessions_from_patient_id_with_index(self, patient_id: str):
-        measurement_types = ["ACC_X", "ACC_Y", "ACC_Z", "BVP", "EDA", "HR", "IBI", "TEMP"]
-        session_list = []
-        for measurement_type in measurement_types:
+    def get_all_measurement_sessions_from_patient_id_with_index(self, patient_id: str, include_data: bool = True):
+        """
+        Retrieves the measure sessions of a patient grouped into the recordings they were made in.
+
+        Sessions are grouped from the session catalog with grouping.group_sessions, the data of all sessions is
+        fetched afterwards in one query.
+
+        Args:
+            patient_id (str): The ID of the patient.
+            include_data (bool): Fetch the data of the sessions, otherwise "data" is None.
+
+        Returns:
+            dict: Lists of session dicts keyed by the start of the first session of their group, as "%Y-%m-%d %H:%M".
+        """
+        sessions = grouping.group_sessions(self.catalog(patient_id))
+        data = {}
+        if include_data and not sessions.empty:
             self.cursor.execute(
-                "SELECT id, measurement_id, data "
-                "FROM measure_session "
-                "WHERE measurement_id "
-                "IN (SELECT id FROM measurement WHERE patient_id = %s AND measurement_type = %s) "
-                "ORDER BY id;",
-                (patient_id,measurement_type,),
+                f"SELECT ms.id, {SESSION_DATA} FROM measure_session ms WHERE ms.id = ANY(%s)",
+                ([int(session_id) for session_id in sessions["session_id"]],),
             )
-            sessions = self.cursor.fetchall()
-            for session in sessions:
-                session_id, measurement_id, data = session
-                start_timestamp, end_timestamp = self.get_beginning_and_end_timestamp_from_measure_session(session_id)
-                session_list.append({
-                    "patient_id": patient_id,
-                    "week": measurement_id.split("_")[2],  # Assuming week is part of the measurement ID
-                    "session_id": session_id,
-                    "measurement_id": measurement_id,
-                    "measurement_type": measurement_type,
-                    "start_timestamp": start_timestamp,
-                    "end_timestamp": end_timestamp,
-                    "data": data
-                })
-        # Group the sessions by start timestamp, they must have the same date, hour and minute
+            data = dict(self.cursor.fetchall())
+
         grouped_sessions = {}
-        for session in session_list:
-            start_time = session["start_timestamp"].strftime("%Y-%m-%d %H:%M")
-            if start_time not in grouped_sessions:
-                # Check if the next minute is already in the dictionary
-                next_minute = (session["start_timestamp"] + timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M")
-                # Check if the previous minute is already in the dictionary
-                previous_minute = (session["start_timestamp"] - timedelta(minutes=1)).strftime("%Y-%m-%d %H:%M")
-                if next_minute in grouped_sessions:
-                    # If the next minute is already in the dictionary, append the session to that minute
-                    grouped_sessions[next_minute].append(session)
-                    continue
-                elif previous_minute in grouped_sessions:
-                    # If the previous minute is already in the dictionary, append the session to that minute
-                    grouped_sessions[previous_minute].append(session)
-                    continue
-                grouped_sessions[start_time] = []
-            grouped_sessions[start_time].append(session)
+        for group_id, group in sessions.groupby("group_id", sort=False):
+            start_time = group["start_timestamp"].iloc[0].strftime("%Y-%m-%d %H:%M")
+            grouped_sessions[start_time] = [
+                {
+                    "patient_id": patient_id,
+                    "week": session.measurement_id.split("_")[2],  # Assuming week is part of the measurement ID
+                    "session_id": int(session.session_id),
+                    "measurement_id": session.measurement_id,
+                    "measurement_type": session.measurement_type,
+                    "start_timestamp": session.start_timestamp.to_pydatetime(),
+                    "end_timestamp": session.end_timestamp.to_pydatetime(),
+                    "group_id": group_id,
+                    "data": data.get(session.session_id),
+                }
+                for session in group.itertuples(index=False)
+            ]
         return grouped_sessions
 
     def set_invalid_data_indices(self, measurement_session_id: str, invalid_indices: list):
@@ -276,7 +756,9 @@ class Connection:
             "UPDATE measure_session SET invalid_data_indices = %s WHERE id = %s",
             (invalid_indices, measurement_session_id),
         )
+        self._update_catalog_invalid_fraction(measurement_session_id)
         self.conn.commit()
+        self.metadata.invalidate(session_id=measurement_session_id)
 
     def mark_session_as_group(self, measurement_session_id: str, group: str, patient_id: str, week: int, length: int):
         """
@@ -305,6 +787,37 @@ class Connection:
         )
         self.conn.commit()
 
+    def write_measure_groups(self, groups: pd.DataFrame, assignments: pd.DataFrame):
+        """
+        Upserts measure groups and sets the measure_group_id of their sessions in a single statement.
+
+        Args:
+            groups (pd.DataFrame): measure_group rows with the columns in grouping.GROUP_COLUMNS.
+            assignments (pd.DataFrame): "session_id" and "group_id" of the sessions to assign.
+        """
+        try:
+            self.cursor.execute(
+                "WITH g AS ("
+                "INSERT INTO measure_group (id, patient_id, week, length) "
+                "SELECT * FROM unnest(%s::TEXT[], %s::TEXT[], %s::week_enum[], %s::INTEGER[]) "
+                "ON CONFLICT (id) DO UPDATE SET week = EXCLUDED.week, length = EXCLUDED.length) "
+                "UPDATE measure_session ms SET measure_group_id = a.group_id "
+                "FROM unnest(%s::INTEGER[], %s::TEXT[]) AS a(session_id, group_id) "
+                "WHERE ms.id = a.session_id",
+                (
+                    groups["group_id"].tolist(),
+                    groups["patient_id"].tolist(),
+                    groups["week"].tolist(),
+                    [int(length) for length in groups["length"]],
+                    [int(session_id) for session_id in assignments["session_id"]],
+                    assignments["group_id"].tolist(),
+                ),
+            )
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+
     def get_all_measurement_groups_from_patient_id(self, patient_id: str):
         """
         Retrieves all measurement groups for a given patient ID.
@@ -331,12 +844,11 @@ class Connection:
         Returns:
             list: A list of tuples containing measurement session IDs and their associated data.
         """
-        # Get the id, measurement_id, start_timestamp, count of data and the invalid data indices for each session in the group
+        # Get the id, measurement_id, start_timestamp, number of data elements and the invalid data indices for each session in the group
         self.cursor.execute(
-            "SELECT ms.id, ms.measurement_id, ms.start_timestamp, COUNT(u.data_element), ms.invalid_data_indices "
-            "FROM measure_session ms, LATERAL unnest(ms.data) AS u(data_element) "
-            "WHERE ms.measure_group_id = %s "
-            "GROUP BY ms.id, ms.measurement_id, ms.start_timestamp, ms.invalid_data_indices "
+            f"SELECT ms.id, ms.measurement_id, ms.start_timestamp, {SESSION_CARDINALITY}, ms.invalid_data_indices "
+            "FROM measure_session ms "
+            f"WHERE ms.measure_group_id = %s AND {SESSION_CARDINALITY} > 0 "
             "ORDER BY ms.start_timestamp;",
             (group_id,),
         )
@@ -354,23 +866,142 @@ class Connection:
             "UPDATE measure_session SET invalid_data_indices = %s WHERE id = %s",
             (invalid_indices, measurement_session_id),
         )
+        self._update_catalog_invalid_fraction(measurement_session_id)
         self.conn.commit()
+        self.metadata.invalidate(session_id=measurement_session_id)
+
+    def write_quality_run(self, group_id: str, invalid_indices: dict, params: dict, session_ids: list,
+                          total_samples: int, invalid_samples: int):
+        """
+        Writes the invalid data indices of all sessions of a measure group and records the run in quality_run,
+        in a single transaction.
+
+        Args:
+            group_id (str): The ID of the measure group.
+            invalid_indices (dict): Lists of [start, end] index ranges per session ID.
+            params (dict): The marking parameters the indices depend on.
+            session_ids (list): The sorted IDs of the sessions of the group when it was marked.
+            total_samples (int): The number of samples of the group.
+            invalid_samples (int): The number of samples marked invalid.
+        """
+        try:
+            extras.execute_batch(
+                self.cursor,
+                "UPDATE measure_session SET invalid_data_indices = %s WHERE id = %s",
+                [(indices, session_id) for session_id, indices in invalid_indices.items()],
+            )
+            self._update_catalog_invalid_fraction(*invalid_indices)
+            self.cursor.execute(
+                "INSERT INTO quality_run (group_id, params, session_ids, total_samples, invalid_samples, finished_at) "
+                "VALUES (%s, %s, %s, %s, %s, now()) "
+                "ON CONFLICT (group_id) DO UPDATE SET params = EXCLUDED.params, session_ids = EXCLUDED.session_ids, "
+                "total_samples = EXCLUDED.total_samples, invalid_samples = EXCLUDED.invalid_samples, "
+                "finished_at = EXCLUDED.finished_at",
+                (group_id, extras.Json(params), session_ids, total_samples, invalid_samples),
+            )
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        for session_id in invalid_indices:
+            self.metadata.invalidate(session_id=session_id)
+
+    def get_pending_quality_groups(self, params: dict):
+        """
+        Retrieves the measure groups without an up-to-date quality run.
+
+        A run is outdated when the sessions of its group changed or when a parameter it depends on differs from
+        `params`, parameters it does not depend on may change freely.
+
+        Returns:
+            list: The IDs of the groups, ordered by patient.
+        """
+        self.cursor.execute(
+            "SELECT g.id FROM measure_group g LEFT JOIN quality_run q ON q.group_id = g.id "
+            "WHERE q.group_id IS NULL OR NOT q.params <@ %s::JSONB "
+            "OR q.session_ids IS DISTINCT FROM ARRAY("
+            "SELECT ms.id FROM measure_session ms "
+            f"WHERE ms.measure_group_id = g.id AND {SESSION_CARDINALITY} > 0 ORDER BY ms.id) "
+            "ORDER BY g.patient_id, g.id",
+            (extras.Json(params),),
+        )
+        return [row[0] for row in self.cursor.fetchall()]
 
-    def get_data_from_measure_session(self, session_id: str):
+    def get_quality_totals(self):
+        """
+        Returns the total number of samples of all marked groups and the number of them that are invalid.
+        """
+        self.cursor.execute(
+            "SELECT COALESCE(SUM(total_samples), 0), COALESCE(SUM(invalid_samples), 0) FROM quality_run"
+        )
+        total_samples, invalid_samples = self.cursor.fetchone()
+        return int(total_samples), int(invalid_samples)
+
+    def get_data_from_measure_session(self, session_id: str, return_numpy: bool = False):
         """
         Retrieves the data from a specific measurement session.
 
         Args:
             session_id (str): The ID of the measurement session.
+            return_numpy (bool): Return a float64 ndarray with the shape of the stored array instead of a list,
+                e.g. (n, 2) for IBI sessions.
 
         Returns:
             list: The data associated with the measurement session.
         """
-        self.cursor.execute(
-            "SELECT data FROM measure_session WHERE id = %s",
+        if self.cache is not None:
+            data = self._cached_session_data(session_id)
+            if data is None:
+                return None
+            return cached_rows(data, return_numpy)
+
+        cursor = self._array_cursor(return_numpy)
+        cursor.execute(
+            f"SELECT {SESSION_DATA_COLUMNS} FROM measure_session ms WHERE ms.id = %s",
             (session_id,),
         )
-        return self.cursor.fetchone()[0]
+        return stored_data(cursor.fetchone())
+
+    def _cached_session_data(self, session_id: str):
+        """
+        Retrieves the data of a measurement session from the disk cache, fetching and caching it on a miss.
+
+        Returns:
+            np.ndarray: The data of the session, int16 for SMALLINT[] sessions and float64 otherwise, or None when
+                the session does not exist or has no data.
+        """
+        self.cursor.execute("SELECT xmin::TEXT FROM measure_session WHERE id = %s", (session_id,))
+        result = self.cursor.fetchone()
+        if not result:
+            return None
+
+        data = self.cache.load(session_id, result[0])
+        if data is None:
+            # Fetch the version together with the data, the row may have changed since the first query
+            cursor = self._array_cursor(True)
+            cursor.execute(f"SELECT ms.xmin::TEXT, {SESSION_DATA_COLUMNS} FROM measure_session ms WHERE ms.id = %s",
+                           (session_id,))
+            result = cursor.fetchone()
+            if not result or stored_data(result[1:]) is None:
+                return None
+            # SMALLINT[] sessions are cached as int16, so their rows are ints like the ones the database returns
+            dtype = np.int16 if all(value is None for value in result[1:3]) else np.float64
+            data = self.cache.store(session_id, result[0], stored_data(result[1:]), dtype)
+        return data
+
+    def get_ibi_offsets_from_measure_session(self, session_id: str):
+        """
+        Retrieves only the beat offsets of an IBI session, the first column of its [offset, interval] rows.
+
+        Returns:
+            np.ndarray: The offsets in seconds, empty when the session does not exist.
+        """
+        cursor = self._array_cursor(True)
+        cursor.execute("SELECT data[:][1:1] FROM measure_session WHERE id = %s", (session_id,))
+        result = cursor.fetchone()
+        if not result or result[0] is None:
+            return np.empty(0)
+        return result[0].ravel()
 
     def get_invalid_data_indices_from_measure_session(self, session_id: str):
         """
@@ -382,77 +1013,51 @@ class Connection:
         Returns:
             list: A list of lists containing 2 integer indices that are considered invalid.
         """
-        self.cursor.execute(
-            "SELECT invalid_data_indices FROM measure_session WHERE id = %s",
-            (session_id,),
-        )
-        result = self.cursor.fetchone()
-        if result and result[0] is not None:
-            return result[0]
+        header = self.session_header(session_id)
+        if header and header.invalid_data_indices is not None:
+            return header.invalid_data_indices
         return []
 
-    def get_valid_data_from_measure_session(self, session_id: str):
+    def get_valid_data_from_measure_session(self, session_id: str, return_numpy: bool = False):
         """
         Retrieves the valid data from a specific measurement session, excluding invalid indices.
 
         Args:
             session_id (str): The ID of the measurement session.
+            return_numpy (bool): Return the segments as float64 ndarrays instead of lists.
 
         Returns:
             dictionary: A dictionary containing the start timestamp as the key and a list of valid data points as the value.
         """
-
-        def calculate_timestamp_segment(start, offset, measurement_type, data):
-            """
-            Calculate the start timestamp for a segment based on the segment length.
-            """
-            if measurement_type == 'X' or measurement_type == 'Y' or measurement_type == 'Z':
-                return start + timedelta(seconds=offset/32)
-            elif measurement_type == 'BVP':
-                return start + timedelta(seconds=offset/64)
-            elif measurement_type == 'HR':
-                return start + timedelta(seconds=offset)
-            elif measurement_type == 'EDA':
-                return start + timedelta(seconds=offset/4)
-            elif measurement_type == 'TEMP':
-                return start + timedelta(seconds=offset/4)
-            elif measurement_type == 'IBI':
-                return start + timedelta(seconds=data[offset][0])
-
-        self.cursor.execute(
-            "SELECT measurement_id, start_timestamp, data, invalid_data_indices FROM measure_session WHERE id = %s",
+        # The data is left out of the query when it can be read from the disk cache
+        cursor = self._array_cursor(return_numpy)
+        cursor.execute(
+            f"SELECT m.measurement_type, m.sample_rate, ms.start_timestamp, "
+            f"ms.invalid_data_indices, {'NULL' if self.cache is not None else SESSION_DATA_COLUMNS} "
+            "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id WHERE ms.id = %s",
             (session_id,),
         )
-        result = self.cursor.fetchone()
+        result = cursor.fetchone()
         if not result:
             return {}
 
-        measurement_id, start_timestamp, data, invalid_indices = result
-
-        # Use the invalid indices to split the data into valid segments
-        if invalid_indices:
-            valid_data = {}
-            measurement_type = measurement_id.split("_")[-1]
-            if invalid_indices[0][0] == 0 and invalid_indices[0][1] == -1:
-                # If the invalid indices cover the entire data, return an empty dictionary
-                return {}
-            for index, indices in enumerate(invalid_indices):
-                start_index, end_index = indices
-
-                if index == 0:
-                    # If this is the first invalid segment, add data before the first invalid index
-                    valid_data[start_timestamp] = data[:start_index]
-
-                elif index == len(invalid_indices) - 1:
-                    # If this is the last invalid segment, add the remaining data
-                    valid_data[calculate_timestamp_segment(start_timestamp, invalid_indices[index-1][1], measurement_type, data)] = data[invalid_indices[index-1][1]:]
-                else:
-                    # For all other segments, add the data between the previous invalid index and the current one
-                    valid_data[calculate_timestamp_segment(start_timestamp, invalid_indices[index-1][1], measurement_type, data)] = data[invalid_indices[index-1][1]:start_index]
-        else:
-            valid_data = {start_timestamp: data}
+        measurement_type, sample_rate, start_timestamp, invalid_indices = result[:4]
+        data = stored_data(result[4:])
+        if self.cache is not None:
+            data = self._cached_session_data(session_id)
+            if data is None:
+                data = np.empty(0) if return_numpy else []
+            else:
+                data = cached_rows(data, return_numpy)
+        if data is None:
+            return {}
 
-        return valid_data
+        mask = ValidityMask.from_invalid_indices(invalid_indices, len(data))
+        if measurement_type == "IBI":
+            # IBI rows are [offset, interval] pairs, the segments start at the offset of their first beat
+            offsets = np.asarray(data, dtype=np.float64).reshape(len(data), -1)[:, 0]
+            return mask.valid_segments(data, start_timestamp, offsets=offsets)
+        return mask.valid_segments(data, start_timestamp, sample_rate=sample_rate)
 
     def get_start_and_end_timestamps_from_measure_session_valid_data(self, session_id: str):
         """
@@ -462,120 +1067,27 @@ class Connection:
             session_id (str): The ID of the measurement session.
 
         Returns:
-            tuple: A tuple containing the start timestamp and end timestamp of the valid data.
-        """
-        def calculate_valid_indices_from_invalid_indices(invalid_indices, data_length):
-            """
-            Calculate the valid indices from the invalid indices.
-            """
-            valid_indices = []
-            if not invalid_indices:
-                return [(0, data_length - 1)]
-
-            # If the first invalid index is 0 and the last is -1, return an empty list
-            if invalid_indices[0] == [0, -1]:
-                return []
-
-            # Add the valid indices before the first invalid index
-            if invalid_indices[0][0] > 0:
-                valid_indices.append((0, invalid_indices[0][0] - 1))
-
-            # Add the valid indices between the invalid indices
-            for i in range(len(invalid_indices) - 1):
-                valid_indices.append((invalid_indices[i][1] + 1, invalid_indices[i + 1][0] - 1))
-
-            # Add the valid indices after the last invalid index
-            if invalid_indices[-1][1] < data_length - 1:
-                valid_indices.append((invalid_indices[-1][1] + 1, data_length - 1))
-
-            return valid_indices
-
-
-        def calculate_timestamp_for_index(session_start_timestamp, index, measurement_type, data = None):
-            """
-            Calculate the timestamp for a segment based on the index and measurement type.
-            """
-            if measurement_type in ['X', 'Y', 'Z']:
-                return session_start_timestamp + timedelta(seconds=index / 32)
-            elif measurement_type == 'BVP':
-                return session_start_timestamp + timedelta(seconds=index / 64)
-            elif measurement_type == 'HR':
-                return session_start_timestamp + timedelta(seconds=index)
-            elif measurement_type == 'EDA':
-                return session_start_timestamp + timedelta(seconds=index / 4)
-            elif measurement_type == 'TEMP':
-                return session_start_timestamp + timedelta(seconds=index / 4)
-            elif measurement_type == 'IBI':
-                return session_start_timestamp + timedelta(seconds=data[index][0])
-
-
-
-        invalid_indices = self.get_invalid_data_indices_from_measure_session(session_id)
-        timestamps = {session_id: []}
-
-        if not invalid_indices:
-            # Get the start timestamp and the count of the data points
-            self.cursor.execute(
-                "SELECT ms.start_timestamp, COUNT(u.data_element), ms.measurement_id "
-                "FROM measure_session ms, LATERAL unnest(ms.data) "
-                "AS u(data_element) "
-                "WHERE ms.id = %s "
-                "GROUP BY ms.start_timestamp, ms.measurement_id;",
-                (session_id,),
-            )
-            start_timestamp, count, measurement_id = self.cursor.fetchone()
-            if start_timestamp is None or count is None:
-                print(f"Warning: No data found for session ID {session_id}.")
-                return timestamps
-            else:
-                # Calculate the end timestamp by adding the count of data points divided by the sample rate to the start timestamp
-                measurement_type = measurement_id.split("_")[-1]
-                if measurement_type == 'IBI':
-                    # If the measurement type is IBI, we need to fetch the data to calculate the end timestamp
-                    self.cursor.execute(
-                        "SELECT data FROM measure_session WHERE id = %s",
-                        (session_id,),
-                    )
-                    data = self.cursor.fetchone()[0]
-                    end_timestamp = start_timestamp + timedelta(seconds=data[-1][0])
-                    return {session_id: [(start_timestamp, end_timestamp)]}
-                else:
-                    end_timestamp = calculate_timestamp_for_index(start_timestamp, count, measurement_type)
-                    return {session_id: [(start_timestamp, end_timestamp)]}
-        elif invalid_indices[0] == [0,-1]:
-            return timestamps
-        else:
-            # Get the start timestamp and the count of the data points
-            self.cursor.execute(
-                "SELECT ms.start_timestamp, COUNT(u.data_element), ms.measurement_id "
-                "FROM measure_session ms, LATERAL unnest(ms.data) "
-                "AS u(data_element) "
-                "WHERE ms.id = %s "
-                "GROUP BY ms.start_timestamp, ms.measurement_id;",
-                (session_id,),
-            )
-            start_timestamp, count, measurement_id = self.cursor.fetchone()
-            measurement_type = measurement_id.split("_")[-1]
+            dict: The session ID mapped to a list of (start timestamp, end timestamp) tuples, one per valid segment.
+        """
+        # Only the beat offsets of IBI sessions are needed, the other types follow from the sample rate
+        cursor = self._array_cursor(True)
+        cursor.execute(
+            f"SELECT ms.start_timestamp, {SESSION_LENGTH}, m.measurement_type, m.sample_rate, "
+            "ms.invalid_data_indices, CASE WHEN m.measurement_type = 'IBI' THEN ms.data[:][1:1] END "
+            "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+            "WHERE ms.id = %s;",
+            (session_id,),
+        )
+        result = cursor.fetchone()
+        if not result or result[0] is None or result[1] is None:
+            print(f"Warning: No data found for session ID {session_id}.")
+            return {session_id: []}
 
-            if measurement_type == 'IBI':
-                valid_indices = calculate_valid_indices_from_invalid_indices(invalid_indices, round(count/2))
-                # If the measurement type is IBI, we need to fetch the data to calculate the end timestamp
-                self.cursor.execute(
-                    "SELECT data FROM measure_session WHERE id = %s",
-                    (session_id,),
-                )
-                data = self.cursor.fetchone()[0]
-                for start_index, end_index in valid_indices:
-                    start_time = calculate_timestamp_for_index(start_timestamp, start_index, measurement_type, data)
-                    end_time = calculate_timestamp_for_index(start_timestamp, end_index, measurement_type, data)
-                    timestamps[session_id].append((start_time, end_time))
-            else:
-                valid_indices = calculate_valid_indices_from_invalid_indices(invalid_indices, count)
-                for start_index, end_index in valid_indices:
-                    start_time = calculate_timestamp_for_index(start_timestamp, start_index, measurement_type)
-                    end_time = calculate_timestamp_for_index(start_timestamp, end_index, measurement_type)
-                    timestamps[session_id].append((start_time, end_time))
-            return timestamps
+        start_timestamp, length, measurement_type, sample_rate, invalid_indices, offsets = result
+        mask = ValidityMask.from_invalid_indices(invalid_indices, length)
+        if measurement_type == "IBI":
+            return {session_id: mask.segment_timestamps(start_timestamp, offsets=offsets)}
+        return {session_id: mask.segment_timestamps(start_timestamp, sample_rate=sample_rate)}
 
     def get_total_e4_time_from_patient_id(self, patient_id: str):
         """
@@ -604,15 +1116,282 @@ class Connection:
             return int(total_time)
 
 
-    def get_data_from_measure_session_with_index(self, measure_id: str, start: int, stop: int):
+    def get_data_from_measure_session_with_index(self, measure_id: str, start: int, stop: int,
+                                                 return_numpy: bool = False):
         """
         Retrieves the data from a specific measurement session, including the start timestamp and index.
+
+        With `return_numpy` the slice is returned as a float64 ndarray instead of a list.
         """
-        self.cursor.execute("SELECT data[%s:%s] FROM measure_session WHERE id = %s",
-                       (start, stop, measure_id))
-        result = self.cursor.fetchone()
-        if result and result[0] is not None:
-            return result[0]
+        if self.cache is not None:
+            data = self._cached_session_data(measure_id)
+            if data is not None:
+                data = slice_rows(data, start, stop)
+                return cached_rows(data, return_numpy)
+            return None
+
+        return self.fetch_windows([(measure_id, start, stop)], return_numpy)[0]
+
+    def fetch_windows(self, requests, return_numpy: bool = False):
+        """
+        Retrieves many slices of measurement sessions in one query.
+
+        Args:
+            requests (list): (session_id, start, stop) tuples, with the same 1-based inclusive indices as
+                `get_data_from_measure_session_with_index`.
+            return_numpy (bool): Return the slices as float64 ndarrays instead of lists.
+
+        Returns:
+            list: The data of every slice in the order of the requests, None for sessions that do not exist.
+        """
+        requests = [(int(session_id), int(start), int(stop)) for session_id, start, stop in requests]
+        if not requests:
+            return []
+        if self.cache is not None:
+            return [self.get_data_from_measure_session_with_index(session_id, start, stop, return_numpy)
+                    for session_id, start, stop in requests]
+
+        session_ids, starts, stops = (list(column) for column in zip(*requests))
+        slices = self._fetch_slices(
+            "SELECT n, session_id, start_index, stop_index "
+            "FROM unnest(%s::INT[], %s::INT[], %s::INT[]) WITH ORDINALITY AS u(session_id, start_index, stop_index, n)",
+            (session_ids, starts, stops),
+            return_numpy,
+        )
+        # Chunked sessions without a chunk in the slice return no rows at all
+        empty = np.empty(0) if return_numpy else []
+        return [slices[n][1] if n in slices else empty for n in range(1, len(requests) + 1)]
+
+    def _fetch_slices(self, windows_query: str, parameters, return_numpy: bool):
+        """
+        Slices the sessions of the windows that `windows_query` selects, see WINDOW_SLICES_QUERY.
+
+        Returns:
+            dict: The window number mapped to the row of the window and its data, None for missing sessions.
+        """
+        cursor = self._array_cursor(return_numpy)
+        cursor.execute(f"WITH r AS ({windows_query}) {WINDOW_SLICES_QUERY}", parameters)
+
+        windows = {}
+        pieces = {}
+        for *window, _, data, data_f4, data_i2 in cursor.fetchall():
+            windows[window[0]] = tuple(window)
+            pieces.setdefault(window[0], []).append(stored_data((data, data_f4, data_i2)))
+        return {n: (windows[n], self._join_chunks(pieces[n], return_numpy)) for n in windows}
+
+    def _read_time_windows(self, condition: str, parameters: dict, return_numpy: bool):
+        """
+        Reads the rows between `t0` and `t1` of the catalogued sessions that match `condition`.
+
+        Returns:
+            list: (start_timestamp, sample_rate, first_row, data) tuples in the order the sessions start, where
+                first_row is the row of the session the data starts at. IBI sessions only hold the beats whose
+                offset lies in the window.
+        """
+        windows_query = TIME_WINDOWS_QUERY.format(condition=condition)
+        if self.cache is not None:
+            self.cursor.execute(windows_query, parameters)
+            slices = []
+            for window in self.cursor.fetchall():
+                data = self._cached_session_data(window[1])
+                if data is not None:
+                    data = slice_rows(data, window[2], window[3])
+                    data = cached_rows(data, return_numpy)
+                slices.append((window, data))
+        else:
+            slices = list(self._fetch_slices(windows_query, parameters, return_numpy).values())
+
+        result = []
+        for (_, _, start_index, _, start_timestamp, sample_rate, is_ibi), data in slices:
+            if data is None:
+                continue
+            first_row = max(start_index, 1) - 1
+            if is_ibi and len(data):
+                # The beats are sorted by their offset, which is searched instead of assuming a sample rate
+                offsets = np.asarray(data, dtype=np.float64).reshape(len(data), -1)[:, 0]
+                first, last = np.searchsorted(offsets, [(parameters["t0"] - start_timestamp).total_seconds(),
+                                                        (parameters["t1"] - start_timestamp).total_seconds()])
+                data = data[first:last]
+                first_row = int(first)
+            result.append((start_timestamp, None if is_ibi else sample_rate, first_row, data))
+        return result
+
+    def read_range(self, session_id: str, t0: datetime, t1: datetime, return_numpy: bool = False):
+        """
+        Retrieves the rows of a measurement session that were recorded from `t0` up to, but not including, `t1`.
+
+        The timestamps are converted to indices in the database with the sample rate, for IBI sessions the beats
+        are selected by their offset. Requires the session catalog.
+
+        Args:
+            session_id (str): The ID of the measurement session.
+            t0 (datetime): Start of the window.
+            t1 (datetime): End of the window.
+            return_numpy (bool): Return a float64 ndarray instead of a list.
+
+        Returns:
+            list: The rows in the window, None when the session does not exist.
+        """
+        slices = self._read_time_windows("sc.session_id = %(session_id)s",
+                                         {"session_id": int(session_id), "t0": t0, "t1": t1}, return_numpy)
+        if not slices:
+            self._require_catalog("ms.id = %(session_id)s", {"session_id": int(session_id)})
+            return None
+        return slices[0][3]
+
+    def read_signal(self, patient_id: str, measurement_type: str, t0: datetime, t1: datetime):
+        """
+        Retrieves a signal of a patient from `t0` up to, but not including, `t1`, stitched across sessions.
+
+        Every session that overlaps the window is sliced in the same query. Requires the session catalog.
+
+        Args:
+            patient_id (str): The ID of the patient.
+            measurement_type (str): The measurement type, e.g. "HR", "ACC_X" or "IBI".
+            t0 (datetime): Start of the window.
+            t1 (datetime): End of the window.
+
+        Returns:
+            tuple: The timestamp of every row as a datetime64 array and the rows as a float64 ndarray.
+        """
+        slices = self._read_time_windows(
+            "sc.patient_id = %(patient_id)s AND sc.measurement_type = %(measurement_type)s "
+            "AND sc.start_timestamp < %(t1)s AND sc.end_timestamp > %(t0)s",
+            {"patient_id": patient_id, "measurement_type": measurement_type, "t0": t0, "t1": t1},
+            return_numpy=True,
+        )
+        if not slices:
+            self._require_catalog("m.patient_id = %(patient_id)s AND m.measurement_type = %(measurement_type)s",
+                                  {"patient_id": patient_id, "measurement_type": measurement_type})
+
+        timestamps = []
+        data = []
+        for start_timestamp, sample_rate, first_row, rows in slices:
+            if not len(rows):
+                continue
+            if sample_rate is None:
+                seconds = rows.reshape(len(rows), -1)[:, 0]
+            else:
+                seconds = (first_row + np.arange(len(rows))) / sample_rate
+            timestamps.append(np.datetime64(start_timestamp, "us") + np.round(seconds * 1e6).astype("timedelta64[us]"))
+            data.append(rows)
+        if not data:
+            return np.empty(0, dtype="datetime64[us]"), np.empty(0)
+        return np.concatenate(timestamps), np.concatenate(data)
+
+    @staticmethod
+    def _join_chunks(pieces, return_numpy: bool):
+        # A single piece is the slice of an unchunked session, or None when the session does not exist
+        if len(pieces) == 1:
+            return pieces[0]
+        # Empty slices come back as zero-dimensional arrays, which cannot be joined to rows of 2-D data
+        pieces = [piece for piece in pieces if len(piece)]
+        if return_numpy:
+            return np.concatenate(pieces) if pieces else np.empty(0)
+        return [row for piece in pieces for row in piece]
+
+    def chunk_measure_sessions(self, session_ids=None, chunk_seconds: int = CHUNK_SECONDS):
+        """
+        Stores a chunked copy of measure sessions in `measure_chunk`, so slices only read the chunks they overlap.
+
+        Every chunk holds `chunk_seconds` of samples, in the same column and array type as the session itself, so
+        chunks of a compacted session are SMALLINT[] or REAL[] as well. The full array stays in `measure_session`
+        for reads of whole sessions, a chunked session takes about twice its own space. IBI sessions are not
+        chunked, their rows are beats instead of samples. Every session is committed on its own, an interrupted
+        run continues with the sessions that are not chunked yet.
+
+        Args:
+            session_ids (list): The sessions to chunk, all sessions that are not chunked yet when omitted.
+            chunk_seconds (int): Duration of a chunk.
+
+        Returns:
+            int: The number of sessions that were chunked.
+        """
+        query = (
+            "SELECT ms.id, GREATEST(1, round(%s * m.sample_rate))::INT "
+            "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+            "WHERE ms.chunk_rows IS NULL AND m.measurement_type <> 'IBI'"
+        )
+        if session_ids is None:
+            self.cursor.execute(query + " ORDER BY ms.id", (chunk_seconds,))
+        else:
+            self.cursor.execute(query + " AND ms.id = ANY(%s) ORDER BY ms.id",
+                                (chunk_seconds, [int(session_id) for session_id in session_ids]))
+
+        chunked = 0
+        cursor = self._array_cursor(return_numpy=True)
+        for session_id, chunk_rows in self.cursor.fetchall():
+            # The array is read once and split locally, slicing it in the database would detoast it per chunk
+            cursor.execute(f"SELECT {SESSION_DATA_COLUMNS} FROM measure_session ms WHERE ms.id = %s", (session_id,))
+            columns = cursor.fetchone()
+            # The NumPy cursor widens every array to float64, the chunks are written in the type of the session
+            column, dtype = next(((column, dtype) for (column, dtype), values
+                                  in zip(SESSION_DATA_DTYPES.items(), columns) if values is not None),
+                                 ("data", np.float64))
+            data = stored_data(columns)
+            chunks = binary_copy.encode_measure_chunks(session_id, data if data is not None else [], chunk_rows, dtype)
+            try:
+                self.cursor.copy_expert(
+                    f"COPY measure_chunk (session_id, chunk_no, {column}) FROM STDIN WITH (FORMAT binary)",
+                    binary_copy.CopyStream(chunks),
+                    size=COPY_BUFFER_SIZE,
+                )
+                self.cursor.execute("UPDATE measure_session SET chunk_rows = %s WHERE id = %s", (chunk_rows, session_id))
+            except Exception:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+            chunked += 1
+        return chunked
+
+    def compact_measure_sessions(self, session_ids=None):
+        """
+        Moves the samples of measure sessions from FLOAT[] to a compact array type in one transaction.
+
+        ACC sessions are stored as SMALLINT[], which only happens when every sample is a whole number that the
+        conversion keeps exactly. BVP, EDA, HR and TEMP sessions are stored as REAL[], which keeps about seven
+        significant digits. IBI sessions keep their FLOAT[] offsets. The connector reads compact sessions as before,
+        ndarrays from them are float64. Run VACUUM FULL measure_session afterwards to return the space.
+
+        Args:
+            session_ids (list): The sessions to compact, all sessions when omitted.
+
+        Returns:
+            int: The number of sessions that were compacted.
+        """
+        condition = "" if session_ids is None else " AND ms.id = ANY(%(session_ids)s)"
+        parameters = {"session_ids": [int(session_id) for session_id in session_ids or []]}
+        compacted = 0
+        try:
+            self.cursor.execute(
+                "UPDATE measure_session ms SET data_i2 = ms.data::SMALLINT[], data = NULL "
+                "FROM measurement m WHERE m.id = ms.measurement_id "
+                "AND m.measurement_type IN ('ACC_X', 'ACC_Y', 'ACC_Z') AND ms.data IS NOT NULL "
+                # Skip sessions that would not survive the cast without casting them, a sample out of the SMALLINT
+                # range or NaN makes the cast raise and would roll back the whole UPDATE
+                "AND NOT EXISTS (SELECT 1 FROM unnest(ms.data) v "
+                "WHERE v = 'NaN' OR v NOT BETWEEN -32768 AND 32767 OR v <> trunc(v))" + condition,
+                parameters,
+            )
+            compacted += self.cursor.rowcount
+            self.cursor.execute(
+                "UPDATE measure_session ms SET data_f4 = ms.data::REAL[], data = NULL "
+                "FROM measurement m WHERE m.id = ms.measurement_id "
+                "AND m.measurement_type IN ('BVP', 'EDA', 'HR', 'TEMP') AND ms.data IS NOT NULL" + condition,
+                parameters,
+            )
+            compacted += self.cursor.rowcount
+            # Chunks written before their session was compacted get its type, their values are those of the session
+            for column, array_type in (("data_i2", "SMALLINT[]"), ("data_f4", "REAL[]")):
+                self.cursor.execute(
+                    f"UPDATE measure_chunk c SET {column} = c.data::{array_type}, data = NULL FROM measure_session ms "
+                    f"WHERE ms.id = c.session_id AND ms.{column} IS NOT NULL AND c.data IS NOT NULL"
+                )
+        except Exception:
+            self.conn.rollback()
+            raise
+        self.conn.commit()
+        return compacted
 
     def get_sample_rate_from_measurement_session_id(self, measure_id: str):
         """
@@ -624,14 +1403,144 @@ class Connection:
         Returns:
             float: The sample rate of the measurement session.
         """
-        self.cursor.execute("SELECT measurement_id FROM measure_session WHERE id = %s", (measure_id,))
-        result = self.cursor.fetchone()
-        self.cursor.execute("SELECT sample_rate FROM measurement WHERE id = %s", (result[0],))
-        sample_rate = self.cursor.fetchone()
-        if sample_rate and sample_rate[0] is not None:
-            return int(sample_rate[0])
+        header = self.session_header(measure_id)
+        if header and header.sample_rate is not None:
+            return int(header.sample_rate)
+
+    def patient_metadata(self, patient_id: str):
+        """
+        Retrieves the metadata of a patient with the headers of all its measure sessions.
+
+        The first lookup of a patient reads everything in one query, later lookups are served from the metadata
+        cache of the process until the patient is changed through the connector.
+
+        Returns:
+            PatientMetadata: The metadata, or None when the patient does not exist.
+        """
+        cached = self.metadata.get(patient_id)
+        if cached is not None:
+            return cached
+        return self._load_patient_metadata("SELECT %s::TEXT AS id", (patient_id,))
+
+    def session_header(self, session_id: str):
+        """
+        Retrieves the header of a measure session from the metadata cache, loading its whole patient on a miss.
+
+        Returns:
+            SessionHeader: The header, or None when the session does not exist.
+        """
+        header = self.metadata.get_session(session_id)
+        if header is not None:
+            return header
+        patient = self._load_patient_metadata(
+            "SELECT m.patient_id AS id FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+            "WHERE ms.id = %s",
+            (int(session_id),),
+        )
+        return patient.sessions.get(int(session_id)) if patient else None
+
+    def _load_patient_metadata(self, target: str, parameters):
+        self.cursor.execute(PATIENT_METADATA_QUERY.format(target=target), parameters)
+        rows = self.cursor.fetchall()
+        if not rows:
+            return None
+
+        patient_id, origin, patient_group, age, sex, relax_count, duration = rows[0][:7]
+        patient = metadata.PatientMetadata(
+            patient_id=patient_id,
+            origin=origin,
+            patient_group=patient_group,
+            age=age,
+            sex=sex,
+            relax_count=relax_count,
+            mean_relax_duration=float(duration) if duration is not None else 0,
+        )
+        for row in rows:
+            session_id, measurement_id, measurement_type, week, sample_rate, start_timestamp, invalid_indices = row[7:]
+            # Patients without measure sessions come back as a single row without a session
+            if session_id is not None:
+                patient.sessions[session_id] = metadata.SessionHeader(
+                    session_id=session_id,
+                    measurement_id=measurement_id,
+                    measurement_type=measurement_type,
+                    week=week,
+                    sample_rate=sample_rate,
+                    start_timestamp=start_timestamp,
+                    invalid_data_indices=invalid_indices,
+                )
+        self.metadata.put(patient)
+        return patient
+
+    def refresh_session_catalog(self, patient_id: str = None):
+        """
+        Recomputes the session catalog from the measure sessions, for example to backfill an existing database.
+
+        Args:
+            patient_id (str): Only refresh the sessions of this patient, all sessions are refreshed when omitted.
+        """
+        self.cursor.execute(
+            SESSION_CATALOG_UPSERT.format(condition="(%s::TEXT IS NULL OR m.patient_id = %s)"),
+            (patient_id, patient_id),
+        )
+        self.conn.commit()
+
+    def catalog(self, patient_id: str = None):
+        """
+        Retrieves the metadata of measure sessions without touching their data.
+
+        Args:
+            patient_id (str): Only return the sessions of this patient, all sessions are returned when omitted.
+
+        Returns:
+            pd.DataFrame: One row per session with the columns in CATALOG_COLUMNS, ordered by patient,
+                measurement and start timestamp.
+        """
+        self.cursor.execute(
+            f"SELECT {', '.join(CATALOG_COLUMNS)} FROM session_catalog "
+            "WHERE (%s::TEXT IS NULL OR patient_id = %s) "
+            "ORDER BY patient_id, measurement_id, start_timestamp",
+            (patient_id, patient_id),
+        )
+        rows = self.cursor.fetchall()
+        if not rows:
+            self._require_catalog("(%(patient_id)s::TEXT IS NULL OR m.patient_id = %(patient_id)s)",
+                                  {"patient_id": patient_id})
+        return pd.DataFrame(rows, columns=CATALOG_COLUMNS)
+
+    def _require_catalog(self, condition: str, parameters: dict):
+        """
+        Raises when measure sessions matching `condition` are missing from the session catalog, so an empty
+        result of a catalog query is not mistaken for a patient without sessions.
+        """
+        self.cursor.execute(UNCATALOGUED_SESSIONS_QUERY.format(condition=condition), parameters)
+        if self.cursor.fetchone()[0]:
+            raise RuntimeError("The session catalog is missing measure sessions, backfill it with "
+                               "1-DB/1-6_Backfill_session_catalog.py or Connection.refresh_session_catalog().")
+
+    def _update_catalog_invalid_fraction(self, *session_ids):
+        self.cursor.execute(
+            f"UPDATE session_catalog sc SET invalid_fraction = {_invalid_fraction('sc.n_samples')} "
+            "FROM measure_session ms WHERE ms.id = sc.session_id AND sc.session_id = ANY(%s)",
+            ([int(session_id) for session_id in session_ids],),
+        )
+
+    def _array_cursor(self, return_numpy: bool):
+        """
+        Returns the cursor to read FLOAT[] columns with, the NumPy cursor parses them into ndarrays.
+        """
+        if not return_numpy:
+            return self.cursor
+        if self._numpy_cursor is None:
+            self._numpy_cursor = self.conn.cursor()
+            extensions.register_type(NUMPY_FLOAT8_ARRAY, self._numpy_cursor)
+        return self._numpy_cursor
 
     def close(self):
-        self.cursor.close()
-        self.conn.close()
+        if not self._finalizer.alive:
+            return
+        if not self.cursor.closed:
+            self.cursor.close()
+        if self._numpy_cursor is not None and not self._numpy_cursor.closed:
+            self._numpy_cursor.close()
+        self._finalizer()
 
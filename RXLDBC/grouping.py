@@ -0,0 +1,88 @@
+from datetime import timedelta
+
+import numpy as np
+import pandas as pd
+
+# The E4 starts all its sessions of a recording within a minute of each other
+GROUP_TOLERANCE = timedelta(minutes=1)
+
+GROUP_COLUMNS = ["group_id", "patient_id", "week", "length"]
+
+
+def group_sessions(catalog: pd.DataFrame, tolerance: timedelta = GROUP_TOLERANCE):
+    """
+    Clusters measure sessions into the recordings they were made in, using only their catalog metadata.
+
+    Sessions are swept in order of their start timestamp, truncated to the minute. A session starts a new group
+    when it starts more than `tolerance` after the first session of the current group, otherwise it joins it.
+
+    Args:
+        catalog (pd.DataFrame): Sessions with the columns of `Connection.catalog`.
+        tolerance (timedelta): How much later than the first session of a group a session may start.
+
+    Returns:
+        pd.DataFrame: The catalog ordered by start timestamp with a "group_id" column added. Group IDs are
+            "{patient_id}_{week}_{unix start}", with the week number as in the measurement ID.
+    """
+    sessions = catalog.sort_values(["patient_id", "start_timestamp", "session_id"], kind="stable")
+    sessions = sessions.reset_index(drop=True)
+    if sessions.empty:
+        return sessions.assign(group_id=pd.Series(dtype=object))
+
+    minutes = pd.to_datetime(sessions["start_timestamp"]).dt.floor("min").to_numpy()
+    patients = sessions["patient_id"].to_numpy()
+    tolerance = np.timedelta64(tolerance)
+
+    # Sweep over the start times, the first session of every group is its anchor
+    first = np.zeros(len(sessions), dtype=np.int64)
+    anchor = 0
+    for i in range(1, len(sessions)):
+        if patients[i] != patients[anchor] or minutes[i] - minutes[anchor] > tolerance:
+            anchor = i
+        first[i] = anchor
+
+    anchors = sessions.iloc[first]
+    unix = (pd.to_datetime(anchors["start_timestamp"]) - pd.Timestamp("1970-01-01")) // pd.Timedelta("1s")
+    week = anchors["measurement_id"].str.split("_").str[2]
+    sessions["group_id"] = (anchors["patient_id"] + "_" + week + "_" + unix.astype(str)).to_numpy()
+    return sessions
+
+
+def measure_groups(sessions: pd.DataFrame):
+    """
+    Summarizes grouped sessions to measure_group rows.
+
+    Args:
+        sessions (pd.DataFrame): The result of `group_sessions`.
+
+    Returns:
+        pd.DataFrame: One row per group with the columns in GROUP_COLUMNS, the length is the number of seconds
+            from the first start to the last end of its sessions.
+    """
+    groups = sessions.groupby("group_id", sort=False).agg(
+        patient_id=("patient_id", "first"),
+        week=("week", "first"),
+        start_timestamp=("start_timestamp", "min"),
+        end_timestamp=("end_timestamp", "max"),
+    ).reset_index()
+    length = (pd.to_datetime(groups["end_timestamp"]) - pd.to_datetime(groups["start_timestamp"])).dt.total_seconds()
+    groups["length"] = length.fillna(0).round().astype(int)
+    return groups[GROUP_COLUMNS]
+
+
+def assign_groups(conn, patient_id: str, tolerance: timedelta = GROUP_TOLERANCE):
+    """
+    Groups the measure sessions of a patient and writes the groups with a single statement.
+
+    Args:
+        conn (Connection): The database connection.
+        patient_id (str): The ID of the patient.
+        tolerance (timedelta): See `group_sessions`.
+
+    Returns:
+        pd.DataFrame: The catalog of the patient with the "group_id" of every session.
+    """
+    sessions = group_sessions(conn.catalog(patient_id), tolerance)
+    if not sessions.empty:
+        conn.write_measure_groups(measure_groups(sessions), sessions[["session_id", "group_id"]])
+    return sessions
@@ -0,0 +1,96 @@
+from collections import OrderedDict
+from datetime import datetime
+
+import numpy as np
+
+# Offset columns kept per process, a patient has a few IBI sessions that every relax session looks up
+CACHE_SIZE = 64
+
+_offsets_cache = OrderedDict()
+
+
+class IbiOffsets:
+    """
+    The beat offsets of an IBI session, for looking up the rows of beats by time.
+
+    IBI rows are [offset, interval] pairs with the offset in seconds since the start of the session. The offsets
+    only increase, so every lookup is a binary search and accepts many boundaries at once.
+
+    Args:
+        offsets (np.ndarray): The offsets in seconds, one per row.
+    """
+    def __init__(self, offsets):
+        self.offsets = np.asarray(offsets, dtype=np.float64).ravel()
+
+    @classmethod
+    def from_data(cls, data):
+        """
+        Creates the offsets from the rows of an IBI session.
+        """
+        data = np.asarray(data, dtype=np.float64)
+        return cls(data.reshape(len(data), -1)[:, 0] if len(data) else data)
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def nearest(self, seconds):
+        """
+        Finds the beat closest to every offset.
+
+        Args:
+            seconds: An offset or array of offsets in seconds.
+
+        Returns:
+            tuple: The row index of the closest beat and its distance in seconds, with the shape of `seconds`.
+                Ties go to the earlier beat.
+        """
+        seconds = np.asarray(seconds, dtype=np.float64)
+        if not len(self):
+            raise ValueError("Cannot look up offsets in an IBI session without beats.")
+        # The closest beat is the first one at or after the offset, or the one before it
+        right = np.minimum(np.searchsorted(self.offsets, seconds), len(self) - 1)
+        left = np.maximum(right - 1, 0)
+        use_left = np.abs(seconds - self.offsets[left]) <= np.abs(self.offsets[right] - seconds)
+        index = np.where(use_left, left, right)
+        return index, np.abs(self.offsets[index] - seconds)
+
+    def index_ranges(self, start_seconds, end_seconds):
+        """
+        Finds the first and last row of the beats with an offset in [start, end], both included.
+
+        Returns:
+            tuple: Arrays of the first and last row, where first > last marks a range without beats.
+        """
+        first = np.searchsorted(self.offsets, np.asarray(start_seconds, dtype=np.float64), side="left")
+        last = np.searchsorted(self.offsets, np.asarray(end_seconds, dtype=np.float64), side="right") - 1
+        return first, last
+
+    def timestamp_ranges_to_index_ranges(self, timestamp_ranges, stream_start: datetime):
+        """
+        Converts (start, end) timestamp ranges to [first, last] row ranges, leaving out ranges without beats.
+        """
+        if not timestamp_ranges:
+            return []
+        seconds = np.array([[(start - stream_start).total_seconds(), (end - stream_start).total_seconds()]
+                            for start, end in timestamp_ranges])
+        first, last = self.index_ranges(seconds[:, 0], seconds[:, 1])
+        keep = first <= last
+        return [[int(start), int(end)] for start, end in zip(first[keep], last[keep])]
+
+
+def offsets(conn, session_id):
+    """
+    Returns the IbiOffsets of a session, only the offset column is fetched and it is kept for later lookups.
+
+    The offsets of a session never change after it was loaded, so cached columns do not go stale.
+    """
+    session_id = int(session_id)
+    if session_id in _offsets_cache:
+        _offsets_cache.move_to_end(session_id)
+        return _offsets_cache[session_id]
+
+    result = IbiOffsets(conn.get_ibi_offsets_from_measure_session(session_id))
+    _offsets_cache[session_id] = result
+    if len(_offsets_cache) > CACHE_SIZE:
+        _offsets_cache.popitem(last=False)
+    return result
@@ -0,0 +1,329 @@
+import os
+import queue
+import tempfile
+import threading
+import zipfile
+from contextlib import ExitStack, contextmanager
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+from RXLDBC import binary_copy, connect, runner
+
+# Rows parsed per chunk, 64k rows of BVP are about 17 minutes of recording
+CHUNK_ROWS = 1 << 16
+# Encoded chunks the parser may run ahead of the database
+QUEUE_DEPTH = 8
+# Bytes of encoded elements a session keeps in memory while its CSV is parsed, the rest is spooled to disk
+SPOOL_SIZE = 64 << 20
+# Bytes of a spooled session handed to the COPY stream at a time
+SPOOL_READ_SIZE = 1 << 20
+# Lines before the samples in an Empatica CSV: the start timestamp and the sample rate
+HEADER_LINES = 2
+
+MEASUREMENT_TYPES = ["ACC", "BVP", "EDA", "HR", "IBI", "TEMP"]
+ACC_AXES = ["ACC_X", "ACC_Y", "ACC_Z"]
+
+
+@dataclass
+class SessionSource:
+    """
+    The measure sessions of one CSV that is still inside an Empatica zip archive.
+
+    Args:
+        measurement_id (str): The measurement of the session, all columns are read as one 2-D array.
+        zip_path (str): Path of the zip archive.
+        member (str): Name of the CSV inside the archive.
+        column_ids (list): Split the CSV into one 1-D session per column instead, with these measurement IDs,
+            e.g. the ACC axes. The CSV is still parsed only once.
+    """
+    measurement_id: str = None
+    zip_path: str = None
+    member: str = None
+    column_ids: list = None
+
+
+@contextmanager
+def _open_member(zip_path: str, member: str):
+    # Every pass opens the archive itself, so passes never share a file position
+    with zipfile.ZipFile(zip_path, "r") as archive, archive.open(member) as file:
+        yield file
+
+
+def _read_start_timestamp(source: SessionSource):
+    """
+    Reads the start timestamp from the first line of a CSV, only the start of the member is decompressed.
+    """
+    with _open_member(source.zip_path, source.member) as file:
+        first_line = file.readline()
+    return datetime.fromtimestamp(float(first_line.split(b",")[0]))
+
+
+def _encode_source(source: SessionSource, chunk_rows: int, ingest_id: int = None):
+    """
+    Encodes the measure sessions of a CSV as binary COPY rows, parsing it once in chunks of `chunk_rows` rows.
+
+    The array header of a row holds the number of rows, which is only known once the whole CSV is parsed, so the
+    encoded elements are spooled until then. Spools stay in memory up to SPOOL_SIZE bytes and move to a
+    temporary file beyond that.
+    """
+    start_timestamp = _read_start_timestamp(source)
+    measurement_ids = source.column_ids or [source.measurement_id]
+
+    with ExitStack() as stack:
+        spools = [stack.enter_context(tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE)) for _ in measurement_ids]
+        rows = columns = 0
+        with _open_member(source.zip_path, source.member) as file:
+            try:
+                reader = pd.read_csv(file, header=None, skiprows=HEADER_LINES, chunksize=chunk_rows,
+                                     dtype=np.float64, engine="c")
+            except pd.errors.EmptyDataError:
+                # A session without samples
+                reader = []
+            for chunk in reader:
+                values = chunk.to_numpy()
+                rows, columns = rows + len(values), values.shape[1]
+                if source.column_ids:
+                    for index, spool in enumerate(spools):
+                        spool.write(binary_copy.encode_float8_elements(values[:, index]))
+                else:
+                    spools[0].write(binary_copy.encode_float8_elements(values))
+
+        for measurement_id, spool in zip(measurement_ids, spools):
+            shape = (rows,) if source.column_ids else (rows, columns)
+            yield binary_copy.encode_measure_session_header(measurement_id, start_timestamp, shape, ingest_id)
+            spool.seek(0)
+            while data := spool.read(SPOOL_READ_SIZE):
+                yield data
+
+
+def stream_measure_sessions(sources, chunk_rows: int = CHUNK_ROWS, queue_depth: int = QUEUE_DEPTH,
+                            ingest_id: int = None):
+    """
+    Encodes measure sessions from zip archives into a binary COPY stream for `Connection.copy_measure_sessions`.
+
+    A producer thread parses the CSVs in chunks and hands the encoded sessions over through a bounded queue, so
+    parsing a CSV overlaps with sending the sessions before it to the database. Sessions are spooled while their
+    CSV is parsed, so memory use does not grow with the length of a recording.
+    Errors in the producer are raised from the stream, which aborts the COPY.
+
+    Args:
+        sources (iterable): SessionSource objects, consumed by the producer thread.
+        chunk_rows (int): Rows parsed per chunk.
+        queue_depth (int): Encoded chunks that may wait in the queue.
+        ingest_id (int): The `ingest_log` row the sessions belong to, starts every row with an ingest_id column.
+
+    Yields:
+        bytes: Chunks of the COPY stream, including the header and trailer.
+    """
+    chunks = queue.Queue(maxsize=queue_depth)
+    stopped = threading.Event()
+    done = object()
+
+    def put(item):
+        # Give up when the consumer went away, instead of blocking on a full queue forever
+        while not stopped.is_set():
+            try:
+                chunks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def produce():
+        try:
+            for source in sources:
+                for chunk in _encode_source(source, chunk_rows, ingest_id):
+                    if not put(chunk):
+                        return
+            put(done)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name="measure-session-parser", daemon=True)
+    producer.start()
+    try:
+        yield binary_copy.HEADER
+        while True:
+            item = chunks.get()
+            if item is done:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+        yield binary_copy.TRAILER
+    finally:
+        stopped.set()
+        producer.join()
+
+
+def find_archives(patient_path: str):
+    """
+    Yields the week enumeration and path of every zip archive in the week folders of a patient.
+    """
+    for week_folder in sorted(os.listdir(patient_path)):
+        week_path = os.path.join(patient_path, week_folder)
+        if not os.path.isdir(week_path):
+            continue
+
+        # Determine the week enumeration based on the folder name
+        week_enum = 'Week_1' if '1' in week_folder else 'Week_2'
+        for filename in sorted(os.listdir(week_path)):
+            if filename.endswith(".zip"):
+                yield week_enum, os.path.join(week_path, filename)
+
+
+def archive_measurements(patient_id: str, week_enum: str, zip_path: str):
+    """
+    Reads the sample rates of the CSVs in an archive and lists its measure sessions.
+
+    Returns:
+        tuple: A list of (measurement_id, measurement_type, sample_rate) tuples and a list of SessionSource objects.
+    """
+    measurements = []
+    sources = []
+    with zipfile.ZipFile(zip_path, "r") as archive:
+        for member in archive.namelist():
+            if not member.endswith(".csv"):
+                continue
+            measurement_type = member.split(".")[0]
+            if measurement_type not in MEASUREMENT_TYPES:
+                print(f"Skipping unsupported measurement type: {measurement_type}")
+                continue
+
+            with archive.open(member) as file:
+                file.readline()
+                sample_rate = float(file.readline().split(b",")[0])
+
+            if measurement_type == "ACC":
+                # One source for the three axes, so the CSV is parsed once
+                axis_ids = [f"{patient_id}_{week_enum}_{axis}" for axis in ACC_AXES]
+                measurements.extend((axis_id, axis, sample_rate) for axis_id, axis in zip(axis_ids, ACC_AXES))
+                sources.append(SessionSource(zip_path=zip_path, member=member, column_ids=axis_ids))
+            else:
+                measurement_id = f"{patient_id}_{week_enum}_{measurement_type}"
+                measurements.append((measurement_id, measurement_type, sample_rate))
+                sources.append(SessionSource(measurement_id, zip_path, member))
+    return measurements, sources
+
+
+def load_archive(conn, patient_id: str, week_enum: str, zip_path: str):
+    """
+    Loads the measure sessions of one zip archive in a single transaction and records it in the ingest log.
+
+    Sessions from an earlier load of the same archive are replaced, so an archive that changed or failed before
+    is loaded again from scratch. This includes the sessions of the archive that were loaded before the ingest
+    log existed. A failed load leaves no sessions behind and is logged with its error.
+
+    Args:
+        conn (Connection): The database connection, no other transaction may be open on it.
+        patient_id (str): The ID of the patient the archive belongs to.
+        week_enum (str): The week of the archive.
+        zip_path (str): Path of the zip archive.
+
+    Returns:
+        int: The number of measure sessions loaded.
+    """
+    stat = os.stat(zip_path)
+    cursor = conn.cursor
+    try:
+        cursor.execute(
+            "INSERT INTO ingest_log (zip_path, patient_id, size, mtime, status) VALUES (%s, %s, %s, %s, 'loading') "
+            "ON CONFLICT (zip_path) DO UPDATE SET patient_id = EXCLUDED.patient_id, size = EXCLUDED.size, "
+            "mtime = EXCLUDED.mtime, status = 'loading', error = NULL RETURNING id",
+            (zip_path, patient_id, stat.st_size, stat.st_mtime),
+        )
+        ingest_id = cursor.fetchone()[0]
+        # Drop what an earlier load of this archive left, the catalog rows go with it
+        cursor.execute("DELETE FROM measure_session WHERE ingest_id = %s", (ingest_id,))
+
+        measurements, sources = archive_measurements(patient_id, week_enum, zip_path)
+        # Sessions loaded before the ingest log existed have no ingest_id, the ones of this archive are found by
+        # their measurement and start timestamp, which is the first line of their CSV
+        legacy = [(measurement_id, _read_start_timestamp(source)) for source in sources
+                  for measurement_id in source.column_ids or [source.measurement_id]]
+        cursor.execute(
+            "DELETE FROM measure_session ms "
+            "USING unnest(%s::TEXT[], %s::TIMESTAMP[]) AS l(measurement_id, start_timestamp) "
+            "WHERE ms.ingest_id IS NULL AND ms.measurement_id = l.measurement_id "
+            "AND ms.start_timestamp = l.start_timestamp",
+            ([measurement_id for measurement_id, _ in legacy], [start_timestamp for _, start_timestamp in legacy]),
+        )
+        for measurement_id, measurement_type, sample_rate in measurements:
+            cursor.execute(
+                "INSERT INTO measurement (id, patient_id, week, measurement_type, sample_rate) "
+                "VALUES (%s, %s, %s, %s, %s) ON CONFLICT (id) DO NOTHING",
+                (measurement_id, patient_id, week_enum, measurement_type, sample_rate),
+            )
+
+        conn.copy_measure_sessions(stream_measure_sessions(sources, ingest_id=ingest_id),
+                                   with_ingest_id=True, commit=False)
+        cursor.execute("UPDATE ingest_log SET status = 'loaded', loaded_at = now() WHERE id = %s", (ingest_id,))
+        conn.conn.commit()
+        return len(measurements)
+    except Exception as e:
+        try:
+            conn.conn.rollback()
+            cursor.execute(
+                "INSERT INTO ingest_log (zip_path, patient_id, size, mtime, status, error) "
+                "VALUES (%s, %s, %s, %s, 'failed', %s) "
+                "ON CONFLICT (zip_path) DO UPDATE SET status = 'failed', error = EXCLUDED.error",
+                (zip_path, patient_id, stat.st_size, stat.st_mtime, repr(e)),
+            )
+            conn.conn.commit()
+        except Exception as log_error:
+            # The connection may be broken, the error of the load is the one to report
+            print(f"\033[93mWarning: Could not log the failed load of {zip_path}: {log_error!r}\033[0m")
+        raise e
+
+
+def ingest_archive(patient_id: str, week_enum: str, zip_path: str):
+    # Runs in a worker process, which has its own connection pool
+    with connect.Connection.pooled() as conn:
+        return load_archive(conn, patient_id, week_enum, zip_path)
+
+
+def pending_archives(conn, data_folder: str, patient_ids):
+    """
+    Lists the archives that still have to be loaded: new ones, changed ones and ones that failed before.
+
+    An archive counts as loaded when the ingest log holds it with status 'loaded' and the same size and
+    modification time.
+
+    Returns:
+        list: (patient_id, week_enum, zip_path) tuples.
+    """
+    conn.cursor.execute("SELECT zip_path, size, mtime FROM ingest_log WHERE status = 'loaded'")
+    loaded = {zip_path: (size, mtime) for zip_path, size, mtime in conn.cursor.fetchall()}
+
+    archives = []
+    for patient_id in patient_ids:
+        patient_path = os.path.join(data_folder, patient_id)
+        if not os.path.isdir(patient_path):
+            continue
+        for week_enum, zip_path in find_archives(patient_path):
+            stat = os.stat(zip_path)
+            if loaded.get(zip_path) == (stat.st_size, stat.st_mtime):
+                continue
+            archives.append((patient_id, week_enum, zip_path))
+    return archives
+
+
+def ingest_archives(archives, max_workers: int = None, timeout: float = None):
+    """
+    Loads archives in parallel over a pool of worker processes, one transaction per archive.
+
+    Returns:
+        list: The TaskResult of every archive that failed.
+    """
+    failed = []
+    for result in runner.run_tasks(ingest_archive, archives, max_workers=max_workers, timeout=timeout):
+        patient_id, week_enum, zip_path = result.task
+        if result.error is not None:
+            print(f"\033[91mFailed to load {zip_path}: {result.error!r}\033[0m")
+            failed.append(result)
+        else:
+            print(f"Loaded {result.result} measure sessions of {patient_id} from {zip_path}")
+    return failed
@@ -0,0 +1,116 @@
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from datetime import datetime
+
+# Patients kept per process, every patient holds the headers of all of its sessions
+CACHE_SIZE = 256
+
+
+@dataclass
+class SessionHeader:
+    """
+    The metadata of a measure session, everything but its data.
+    """
+    session_id: int = None
+    measurement_id: str = None
+    measurement_type: str = None
+    week: str = None
+    sample_rate: float = None
+    start_timestamp: datetime = None
+    invalid_data_indices: list = None
+
+
+@dataclass
+class PatientMetadata:
+    """
+    The metadata of a patient with a summary of its relax sessions and the headers of all its measure sessions.
+    """
+    patient_id: str = None
+    origin: str = None
+    patient_group: str = None
+    age: int = None
+    sex: str = None
+    relax_count: int = 0
+    mean_relax_duration: float = 0.0
+    sessions: dict = field(default_factory=dict)
+
+
+class MetadataCache:
+    """
+    Thread-safe LRU of PatientMetadata, shared by all connections of a process.
+
+    Entries are dropped with `invalidate` when the metadata of a patient changes through the connector, changes
+    made by other processes are only seen after `clear`.
+
+    Args:
+        maxsize (int): The number of patients to keep.
+    """
+    def __init__(self, maxsize: int = CACHE_SIZE):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._patients = OrderedDict()
+        self._session_patients = {}
+
+    def get(self, patient_id: str):
+        with self._lock:
+            metadata = self._patients.get(patient_id)
+            if metadata is not None:
+                self._patients.move_to_end(patient_id)
+            return metadata
+
+    def get_session(self, session_id):
+        """
+        Returns the SessionHeader of a session of a cached patient, None when its patient is not cached.
+        """
+        with self._lock:
+            patient_id = self._session_patients.get(int(session_id))
+            if patient_id is None or patient_id not in self._patients:
+                return None
+            self._patients.move_to_end(patient_id)
+            return self._patients[patient_id].sessions.get(int(session_id))
+
+    def put(self, metadata: PatientMetadata):
+        with self._lock:
+            self._remove(metadata.patient_id)
+            self._patients[metadata.patient_id] = metadata
+            for session_id in metadata.sessions:
+                self._session_patients[session_id] = metadata.patient_id
+            while len(self._patients) > self.maxsize:
+                self._remove(next(iter(self._patients)))
+
+    def invalidate(self, patient_id: str = None, session_id=None):
+        """
+        Drops a patient, given directly or through one of its sessions, so it is read again on the next lookup.
+        """
+        with self._lock:
+            if patient_id is None and session_id is not None:
+                patient_id = self._session_patients.get(int(session_id))
+            if patient_id is not None:
+                self._remove(patient_id)
+
+    def clear(self):
+        with self._lock:
+            self._patients.clear()
+            self._session_patients.clear()
+
+    def _remove(self, patient_id: str):
+        metadata = self._patients.pop(patient_id, None)
+        if metadata is not None:
+            for session_id in metadata.sessions:
+                self._session_patients.pop(session_id, None)
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def shared_cache():
+    """
+    Returns the process-wide MetadataCache, creating it on first use.
+    """
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = MetadataCache()
+        return _cache
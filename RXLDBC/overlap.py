@@ -0,0 +1,137 @@
+import bisect
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+import numpy as np
+
+FIVE_MINUTES = timedelta(minutes=5)
+
+
+@dataclass
+class SessionWindow:
+    """
+    An E4 session that covers a relax session, with the rows of the relax session and the surrounding window.
+
+    The indices are rows of the session data counted from 0, `window_start` and `window_end` include the margin
+    before and after the relax session.
+    """
+    session_key: str = None
+    session_id: int = None
+    start_timestamp: datetime = None
+    end_timestamp: datetime = None
+    sample_rate: float = None
+    start_index: int = None
+    end_index: int = None
+    window_start: int = None
+    window_end: int = None
+    invalid_fraction: float = None
+
+
+def covering_sessions(e4_timestamps: dict, relax_timestamps: dict, before: timedelta = FIVE_MINUTES,
+                      after: timedelta = FIVE_MINUTES):
+    """
+    Finds the E4 sessions that cover every relax session including a margin before and after it.
+
+    A session covers a relax session when it starts at least `before` before the relax session starts and ends at
+    least `after` after it ends. Both lists are sorted once and swept together instead of comparing every pair.
+
+    Args:
+        e4_timestamps (dict): Session keys mapped to (start, end) tuples, see `get_all_timestamps_from_patient_id`.
+        relax_timestamps (dict): Relax IDs mapped to (start, end) tuples.
+        before (timedelta): Required margin before the relax session, negative values allow a late start.
+        after (timedelta): Required margin after the relax session.
+
+    Returns:
+        dict: Relax IDs mapped to the keys of their covering sessions, both in the order they were given in.
+            Relax sessions without a covering session are left out.
+    """
+    session_keys = list(e4_timestamps)
+    by_start = sorted(range(len(session_keys)), key=lambda i: e4_timestamps[session_keys[i]][0])
+    queries = sorted(relax_timestamps.items(), key=lambda item: item[1][0] - before)
+
+    # Ends of the sessions that started early enough for the current relax session, kept sorted
+    active_ends = []
+    next_session = 0
+    matches = {}
+    for relax_id, (relax_start, relax_end) in queries:
+        while (next_session < len(by_start)
+               and e4_timestamps[session_keys[by_start[next_session]]][0] <= relax_start - before):
+            position = by_start[next_session]
+            bisect.insort(active_ends, (e4_timestamps[session_keys[position]][1], position))
+            next_session += 1
+
+        first = bisect.bisect_left(active_ends, (relax_end + after, -1))
+        if first < len(active_ends):
+            matches[relax_id] = sorted(position for _, position in active_ends[first:])
+
+    return {relax_id: [session_keys[position] for position in matches[relax_id]]
+            for relax_id in relax_timestamps if relax_id in matches}
+
+
+def _invalid_rows_in_window(invalid_indices, window_start: int, window_end: int):
+    """
+    Counts the invalid rows of the inclusive [start, end] ranges that fall in the half-open window.
+    """
+    if not invalid_indices:
+        return 0
+    ranges = np.asarray(invalid_indices, dtype=np.int64).reshape(-1, 2)
+    # An end of -1 runs to the end of the session, which is past any window
+    ends = np.where(ranges[:, 1] == -1, window_end, ranges[:, 1] + 1)
+    overlap = np.minimum(ends, window_end) - np.maximum(ranges[:, 0], window_start)
+    return int(np.clip(overlap, 0, None).sum())
+
+
+def session_windows(conn, patient_id: str, e4_timestamps: dict, relax_timestamps: dict,
+                    before: timedelta = FIVE_MINUTES, after: timedelta = FIVE_MINUTES):
+    """
+    Matches relax sessions to their covering E4 sessions and calculates the row windows around them.
+
+    The sample rates and invalid data indices of all sessions of the patient are read in one query.
+
+    Args:
+        conn (Connection): The database connection.
+        patient_id (str): The ID of the patient the timestamps belong to.
+        e4_timestamps (dict): Session keys mapped to (start, end) tuples.
+        relax_timestamps (dict): Relax IDs mapped to (start, end) tuples.
+        before (timedelta): Margin before the relax session.
+        after (timedelta): Margin after the relax session.
+
+    Returns:
+        dict: Relax IDs mapped to a list of SessionWindow objects.
+    """
+    conn.cursor.execute(
+        "SELECT ms.id, m.sample_rate, ms.invalid_data_indices "
+        "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id WHERE m.patient_id = %s",
+        (patient_id,),
+    )
+    session_info = {session_id: (sample_rate, invalid_indices)
+                    for session_id, sample_rate, invalid_indices in conn.cursor.fetchall()}
+
+    windows = {}
+    for relax_id, session_keys in covering_sessions(e4_timestamps, relax_timestamps, before, after).items():
+        relax_start, relax_end = relax_timestamps[relax_id]
+        for session_key in session_keys:
+            session_id = int(session_key.split("_")[-1])
+            sample_rate, invalid_indices = session_info[session_id]
+            start, end = e4_timestamps[session_key]
+
+            start_index = int((relax_start - start).total_seconds() * sample_rate)
+            end_index = int((relax_end - start).total_seconds() * sample_rate)
+            window_start = start_index - int(before.total_seconds() * sample_rate)
+            window_end = end_index + int(after.total_seconds() * sample_rate)
+            window_length = window_end - window_start
+
+            windows.setdefault(relax_id, []).append(SessionWindow(
+                session_key=session_key,
+                session_id=session_id,
+                start_timestamp=start,
+                end_timestamp=end,
+                sample_rate=sample_rate,
+                start_index=start_index,
+                end_index=end_index,
+                window_start=window_start,
+                window_end=window_end,
+                invalid_fraction=(_invalid_rows_in_window(invalid_indices, window_start, window_end) / window_length
+                                  if window_length > 0 else 0.0),
+            ))
+    return windows
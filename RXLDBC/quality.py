@@ -0,0 +1,273 @@
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+
+import numpy as np
+
+from RXLDBC import connect, ibi, runner
+
+ACC_SAMPLE_RATE = 32
+# Samples per rolling window, one second of ACC
+FLATLINE_WINDOW = 32
+# The magnitude is flat where its rolling standard deviation is below this
+FLATLINE_STD = 1.0
+# Shorter flat periods are kept, 10 minutes of ACC
+FLATLINE_MIN_LENGTH = 19200
+# Recordings shorter than this many seconds are invalid as a whole
+MIN_DURATION = 600
+# Windows evaluated per block, bounds the float64 temporaries of the rolling variance
+BLOCK_SIZE = 1 << 18
+
+# A complete recording has one session per channel, named after the last part of their measurement ID
+CHANNELS = ("X", "Y", "Z", "BVP", "EDA", "HR", "IBI", "TEMP")
+# Groups with this many sessions hold an aborted recording followed by a complete one
+RESTARTED_GROUP_SIZE = 15
+
+
+@dataclass(frozen=True)
+class QualityParams:
+    """
+    The parameters of the invalid-data marking, quality_run records which of them every group depends on.
+    """
+    window: int = FLATLINE_WINDOW
+    threshold: float = FLATLINE_STD
+    min_length: int = FLATLINE_MIN_LENGTH
+    min_duration: float = MIN_DURATION
+
+
+@dataclass
+class GroupMarks:
+    """
+    The invalid data indices of the sessions of a recording group.
+
+    `params` only holds the parameters the marks depend on, a group marked invalid for its number of sessions
+    depends on none of them and is not redone when they change.
+    """
+    group_id: str = None
+    invalid_indices: dict = field(default_factory=dict)
+    params: dict = field(default_factory=dict)
+    session_ids: list = field(default_factory=list)
+    total_samples: int = 0
+    invalid_samples: int = 0
+
+
+@dataclass
+class Channel:
+    """
+    A measure session of a recording group that flat periods are marked in.
+
+    Sampled channels are located by their sample rate and number of samples, IBI channels by their beat offsets.
+    """
+    session_id: int = None
+    start_timestamp: datetime = None
+    sample_rate: float = None
+    n_samples: int = 0
+    offsets: ibi.IbiOffsets = None
+
+
+def magnitude(x, y, z):
+    """
+    Computes the vector magnitude of ACC samples as float32.
+    """
+    x, y, z = (np.asarray(axis, dtype=np.float32).ravel() for axis in (x, y, z))
+    result = np.square(x)
+    result += np.square(y)
+    result += np.square(z)
+    return np.sqrt(result, out=result)
+
+
+def flat_mask(values, window: int = FLATLINE_WINDOW, threshold: float = FLATLINE_STD, block_size: int = BLOCK_SIZE):
+    """
+    Marks the samples where the centered rolling standard deviation is below `threshold`.
+
+    The window of sample i covers [i - window // 2, i + window - window // 2 - 1], the same samples as a centered
+    pandas rolling window, and samples without a full window are never flat. Variances come from the differences
+    of cumulative sums, computed per block on mean-centered float64 copies so the sums keep their precision.
+
+    Returns:
+        np.ndarray: A boolean mask with the length of `values`.
+    """
+    values = np.asarray(values, dtype=np.float32)
+    n = len(values)
+    mask = np.zeros(n, dtype=bool)
+    offset = window // 2
+    for first in range(0, n - window + 1, block_size):
+        # Windows starting at first..stop - 1, they need the samples up to stop + window - 1
+        stop = min(first + block_size, n - window + 1)
+        block = values[first:stop + window - 1].astype(np.float64)
+        block -= block.mean()
+        sums = np.concatenate(([0.0], np.cumsum(block)))
+        squares = np.concatenate(([0.0], np.cumsum(block * block)))
+        window_sums = sums[window:] - sums[:-window]
+        variance = (squares[window:] - squares[:-window] - window_sums * window_sums / window) / (window - 1)
+        mask[first + offset:stop + offset] = variance < threshold * threshold
+    return mask
+
+
+def runs(mask, min_length: int = 1):
+    """
+    Finds the runs of True in a mask.
+
+    Returns:
+        np.ndarray: [first, last] rows of the runs of at least `min_length` samples, both included.
+    """
+    edges = np.diff(np.concatenate(([0], np.asarray(mask, dtype=np.int8), [0])))
+    starts = np.flatnonzero(edges == 1)
+    stops = np.flatnonzero(edges == -1)
+    keep = stops - starts >= min_length
+    return np.column_stack((starts[keep], stops[keep] - 1))
+
+
+def flatline_runs(x, y, z, window: int = FLATLINE_WINDOW, threshold: float = FLATLINE_STD,
+                  min_length: int = FLATLINE_MIN_LENGTH):
+    """
+    Finds the periods in which the ACC magnitude is flat, which happens when the E4 is not worn.
+
+    Returns:
+        np.ndarray: [first, last] ACC sample ranges of the flat periods, both included.
+    """
+    return runs(flat_mask(magnitude(x, y, z), window, threshold), min_length)
+
+
+def channel_ranges(acc_ranges, acc_start: datetime, channel: Channel, acc_sample_rate: float = ACC_SAMPLE_RATE):
+    """
+    Converts ACC sample ranges to the index ranges of another channel of the same recording.
+
+    Sampled channels get indices rounded to their sample rate and clamped to their samples, IBI channels get the
+    rows of the beats inside every range and leave out ranges without beats.
+
+    Returns:
+        list: [first, last] index ranges of the channel, both included.
+    """
+    acc_ranges = np.asarray(acc_ranges, dtype=np.float64).reshape(-1, 2)
+    if not len(acc_ranges):
+        return []
+    seconds = acc_ranges / acc_sample_rate + (acc_start - channel.start_timestamp).total_seconds()
+    if channel.offsets is not None:
+        first, last = channel.offsets.index_ranges(seconds[:, 0], seconds[:, 1])
+        keep = first <= last
+        return [[int(start), int(end)] for start, end in zip(first[keep], last[keep])]
+
+    indices = np.clip(np.round(seconds * channel.sample_rate), 0, max(channel.n_samples - 1, 0)).astype(np.int64)
+    return indices.tolist()
+
+
+def invalid_ranges(x, y, z, acc_start: datetime, channels: dict, window: int = FLATLINE_WINDOW,
+                   threshold: float = FLATLINE_STD, min_length: int = FLATLINE_MIN_LENGTH):
+    """
+    Finds the flat periods of a recording group and converts them to the index ranges of all its channels.
+
+    Args:
+        x, y, z: The ACC samples of the group.
+        acc_start (datetime): The start timestamp of the ACC sessions.
+        channels (dict): Channel per name, e.g. {"X": Channel(...), "IBI": Channel(...)}.
+
+    Returns:
+        dict: Lists of [first, last] index ranges per name of `channels`, empty when nothing is flat.
+    """
+    acc_ranges = flatline_runs(x, y, z, window, threshold, min_length)
+    return {name: channel_ranges(acc_ranges, acc_start, channel) for name, channel in channels.items()}
+
+
+def mark_group(conn, group_id: str, params: QualityParams = QualityParams()):
+    """
+    Computes the invalid data indices of all sessions of a recording group without writing them.
+
+    A group needs exactly one session per channel. The aborted sessions of a restarted recording, groups with a
+    different number of sessions and recordings shorter than `min_duration` are invalid as a whole, the others
+    are invalid where the ACC magnitude is flat.
+
+    Args:
+        conn (Connection): The database connection.
+        group_id (str): The ID of the measure group.
+        params (QualityParams): The marking parameters.
+
+    Returns:
+        GroupMarks: The marks of every session of the group.
+    """
+    sessions = conn.get_all_measurement_sessions_from_group_id(group_id)
+    marks = GroupMarks(
+        group_id=group_id,
+        session_ids=sorted(int(session[0]) for session in sessions),
+        total_samples=int(sum(session[3] for session in sessions)),
+    )
+
+    def mark_invalid(invalid_sessions):
+        for session in invalid_sessions:
+            marks.invalid_indices[int(session[0])] = [[0, -1]]
+            marks.invalid_samples += int(session[3])
+
+    if len(sessions) == RESTARTED_GROUP_SIZE:
+        mark_invalid(sessions[:RESTARTED_GROUP_SIZE - len(CHANNELS)])
+        sessions = sessions[RESTARTED_GROUP_SIZE - len(CHANNELS):]
+
+    by_name = {session[1].split("_")[-1]: session for session in sessions}
+    if len(sessions) != len(CHANNELS) or sorted(by_name) != sorted(CHANNELS):
+        mark_invalid(sessions)
+        return marks
+
+    marks.params = {"min_duration": params.min_duration}
+    if by_name["X"][3] / ACC_SAMPLE_RATE < params.min_duration:
+        mark_invalid(sessions)
+        return marks
+
+    marks.params = asdict(params)
+    channels = {}
+    for name, (session_id, _, start_timestamp, length, *_) in by_name.items():
+        if name == "IBI":
+            channels[name] = Channel(int(session_id), start_timestamp, offsets=ibi.offsets(conn, session_id))
+        else:
+            sample_rate = conn.session_header(session_id).sample_rate
+            channels[name] = Channel(int(session_id), start_timestamp, sample_rate, int(length))
+
+    acc = [conn.get_data_from_measure_session(by_name[axis][0], return_numpy=True) for axis in ("X", "Y", "Z")]
+    ranges = invalid_ranges(*acc, channels["X"].start_timestamp, channels, params.window, params.threshold,
+                            params.min_length)
+    for name, channel in channels.items():
+        marks.invalid_indices[channel.session_id] = ranges[name]
+        if channel.offsets is None:
+            marks.invalid_samples += sum(end - start + 1 for start, end in ranges[name])
+    return marks
+
+
+def mark_group_task(group_id: str, params: QualityParams):
+    # Runs in a worker process, which has its own connection pool
+    with connect.Connection.pooled() as conn:
+        marks = mark_group(conn, group_id, params)
+        conn.write_quality_run(marks.group_id, marks.invalid_indices, marks.params, marks.session_ids,
+                               marks.total_samples, marks.invalid_samples)
+        return marks
+
+
+def pending_groups(conn, params: QualityParams = QualityParams()):
+    """
+    Lists the groups that have to be marked: new ones, ones whose sessions changed and ones that depend on a
+    parameter that changed since they were marked.
+
+    Returns:
+        list: (group_id, params) tuples for `mark_groups`.
+    """
+    return [(group_id, params) for group_id in conn.get_pending_quality_groups(asdict(params))]
+
+
+def mark_groups(groups, max_workers: int = None, timeout: float = None):
+    """
+    Marks recording groups in parallel over a pool of worker processes, one transaction per group.
+
+    Args:
+        groups (iterable): (group_id, params) tuples, e.g. from `pending_groups`.
+        max_workers (int): Number of worker processes, defaults to the number of CPUs.
+        timeout (float): Seconds a single group may take, unlimited when omitted.
+
+    Returns:
+        list: The TaskResult of every group that failed.
+    """
+    failed = []
+    for result in runner.run_tasks(mark_group_task, groups, max_workers=max_workers, timeout=timeout):
+        group_id, _ = result.task
+        if result.error is not None:
+            print(f"\033[91mFailed to mark {group_id}: {result.error!r}\033[0m")
+            failed.append(result)
+        else:
+            marks = result.result
+            print(f"Marked {marks.invalid_samples} of {marks.total_samples} samples of {group_id} as invalid")
+    return failed
@@ -0,0 +1,114 @@
+from datetime import datetime, timedelta
+
+import pandas as pd
+
+# Relax sessions longer than this are treated as sessions that were never closed
+MAX_DURATION = timedelta(hours=2)
+# Start of the study, earlier sessions are test sessions
+STUDY_START = datetime(2022, 7, 4)
+
+QUESTION_COLUMNS = ["start_question_1", "end_question_1", "start_question_2", "end_question_2"]
+RELAX_COLUMNS = ["patient_id", "start_timestamp", "end_timestamp", *QUESTION_COLUMNS, "modifier"]
+
+
+def parse_timestamps(values, formats):
+    """
+    Parses a column of timestamps, trying the formats in order for the values that are still unparsed.
+
+    Args:
+        values (pd.Series): The timestamp strings.
+        formats (list): strptime formats, e.g. ["%d-%m-%Y %H:%M", "%m/%d/%Y %H:%M:%S"].
+
+    Returns:
+        pd.Series: The parsed timestamps, NaT where no format matched.
+    """
+    parsed = pd.Series(pd.NaT, index=values.index, dtype="datetime64[ns]")
+    for fmt in formats:
+        missing = parsed.isna()
+        if not missing.any():
+            break
+        parsed[missing] = pd.to_datetime(values[missing], format=fmt, errors="coerce")
+    return parsed
+
+
+def prepare_relax_sessions(df: pd.DataFrame, patient_lookup: dict, columns: dict, formats,
+                           max_duration: timedelta = None, earliest_start: datetime = None):
+    """
+    Converts an export of the relax app to relax_session rows and separates the rows that cannot be loaded.
+
+    Timestamps are parsed per column and all checks are applied as masks over the whole DataFrame.
+
+    Args:
+        df (pd.DataFrame): The export as read from its CSV.
+        patient_lookup (dict): User keys mapped to patient IDs.
+        columns (dict): relax_session columns mapped to the column of `df` they are read from. "user_key",
+            "start_timestamp" and "end_timestamp" are required, questions and the modifier are optional.
+        formats (list): strptime formats of the timestamps, tried in order.
+        max_duration (timedelta): Reject sessions that take longer, e.g. MAX_DURATION.
+        earliest_start (datetime): Reject sessions that start before this moment, e.g. STUDY_START.
+
+    Returns:
+        tuple: The rows to insert as a DataFrame with the relax_session columns, and the rejected rows of `df`
+            with a "reason" column.
+    """
+    sessions = pd.DataFrame(index=df.index)
+    user_keys = df[columns["user_key"]]
+    sessions["patient_id"] = user_keys.map(patient_lookup)
+    sessions["start_timestamp"] = parse_timestamps(df[columns["start_timestamp"]], formats)
+    sessions["end_timestamp"] = parse_timestamps(df[columns["end_timestamp"]], formats)
+    for column in QUESTION_COLUMNS + ["modifier"]:
+        sessions[column] = df[columns[column]] if column in columns else None
+
+    duration = sessions["end_timestamp"] - sessions["start_timestamp"]
+    # The first check a row fails is its reason, later checks only look at rows that are still accepted
+    checks = [
+        (sessions["patient_id"].isna(), "No patient found for the user key"),
+        (sessions["start_timestamp"].isna() | sessions["end_timestamp"].isna(), "Failed to parse the timestamps"),
+        (duration < pd.Timedelta(0), "Start is after the end"),
+    ]
+    if max_duration is not None:
+        checks.append((duration > max_duration, f"Session takes longer than {max_duration}"))
+    if earliest_start is not None:
+        checks.append((sessions["start_timestamp"] < earliest_start, f"Session starts before {earliest_start}"))
+
+    reason = pd.Series(None, index=df.index, dtype=object)
+    for mask, message in checks:
+        reason[mask & reason.isna()] = message
+
+    rejected = df[reason.notna()].assign(reason=reason[reason.notna()])
+    return sessions[reason.isna()], rejected
+
+
+def relax_session_rows(sessions: pd.DataFrame):
+    """
+    Converts prepared relax sessions to tuples of Python values that psycopg2 can adapt, missing values become NULL.
+    """
+    def question(value):
+        # Questions are read as floats when a column has missing answers
+        return None if pd.isna(value) else int(value)
+
+    def modifier(value):
+        # NumPy scalars are converted to the Python values the row-by-row loader passed
+        return None if pd.isna(value) else getattr(value, "item", lambda: value)()
+
+    return [
+        (patient_id, start.to_pydatetime(), end.to_pydatetime(), *(question(value) for value in questions),
+         modifier(modifier_value))
+        for patient_id, start, end, *questions, modifier_value
+        in sessions[RELAX_COLUMNS].itertuples(index=False, name=None)
+    ]
+
+
+def load_relax_sessions(conn, df: pd.DataFrame, patient_lookup: dict, columns: dict, formats,
+                        max_duration: timedelta = None, earliest_start: datetime = None):
+    """
+    Loads an export of the relax app into the relax_session table in a single transaction.
+
+    See `prepare_relax_sessions` for the arguments.
+
+    Returns:
+        pd.DataFrame: The rejected rows of `df` with the reason they were rejected.
+    """
+    sessions, rejected = prepare_relax_sessions(df, patient_lookup, columns, formats, max_duration, earliest_start)
+    conn.bulk_insert_relax_sessions(relax_session_rows(sessions))
+    return rejected
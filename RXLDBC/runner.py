@@ -0,0 +1,160 @@
+import concurrent.futures
+import multiprocessing
+import os
+import signal
+import time
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass
+
+import pandas as pd
+
+from RXLDBC import connect
+
+
+@dataclass
+class TaskResult:
+    """
+    The outcome of one task, `error` is set instead of `result` when the task failed or timed out.
+    """
+    task: tuple = None
+    result: object = None
+    error: BaseException = None
+
+
+def _init_worker(pids):
+    # Report the worker to the parent, which kills it on a timeout
+    pids.put(os.getpid())
+    # Every worker process gets its own pool, open its connection before the first task needs it
+    pool = connect.get_pool()
+    pool.putconn(pool.getconn())
+
+
+def _new_executor(max_workers: int):
+    """
+    Returns a process pool and the queue its workers put their PID on when they start.
+    """
+    pids = multiprocessing.SimpleQueue()
+    executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers, initializer=_init_worker,
+                                                      initargs=(pids,))
+    return executor, pids
+
+
+def _terminate(executor, pids):
+    # ProcessPoolExecutor cannot cancel a call that is already running, so its worker processes are killed.
+    # A worker only runs tasks after its initializer reported its PID, so every busy worker is in the queue
+    while not pids.empty():
+        try:
+            os.kill(pids.get(), signal.SIGTERM)
+        except OSError:
+            # The worker already exited
+            pass
+    executor.shutdown(wait=False, cancel_futures=True)
+    pids.close()
+
+
+def run_tasks(function, tasks, max_workers: int = None, timeout: float = None):
+    """
+    Runs `function(*task)` for every task over a pool of worker processes.
+
+    At most `max_workers` tasks are submitted at a time, so every submitted task is running and its timeout is
+    counted from the moment it was handed to a worker. When a task runs longer than `timeout` seconds the worker
+    processes are killed, the task is reported as timed out and the other running tasks are resubmitted to a
+    fresh pool. Each worker opens its own database connection, `connect.Connection.pooled()` in the task reuses it.
+
+    Args:
+        function: Module-level function to run, it has to be picklable.
+        tasks (iterable): Tuples of arguments, consumed lazily.
+        max_workers (int): Number of worker processes, defaults to the number of CPUs.
+        timeout (float): Seconds a single task may take, unlimited when omitted.
+
+    Yields:
+        TaskResult: The result of every task in the order they complete.
+    """
+    max_workers = max_workers or os.cpu_count() or 1
+    tasks = iter(tasks)
+    executor, pids = _new_executor(max_workers)
+    running = {}
+    exhausted = False
+    try:
+        while True:
+            while not exhausted and len(running) < max_workers:
+                task = next(tasks, None)
+                if task is None:
+                    exhausted = True
+                    break
+                running[executor.submit(function, *task)] = (task, time.monotonic())
+            if not running:
+                return
+
+            wait_timeout = None
+            if timeout is not None:
+                oldest = min(started for _, started in running.values())
+                wait_timeout = max(0.0, oldest + timeout - time.monotonic())
+            done, _ = concurrent.futures.wait(running, timeout=wait_timeout,
+                                              return_when=concurrent.futures.FIRST_COMPLETED)
+
+            broken = False
+            for future in done:
+                task, _ = running.pop(future)
+                try:
+                    yield TaskResult(task=task, result=future.result())
+                except BrokenProcessPool as error:
+                    # A worker died, the pool refuses new work and has to be replaced
+                    broken = True
+                    yield TaskResult(task=task, error=error)
+                except Exception as error:
+                    yield TaskResult(task=task, error=error)
+
+            now = time.monotonic()
+            expired = [future for future, (_, started) in running.items()
+                       if timeout is not None and now - started >= timeout]
+            for future in expired:
+                task, _ = running.pop(future)
+                yield TaskResult(task=task, error=TimeoutError(f"Task {task} took longer than {timeout} seconds."))
+
+            if expired or broken:
+                _terminate(executor, pids)
+                executor, pids = _new_executor(max_workers)
+                running = {executor.submit(function, *task): (task, time.monotonic()) for task, _ in running.values()}
+    finally:
+        if running:
+            _terminate(executor, pids)
+        else:
+            executor.shutdown()
+            pids.close()
+
+
+def stream_to_csv(results, path: str):
+    """
+    Appends the DataFrames of completed tasks to a CSV file as they arrive, so finished work is on disk
+    even when a later task fails. Failed tasks are reported and skipped, as are empty results.
+
+    The columns of the first DataFrame are used for the whole file.
+
+    Args:
+        results (iterable): TaskResult objects, e.g. from `run_tasks`.
+        path (str): The CSV file to write, it is overwritten and left empty when no task returns rows.
+
+    Returns:
+        int: The number of rows written.
+    """
+    # Empty the file up front, a run without rows must not leave the output of a previous run behind
+    open(path, "w").close()
+    columns = None
+    rows = 0
+    for task_result in results:
+        if task_result.error is not None:
+            print(f"\033[91mTask {task_result.task} failed: {task_result.error!r}\033[0m")
+            continue
+        df = task_result.result
+        if df is None or df.empty:
+            continue
+
+        if columns is None:
+            columns = df.columns
+            df.set_axis(pd.RangeIndex(rows, rows + len(df))).to_csv(path, header=True, mode="w")
+        else:
+            df.reindex(columns=columns).set_axis(pd.RangeIndex(rows, rows + len(df))).to_csv(
+                path, header=False, mode="a")
+        rows += len(df)
+    return rows
@@ -0,0 +1,140 @@
+import json
+import os
+from datetime import datetime
+
+import numpy as np
+
+from RXLDBC.validity import ValidityMask
+
+# Samples are stored as 32-bit floats, which is well within the resolution of the E4 sensors
+STORE_DTYPE = np.float32
+
+
+class SignalStore:
+    """
+    Directory of exported measurements for offline analysis.
+
+    Every measurement (one patient, week and measurement type) is written as a single raw float32 file holding
+    the rows of all its sessions back to back, next to a JSON index with the offset, length, start timestamp and
+    invalid data indices of every session. Reading opens the file with `np.memmap`, so only the pages that are
+    actually used are loaded into memory.
+
+    Args:
+        directory (str): Directory the measurement files are stored in, created when it does not exist.
+    """
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _data_path(self, measurement_id: str):
+        return os.path.join(self.directory, f"{measurement_id}.f32")
+
+    def _index_path(self, measurement_id: str):
+        return os.path.join(self.directory, f"{measurement_id}.json")
+
+    def has(self, measurement_id: str):
+        return os.path.exists(self._index_path(measurement_id))
+
+    def export_measurement(self, conn, measurement_id: str):
+        """
+        Writes all sessions of a measurement from the database to the store, one session at a time.
+
+        Args:
+            conn (Connection): The database connection to read the sessions with.
+            measurement_id (str): The ID of the measurement to export.
+
+        Returns:
+            dict: The index of the exported measurement.
+        """
+        conn.cursor.execute(
+            "SELECT ms.id, ms.start_timestamp, ms.invalid_data_indices, m.sample_rate "
+            "FROM measure_session ms JOIN measurement m ON m.id = ms.measurement_id "
+            "WHERE ms.measurement_id = %s ORDER BY ms.start_timestamp",
+            (measurement_id,),
+        )
+        sessions = conn.cursor.fetchall()
+
+        index = {"measurement_id": measurement_id, "sample_rate": None, "columns": 1, "sessions": []}
+        offset = 0
+        temporary_path = self._data_path(measurement_id) + ".tmp"
+        with open(temporary_path, "wb") as file:
+            for session_id, start_timestamp, invalid_indices, sample_rate in sessions:
+                data = conn.get_data_from_measure_session(session_id, return_numpy=True)
+                if data is None or data.size == 0:
+                    continue
+                data = data.reshape(len(data), -1).astype(STORE_DTYPE)
+                file.write(data.tobytes())
+
+                index["sample_rate"] = sample_rate
+                index["columns"] = data.shape[1]
+                index["sessions"].append({
+                    "session_id": session_id,
+                    "start_timestamp": start_timestamp.isoformat(),
+                    "offset": offset,
+                    "length": len(data),
+                    "invalid_data_indices": invalid_indices or [],
+                })
+                offset += len(data)
+
+        # Replace the data and then the index, readers only trust files that have an index
+        os.replace(temporary_path, self._data_path(measurement_id))
+        with open(self._index_path(measurement_id) + ".tmp", "w") as file:
+            json.dump(index, file)
+        os.replace(self._index_path(measurement_id) + ".tmp", self._index_path(measurement_id))
+        return index
+
+    def index(self, measurement_id: str):
+        with open(self._index_path(measurement_id)) as file:
+            return json.load(file)
+
+    def open(self, measurement_id: str):
+        """
+        Memory-maps all rows of a measurement.
+
+        Returns:
+            np.memmap: A read-only array of shape (rows,) for single-column measurements and (rows, columns)
+                otherwise, e.g. IBI.
+        """
+        index = self.index(measurement_id)
+        rows = sum(session["length"] for session in index["sessions"])
+        if rows == 0:
+            return np.empty(0, dtype=STORE_DTYPE)
+
+        shape = (rows,) if index["columns"] == 1 else (rows, index["columns"])
+        return np.memmap(self._data_path(measurement_id), dtype=STORE_DTYPE, mode="r", shape=shape)
+
+    def sessions(self, measurement_id: str):
+        """
+        Yields the start timestamp and a view on the rows of every session of a measurement.
+        """
+        data = self.open(measurement_id)
+        for session in self.index(measurement_id)["sessions"]:
+            yield (datetime.fromisoformat(session["start_timestamp"]),
+                   data[session["offset"]:session["offset"] + session["length"]])
+
+    def valid_segments(self, measurement_id: str):
+        """
+        Yields views on the valid parts of every session of a measurement, in the order they were recorded.
+
+        The segments are split with ValidityMask, like the valid segments read from the database.
+        """
+        data = self.open(measurement_id)
+        for session in self.index(measurement_id)["sessions"]:
+            start, length = session["offset"], session["length"]
+            mask = ValidityMask.from_invalid_indices(session["invalid_data_indices"], length)
+            yield from mask.split(data[start:start + length])
+
+    def valid_data(self, measurement_id: str):
+        """
+        Concatenates the valid parts of all sessions of a measurement into one float32 array.
+
+        Returns the memory-mapped file itself when no session has invalid data, so nothing is copied.
+        """
+        index = self.index(measurement_id)
+        if not any(session["invalid_data_indices"] for session in index["sessions"]):
+            return self.open(measurement_id)
+
+        segments = list(self.valid_segments(measurement_id))
+        if not segments:
+            return np.empty(0, dtype=STORE_DTYPE)
+        return np.concatenate(segments)
@@ -0,0 +1,189 @@
+import numpy as np
+
+# Items kept per level of the quantile sketch, the rank error is in the order of 1 / SKETCH_SIZE
+SKETCH_SIZE = 2048
+
+# Windows up to this length are stacked and partitioned together, longer ones are faster one at a time
+STACK_LENGTH = 4096
+
+# The statistics of the stats scripts, in the order of their columns
+STAT_NAMES = ("std", "mean", "median", "min", "max", "range", "var", "1q", "3q", "iqr")
+
+
+def describe_many(arrays, prefix: str = None):
+    """
+    Computes the standard statistics of many windows of data at once.
+
+    Windows of the same length are stacked and partitioned together with one np.partition along the rows, around
+    the ranks of their extremes and quartiles, so the quartiles, median and extremes are read from the partitioned
+    values without sorting. Windows longer than STACK_LENGTH are partitioned one at a time, stacking them copies
+    more than it saves, and a single partition over all windows concatenated needs a sort and is slower than
+    either. The results equal np.std, np.var, np.median and np.percentile per window, NaN in a window makes all
+    its statistics NaN like it does in NumPy, and empty windows get NaN.
+
+    Args:
+        arrays (list): The windows, arrays or lists of any shape, they are flattened.
+        prefix (str): Prepended to the names of the columns as "{prefix}_{name}", e.g. "HR".
+
+    Returns:
+        dict: One array per name in STAT_NAMES, holding the statistic of every window in the order of `arrays`.
+    """
+    arrays = [np.asarray(array, dtype=np.float64).ravel() for array in arrays]
+    lengths = np.array([len(array) for array in arrays], dtype=np.int64)
+    columns = {name: np.full(len(arrays), np.nan) for name in STAT_NAMES}
+
+    for n in np.unique(lengths[lengths > 0]):
+        windows = np.flatnonzero(lengths == n)
+        for rows in [windows] if n <= STACK_LENGTH else windows[:, None]:
+            values = np.stack([arrays[row] for row in rows])
+
+            # Linear interpolation between the closest ranks, like np.percentile
+            positions = np.array([0.25, 0.5, 0.75]) * (n - 1)
+            lower = np.floor(positions).astype(np.int64)
+            upper = np.minimum(lower + 1, n - 1)
+            fraction = positions - lower
+            values = np.partition(values, np.unique(np.concatenate(([0, n - 1], lower, upper))), axis=1)
+            minimum, maximum = values[:, 0], values[:, n - 1]
+            low, high = values[:, lower], values[:, upper]
+            first, median, third = (low + (high - low) * fraction).T
+
+            mean = values.mean(axis=1)
+            var = np.square(values - mean[:, None]).mean(axis=1)
+            # np.partition moves NaN to the end, so the maximum is NaN when a window holds any
+            missing = np.isnan(maximum)
+            for name, column in (("std", np.sqrt(var)), ("mean", mean), ("median", median), ("min", minimum),
+                                 ("max", maximum), ("range", maximum - minimum), ("var", var), ("1q", first),
+                                 ("3q", third), ("iqr", third - first)):
+                columns[name][rows] = np.where(missing, np.nan, column)
+
+    if prefix is None:
+        return columns
+    return {f"{prefix}_{name}": column for name, column in columns.items()}
+
+
+class StreamingStats:
+    """
+    Accumulates descriptive statistics of a stream of batches in constant memory.
+
+    The count, mean and variance are combined per batch with Welford's update in the pairwise form of Chan et al.,
+    so they are exact. Quantiles come from a mergeable KLL-style sketch: levels of at most `sketch_size` items,
+    where an item of level h stands for 2 ** h samples and a full level is sorted and every other item is promoted.
+    They are exact until more than `sketch_size` samples were added. Two accumulators, for example from different
+    worker processes, are combined with `merge`.
+
+    Args:
+        sketch_size (int): Items kept per level of the quantile sketch.
+        seed (int): Seed of the offsets picked when compacting, fixed so reruns give the same quantiles.
+    """
+    def __init__(self, sketch_size: int = SKETCH_SIZE, seed: int = 0):
+        self.sketch_size = sketch_size
+        self.count = 0
+        self.mean = np.nan
+        self.m2 = 0.0
+        self.min = np.nan
+        self.max = np.nan
+        self.levels = [np.empty(0)]
+        self._rng = np.random.default_rng(seed)
+
+    def update(self, values):
+        """
+        Adds a batch of samples, NaNs included as they would be by np.mean.
+
+        Returns:
+            StreamingStats: This accumulator.
+        """
+        values = np.asarray(values, dtype=np.float64).ravel()
+        if not len(values):
+            return self
+        mean = values.mean()
+        self._combine(len(values), mean, np.square(values - mean).sum(), values.min(), values.max())
+        self._add(0, values)
+        return self
+
+    def merge(self, other: "StreamingStats"):
+        """
+        Adds the samples accumulated by another StreamingStats.
+
+        Returns:
+            StreamingStats: This accumulator.
+        """
+        if not other.count:
+            return self
+        self._combine(other.count, other.mean, other.m2, other.min, other.max)
+        for level, items in enumerate(other.levels):
+            self._add(level, items)
+        return self
+
+    @property
+    def var(self):
+        """
+        The population variance, like np.var.
+        """
+        return self.m2 / self.count if self.count else np.nan
+
+    @property
+    def std(self):
+        return np.sqrt(self.var)
+
+    def quantile(self, q):
+        """
+        Estimates the quantiles `q` in [0, 1], interpolated like np.quantile while the sketch is exact.
+        """
+        if not self.count:
+            return np.full(np.shape(q), np.nan)[()]
+        if len(self.levels) == 1:
+            return np.quantile(self.levels[0], q)
+
+        items = np.concatenate(self.levels)
+        weights = np.concatenate([np.full(len(level), 2.0 ** h) for h, level in enumerate(self.levels)])
+        order = np.argsort(items, kind="stable")
+        items, weights = items[order], weights[order]
+        # Every item covers its weight of ranks, it is placed at the middle of them
+        ranks = np.cumsum(weights) - weights / 2
+        return np.interp(np.asarray(q, dtype=np.float64) * ranks[-1], ranks, items)
+
+    def describe(self):
+        """
+        Returns the statistics in STAT_NAMES as a dict, like `describe_many` returns them for one window.
+        """
+        first, median, third = self.quantile([0.25, 0.5, 0.75]) if self.count else (np.nan,) * 3
+        return {
+            "std": self.std,
+            "mean": self.mean,
+            "median": median,
+            "min": self.min,
+            "max": self.max,
+            "range": self.max - self.min,
+            "var": self.var,
+            "1q": first,
+            "3q": third,
+            "iqr": third - first,
+        }
+
+    def _combine(self, count, mean, m2, minimum, maximum):
+        if not self.count:
+            self.count, self.mean, self.m2, self.min, self.max = count, mean, m2, minimum, maximum
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+        self.min = min(self.min, minimum)
+        self.max = max(self.max, maximum)
+
+    def _add(self, level, items):
+        while len(self.levels) <= level:
+            self.levels.append(np.empty(0))
+        self.levels[level] = np.concatenate((self.levels[level], items))
+        # Full levels are halved into the next one until every level fits again
+        while len(self.levels[level]) > self.sketch_size:
+            items = np.sort(self.levels[level])
+            # An odd item out stays behind, so the represented number of samples does not change
+            keep = len(items) % 2
+            promoted = items[keep + self._rng.integers(2)::2]
+            self.levels[level] = items[:keep]
+            level += 1
+            if len(self.levels) <= level:
+                self.levels.append(np.empty(0))
+            self.levels[level] = np.concatenate((self.levels[level], promoted))
@@ -0,0 +1,132 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+
+
+class ValidityMask:
+    """
+    Marks which rows of a measure session hold valid data.
+
+    A mask converts between the `invalid_data_indices` stored in the database, inclusive [start, end] row ranges
+    where [0, -1] marks the whole session as invalid, and a boolean array with one entry per row. Masks of the
+    same length combine with `&`, `|` and `~`; masks of channels with different sample rates are first brought
+    to the same length with `resample`.
+
+    Args:
+        valid (np.ndarray): Boolean array that is True for every valid row.
+    """
+    def __init__(self, valid):
+        self.valid = np.asarray(valid, dtype=bool)
+
+    @classmethod
+    def from_invalid_indices(cls, invalid_indices, length: int):
+        """
+        Creates a mask from the `invalid_data_indices` of a session with `length` rows.
+        """
+        if not invalid_indices:
+            return cls(np.ones(length, dtype=bool))
+
+        ranges = np.asarray(invalid_indices, dtype=np.int64).reshape(-1, 2)
+        starts = np.clip(ranges[:, 0], 0, length)
+        # An end of -1 runs to the end of the session
+        ends = np.where(ranges[:, 1] == -1, length - 1, np.minimum(ranges[:, 1], length - 1)) + 1
+        keep = starts < ends
+
+        # Mark the range boundaries and count how many ranges cover every row
+        boundaries = np.zeros(length + 1, dtype=np.int64)
+        np.add.at(boundaries, starts[keep], 1)
+        np.add.at(boundaries, ends[keep], -1)
+        return cls(np.cumsum(boundaries[:-1]) == 0)
+
+    @classmethod
+    def all_valid(cls, length: int):
+        return cls(np.ones(length, dtype=bool))
+
+    def __len__(self):
+        return len(self.valid)
+
+    def _check_length(self, other):
+        if len(self) != len(other):
+            raise ValueError(f"Cannot combine masks of {len(self)} and {len(other)} rows, resample one first.")
+
+    def __and__(self, other):
+        self._check_length(other)
+        return ValidityMask(self.valid & other.valid)
+
+    def __or__(self, other):
+        self._check_length(other)
+        return ValidityMask(self.valid | other.valid)
+
+    def __invert__(self):
+        return ValidityMask(~self.valid)
+
+    def resample(self, length: int):
+        """
+        Maps the mask onto a channel of the same session with `length` rows, e.g. from 32 Hz ACC to 64 Hz BVP.
+        """
+        if len(self) == 0:
+            return ValidityMask(np.zeros(length, dtype=bool))
+        positions = np.arange(length, dtype=np.int64) * len(self) // max(length, 1)
+        return ValidityMask(self.valid[positions])
+
+    def segments(self):
+        """
+        Returns the runs of valid rows.
+
+        Returns:
+            np.ndarray: Array of shape (segments, 2) with the half-open [start, stop) row range of every run.
+        """
+        edges = np.diff(np.concatenate(([0], self.valid.view(np.int8), [0])))
+        return np.column_stack((np.flatnonzero(edges == 1), np.flatnonzero(edges == -1)))
+
+    def to_invalid_indices(self):
+        """
+        Converts the mask back to `invalid_data_indices`, inclusive [start, end] ranges of invalid rows.
+        """
+        if len(self) and not self.valid.any():
+            return [[0, -1]]
+        return [[int(start), int(stop) - 1] for start, stop in (~self).segments()]
+
+    @property
+    def valid_count(self):
+        return int(np.count_nonzero(self.valid))
+
+    @property
+    def valid_fraction(self):
+        return self.valid_count / len(self) if len(self) else 0.0
+
+    @property
+    def invalid_fraction(self):
+        return 1.0 - self.valid_fraction if len(self) else 0.0
+
+    def split(self, data):
+        """
+        Splits the rows of `data` into its valid segments. Slicing an ndarray returns views, so nothing is copied.
+        """
+        return [data[start:stop] for start, stop in self.segments()]
+
+    def segment_timestamps(self, start_timestamp: datetime, sample_rate: float = None, offsets=None):
+        """
+        Calculates the start and end timestamp of every valid segment.
+
+        Sampled channels use the sample rate, the end of a segment is the moment after its last sample. IBI
+        sessions pass the beat offsets in seconds instead, the end of a segment is then its last beat.
+
+        Returns:
+            list: A list of (start_timestamp, end_timestamp) tuples.
+        """
+        segments = self.segments()
+        if offsets is not None:
+            offsets = np.asarray(offsets, dtype=np.float64).ravel()
+            starts, ends = offsets[segments[:, 0]], offsets[segments[:, 1] - 1]
+        else:
+            starts, ends = segments[:, 0] / sample_rate, segments[:, 1] / sample_rate
+        return [(start_timestamp + timedelta(seconds=float(start)), start_timestamp + timedelta(seconds=float(end)))
+                for start, end in zip(starts, ends)]
+
+    def valid_segments(self, data, start_timestamp: datetime, sample_rate: float = None, offsets=None):
+        """
+        Returns the valid segments of `data` keyed by the timestamp at which they start.
+        """
+        timestamps = self.segment_timestamps(start_timestamp, sample_rate, offsets)
+        return {start: segment for (start, _), segment in zip(timestamps, self.split(data))}